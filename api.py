@@ -0,0 +1,272 @@
+"""
+Headless HTTP API for MedAssist.
+
+Serves the same retrieval and generation pipeline as the Streamlit app as a plain
+ASGI application, for integrations that need to call the assistant directly:
+
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Endpoints:
+    GET  /healthz          Service status
+    GET  /metrics          Per-stage latency, size and cache metrics in Prometheus text format
+    POST /v1/chat          {"query": "..."} -> JSON response with the answer and context titles
+    POST /v1/chat/stream   {"query": "..."} -> Server-Sent Events stream of response chunks
+
+Both chat endpoints take optional metadata filters for retrieval, e.g.
+{"query": "...", "filters": {"product": "Biofina Sleep Aid", "section_type": ["product"]}}.
+
+Each worker process shares one model registry, response cache and vector store
+between all of its requests; set MEDASSIST_CACHE_PATH to also share the response
+cache between workers. Metrics are also per worker process, so a scrape sees the
+worker that answered it.
+"""
+import os
+import json
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from utils.gemini_utils import get_genai, init_gemini, is_gemini_configured
+from utils.metrics_utils import CONTENT_TYPE, render_metrics
+from utils.pipeline_utils import MedAssistPipeline
+
+# Load environment variables
+load_dotenv()
+
+# Concurrency limits, overridable through environment variables
+DEFAULT_CONCURRENCY = 32
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_QUEUE_TIMEOUT = 30.0
+MAX_BODY_SIZE = 64 * 1024
+
+
+class ServiceUnavailable(Exception):
+    """Raised when a request can't be admitted because the service is at capacity."""
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded wait queue.
+
+    At most `concurrency` requests run at once; up to `queue_size` more wait for a
+    slot for at most `queue_timeout` seconds. Anything beyond that is rejected
+    immediately, so overload turns into fast 503s instead of unbounded latency.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int, queue_timeout: float):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        if self.active + self.waiting >= self.concurrency + self.queue_size:
+            raise ServiceUnavailable("Request queue is full")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ServiceUnavailable("Timed out waiting in the request queue")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self._semaphore.release()
+
+
+def summarize_docs(relevant_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reduce context documents to the fields returned to API clients.
+
+    Args:
+        relevant_docs: Products and passages used as context
+
+    Returns:
+        List of dictionaries with title, type and, for products, links
+    """
+    summary = []
+    for doc in relevant_docs:
+        if "content" in doc:
+            summary.append({"type": "passage", "title": doc["title"], "source": doc.get("source", "")})
+        else:
+            summary.append({
+                "type": "product",
+                "title": doc["title"],
+                "image_url": doc.get("image_url"),
+                "buy_link": doc.get("buy_link"),
+            })
+    return summary
+
+
+class MedAssistAPI:
+    """
+    ASGI application exposing MedAssistPipeline over HTTP.
+    """
+
+    def __init__(self, pipeline: Optional[MedAssistPipeline] = None):
+        self.pipeline = pipeline
+        self.admission: Optional[AdmissionController] = None
+
+    async def startup(self) -> None:
+        """Set up Gemini, load the vector store and create the pipeline and admission controller."""
+        if init_gemini():
+            # Import the Gemini client now, off the event loop, rather than in the first request
+            await asyncio.to_thread(get_genai)
+        if self.pipeline is None:
+            vector_store = None
+            try:
+                from utils.rag_utils import get_vector_store
+                vector_store = await asyncio.to_thread(get_vector_store)
+            except Exception as e:
+                print(f"Error loading vector store: {e}")
+            self.pipeline = MedAssistPipeline(vector_store=vector_store)
+
+        self.admission = AdmissionController(
+            concurrency=int(os.getenv("MEDASSIST_API_CONCURRENCY", DEFAULT_CONCURRENCY)),
+            queue_size=int(os.getenv("MEDASSIST_API_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+            queue_timeout=float(os.getenv("MEDASSIST_API_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT)),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if self.admission is None:
+            await self.startup()
+
+        method, path = scope["method"], scope["path"]
+        if path == "/healthz" and method == "GET":
+            await self._send_json(send, 200, {
+                "status": "ok",
+                "gemini_configured": is_gemini_configured(),
+                "active_requests": self.admission.active,
+                "queued_requests": self.admission.waiting,
+            })
+        elif path == "/metrics" and method == "GET":
+            body = render_metrics().encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", CONTENT_TYPE.encode("ascii")),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+        elif path in ("/v1/chat", "/v1/chat/stream"):
+            if method != "POST":
+                await self._send_json(send, 405, {"error": "Method not allowed"})
+                return
+            request, error = await self._read_request(receive)
+            if error is not None:
+                await self._send_json(send, 400, {"error": error})
+                return
+            try:
+                async with self.admission:
+                    if path == "/v1/chat":
+                        await self._chat(send, request["query"], request["filters"])
+                    else:
+                        await self._chat_stream(send, request["query"], request["filters"])
+            except ServiceUnavailable as e:
+                await self._send_json(send, 503, {"error": str(e)}, headers=[(b"retry-after", b"1")])
+        else:
+            await self._send_json(send, 404, {"error": "Not found"})
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _read_request(self, receive) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Read and validate the JSON request body.
+
+        Returns:
+            tuple: ({"query": ..., "filters": ...}, None) on success, or (None, error message)
+        """
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_SIZE:
+                return None, "Request body too large"
+            if not message.get("more_body"):
+                break
+
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return None, "Request body must be JSON"
+        query = payload.get("query") if isinstance(payload, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            return None, "Field 'query' must be a non-empty string"
+        filters = payload.get("filters")
+        if filters is not None and not (
+            isinstance(filters, dict) and all(
+                isinstance(value, str) or (isinstance(value, list) and all(isinstance(v, str) for v in value))
+                for value in filters.values()
+            )
+        ):
+            return None, "Field 'filters' must map metadata keys to a string or a list of strings"
+        return {"query": query.strip(), "filters": filters or None}, None
+
+    async def _chat(self, send, query: str, filters: Optional[Dict[str, Any]] = None) -> None:
+        result = await self.pipeline.run(query, filters=filters)
+        await self._send_json(send, 200, {
+            "response": result["response"],
+            "relevant_docs": summarize_docs(result["relevant_docs"]),
+            "timings": result["timings"],
+        })
+
+    async def _chat_stream(self, send, query: str, filters: Optional[Dict[str, Any]] = None) -> None:
+        relevant_docs = await self.pipeline.retrieve(query, filters)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await self._send_event(send, "context", {"relevant_docs": summarize_docs(relevant_docs)})
+        async for chunk in self.pipeline.stream(query, relevant_docs):
+            await self._send_event(send, "message", {"text": chunk})
+        await self._send_event(send, "done", {}, more_body=False)
+
+    @staticmethod
+    async def _send_event(send, event: str, data: Dict[str, Any], more_body: bool = True) -> None:
+        payload = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+        await send({"type": "http.response.body", "body": payload, "more_body": more_body})
+
+    @staticmethod
+    async def _send_json(send, status: int, data: Dict[str, Any], headers: Optional[list] = None) -> None:
+        body = json.dumps(data).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ] + (headers or []),
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+app = MedAssistAPI()
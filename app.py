@@ -1,14 +1,12 @@
 import streamlit as st
 import os
-import requests
-import json
+import re
+import threading
 from dotenv import load_dotenv
-from utils.gemini_utils import is_gemini_configured, generate_gemini_response
-
-# Load environment variables
-load_dotenv()
-
-# Load environment variables for Gemini API
+from utils.gemini_utils import get_genai, init_gemini, is_gemini_configured
+from utils.pipeline_utils import MedAssistPipeline
+from utils.memory_utils import ConversationMemory
+from utils.metrics_utils import span, start_metrics_server
 
 # Page configuration - must be the first Streamlit command
 st.set_page_config(
@@ -20,10 +18,32 @@ st.set_page_config(
 
 # No HuggingFace API token check needed as we're using Gemini API
 
+# One-time process setup; every rerun executes this script, but the setup runs once
+@st.cache_resource(show_spinner=False)
+def init_app():
+    """
+    Load the .env file, set up Gemini and start the metrics server, once per server process.
+    
+    The Gemini client library is imported in the background, so the first page
+    renders without waiting for it and the first question usually doesn't either.
+    """
+    load_dotenv()
+    if init_gemini():
+        threading.Thread(target=get_genai, name="gemini-import", daemon=True).start()
+    # Serve Prometheus metrics on MEDASSIST_METRICS_PORT
+    if os.getenv("MEDASSIST_METRICS_PORT"):
+        start_metrics_server(int(os.environ["MEDASSIST_METRICS_PORT"]))
+
+init_app()
+
 # Initialize theme in session state
 if "theme" not in st.session_state:
     st.session_state.theme = "light"
 
+# Conversation memory sent to the model with each follow-up question
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+
 # Custom CSS with dark mode support
 def get_css():
     if st.session_state.theme == "dark":
@@ -175,157 +195,93 @@ def get_css():
         </style>
         """
 
+# Cached by Streamlit rather than lru_cache: app.py runs again on every rerun, which
+# would wrap a new function with an empty cache each time
+@st.cache_data(show_spinner=False)
+def minify_css(css):
+    """
+    Strip comments and whitespace from a style block.
+    
+    Streamlit removes any element a rerun doesn't emit again, so the style block
+    has to be sent on every rerun; it is minified once per theme and reused.
+    
+    Args:
+        css: Style block
+        
+    Returns:
+        Minified style block
+    """
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
+
 # Apply the CSS based on current theme
-st.markdown(get_css(), unsafe_allow_html=True)
+st.markdown(minify_css(get_css()), unsafe_allow_html=True)
 
 # Initialize session state for chat history and theme preference
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Function to identify relevant medication information based on query
-def find_relevant_info(query, top_k=2):
+# Number of earlier pages of chat history the user has opened
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 0
+
+# Messages shown on every rerun; older ones are loaded a page at a time on request,
+# so each rerun renders a bounded number of messages however long the chat gets
+HISTORY_WINDOW = 20
+HISTORY_PAGE_SIZE = 20
+
+# Load the knowledge base index once per process, shared by all sessions and reruns
+@st.cache_resource(show_spinner="Loading knowledge base...")
+def get_shared_vector_store():
     """
-    Identify relevant medication information based on the user's query.
-    This function analyzes the query to determine which Biofina medications might be relevant.
+    Get the document vector store shared by every session of this server process.
     
-    Args:
-        query: User's question
-        top_k: Maximum number of relevant medications to return
-        
     Returns:
-        List of relevant medication information dictionaries
+        FAISS vector store, or None if the knowledge base could not be loaded
     """
-    # Convert query to lowercase for case-insensitive matching
-    query_lower = query.lower()
-    
-    # Define medication information with structured data
-    medications = [
-        {
-            "title": "Biofina Pain Relief",
-            "keywords": ["pain", "relief", "headache", "muscle", "ache", "fever", "acetaminophen"],
-            "image_url": "https://img.freepik.com/free-vector/realistic-white-bottle-mock-up-pills_1017-17273.jpg",
-            "buy_link": "https://example.com/buy/pain-relief"
-        },
-        {
-            "title": "Biofina Allergy Relief",
-            "keywords": ["allergy", "allergies", "sneezing", "runny nose", "itchy", "eyes", "loratadine", "antihistamine", "non-drowsy"],
-            "image_url": "https://img.freepik.com/free-vector/realistic-white-bottle-mock-up-pills_1017-17273.jpg",
-            "buy_link": "https://example.com/buy/allergy-relief"
-        },
-        {
-            "title": "Biofina Cold & Flu",
-            "keywords": ["cold", "flu", "cough", "congestion", "fever", "sore throat", "dextromethorphan", "phenylephrine"],
-            "image_url": "https://img.freepik.com/free-vector/realistic-white-bottle-mock-up-pills_1017-17273.jpg",
-            "buy_link": "https://example.com/buy/cold-flu"
-        },
-        {
-            "title": "Biofina Digestive Health",
-            "keywords": ["digestive", "stomach", "bloating", "gas", "bowel", "probiotic", "gut", "digestion"],
-            "image_url": "https://img.freepik.com/free-vector/realistic-white-bottle-mock-up-pills_1017-17273.jpg",
-            "buy_link": "https://example.com/buy/digestive-health"
-        },
-        {
-            "title": "Biofina Sleep Aid",
-            "keywords": ["sleep", "insomnia", "melatonin", "valerian", "chamomile", "rest", "drowsy", "dreams"],
-            "image_url": "https://img.freepik.com/free-vector/realistic-white-bottle-mock-up-pills_1017-17273.jpg",
-            "buy_link": "https://example.com/buy/sleep-aid"
-        }
-    ]
-    
-    # Score each medication based on keyword matches
-    scored_meds = []
-    for med in medications:
-        score = 0
-        title_lower = med["title"].lower()
-        
-        # Check for exact medication name match (highest priority)
-        if med["title"].lower() in query_lower:
-            score += 10
-        
-        # Check for partial medication name match
-        title_words = title_lower.split()
-        for word in title_words:
-            if len(word) > 3 and word in query_lower:
-                score += 5
-        
-        # Check for keyword matches
-        for keyword in med["keywords"]:
-            if keyword.lower() in query_lower:
-                score += 3
-        
-        # General word matching with length check to avoid short common words
-        for word in query_lower.split():
-            if len(word) > 3:
-                # Full word match with keywords
-                if any(word in keyword.lower() for keyword in med["keywords"]):
-                    score += 2
-                # Partial word match for possible misspellings
-                elif any(word[:4] in keyword.lower() for keyword in med["keywords"] if len(keyword) > 4):
-                    score += 1
-        
-        scored_meds.append((med, score))
-    
-    # Sort by score (descending) and take top_k
-    scored_meds.sort(key=lambda x: x[1], reverse=True)
-    return [med for med, score in scored_meds[:top_k] if score > 0]
+    try:
+        # Imported here so the page renders without loading langchain and FAISS first
+        from utils.rag_utils import get_vector_store
+        return get_vector_store()
+    except Exception as e:
+        print(f"Error loading vector store: {e}")
+        return None
 
-# Function to generate response
-def generate_response(query, relevant_docs):
+# Request pipeline shared by all sessions, using the shared vector store
+@st.cache_resource(show_spinner=False)
+def get_pipeline():
     """
-    Generate a response based on the query and relevant documents.
-    Uses Gemini API when available, with a simple fallback for when Gemini is not configured.
+    Get the async request pipeline shared by every session of this server process.
     
-    Args:
-        query: User's question
-        relevant_docs: List of relevant documents
-        
     Returns:
-        Generated response
+        MedAssistPipeline instance
     """
-    # Try to use Gemini API if configured
-    if is_gemini_configured():
-        try:
-            # Generate response using Gemini
-            return generate_gemini_response(query, relevant_docs=relevant_docs)
-        except Exception as e:
-            st.error(f"Error using Gemini API: {str(e)}. Falling back to simple response.")
-            # Fall back to simple response if Gemini fails
-    
-    # Simple fallback approach when Gemini is not available
-    # Check if we have any relevant documents
-    if not relevant_docs:
-        return (
-            "I'm sorry, I don't have specific information about that in our Biofina product database. "
-            "Biofina Pharmaceuticals offers medications for pain relief, allergies, cold & flu, "
-            "digestive health, and sleep aid. If you're looking for information about these categories, "
-            "please let me know. For all medical concerns, please consult with a healthcare professional."
-        )
-    
-    # Extract medication names from the relevant docs
-    medications = [doc["title"] for doc in relevant_docs]
-    medication_list = ", ".join(medications)
-    
-    # Create a simple response with the relevant medications
-    response = f"Based on your query, these medications might be helpful: {medication_list}\n\n"
-    
-    # Add information about each relevant medication
-    for doc in relevant_docs:
-        response += f"**{doc['title']}**\n\n"
-        
-        # Add image if available
-        if 'image_url' in doc and doc['image_url']:
-            response += f"<img src='{doc['image_url']}' width='200'/>\n\n"
-        
-        # Add buy link if available
-        if 'buy_link' in doc and doc['buy_link']:
-            response += f"<a href='{doc['buy_link']}' target='_blank'><button style='color: white; background-color: #4CAF50; padding: 10px 20px; border: none; border-radius: 4px; cursor: pointer;'>Buy Now</button></a>\n\n"
-    
-    response += "Remember to consult with a healthcare professional before starting any new medication."
-    
-    return response
+    return MedAssistPipeline(vector_store=get_shared_vector_store())
 
 # This function has been removed as we now rely on Gemini for more advanced matching
 
+def render_chat_history():
+    """
+    Render the recent chat messages, with controls to page through older ones.
+    """
+    messages = st.session_state.messages
+    shown = HISTORY_WINDOW + st.session_state.history_pages * HISTORY_PAGE_SIZE
+    hidden = max(0, len(messages) - shown)
+    
+    if hidden:
+        if st.button(f"⬆️ Show earlier messages ({hidden} hidden)", use_container_width=True):
+            st.session_state.history_pages += 1
+            st.rerun()
+    elif st.session_state.history_pages:
+        if st.button("⬇️ Hide earlier messages", use_container_width=True):
+            st.session_state.history_pages = 0
+            st.rerun()
+    
+    for message in messages[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
 # App header
 st.markdown('<h1 class="main-header">MedAssist</h1>', unsafe_allow_html=True)
 st.markdown('<p class="sub-header">Your AI Medical Assistant by Biofina Pharmaceuticals</p>', unsafe_allow_html=True)
@@ -403,6 +359,8 @@ with st.sidebar:
     st.markdown("### ⚙️ Chat Controls")
     if st.button("🗑️ Clear Chat History", use_container_width=True):
         st.session_state.messages = []
+        st.session_state.history_pages = 0
+        st.session_state.memory.clear()
         st.rerun()
     
     # About section
@@ -428,11 +386,8 @@ with st.sidebar:
 # Main chat container with enhanced styling
 main_container = st.container()
 with main_container:
-    # Display chat messages with animations
-    for i, message in enumerate(st.session_state.messages):
-        with st.chat_message(message["role"]):
-            # Add a slight delay effect between messages for visual appeal
-            st.markdown(message["content"])
+    # Display the recent chat messages
+    render_chat_history()
     
     # Chat input with enhanced UI
     if prompt := st.chat_input("Ask about symptoms or medications..."):
@@ -446,27 +401,28 @@ with main_container:
         # Display assistant response in chat message container
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
+            memory = st.session_state.memory
             with st.spinner("Thinking..."):
-                # Find relevant information based on the query
-                relevant_docs = find_relevant_info(prompt)
-                
-                # Generate response using Gemini or fallback
-                full_response = generate_response(prompt, relevant_docs)
-                
-                # Simulate stream of response with milliseconds delay for better UX
-                import time
-                response_chunks = []
-                for i in range(len(full_response) + 1):
-                    # Add a typing cursor effect
-                    current_response = full_response[:i] + "▌" if i < len(full_response) else full_response
-                    message_placeholder.markdown(current_response)
-                    
-                    # Adjust typing speed based on content length for more natural feel
-                    delay = 0.01 if i % 3 == 0 else 0.005
-                    time.sleep(delay)
+                # Find relevant products and knowledge base passages concurrently,
+                # for the follow-up rewritten as a standalone question
+                pipeline = get_pipeline()
+                relevant_docs = pipeline.retrieve_sync(memory.condense_question(prompt))
                 
-                # Add assistant response to chat history
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
+                # Start generating; the spinner stays up until the first chunk arrives
+                response_stream = pipeline.stream_sync(prompt, relevant_docs, history=memory.format_history())
+                full_response = next(response_stream, "")
+            
+            # Render the rest of the response as the model streams it, with a typing cursor
+            with span("render"):
+                message_placeholder.markdown(full_response + "▌")
+                for chunk in response_stream:
+                    full_response += chunk
+                    message_placeholder.markdown(full_response + "▌")
+                message_placeholder.markdown(full_response)
+            
+            # Add assistant response to chat history
+            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            memory.add_turn(prompt, full_response)
 
 # Disclaimer with enhanced styling
 st.markdown(
@@ -0,0 +1,263 @@
+"""
+Batch query runner for MedAssist.
+
+Streams a JSONL file of queries through retrieval and generation and writes one
+JSONL result per query as soon as it completes:
+
+    python batch.py queries.jsonl -o results.jsonl --concurrency 8
+
+Each input line is a JSON object with the query text (field "query" by default)
+and optionally an id (field "id"; the line number is used otherwise). Results
+already in the output file with status "ok" are skipped, so an interrupted run
+resumes where it stopped when started again with the same output file.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from utils.gemini_utils import DEFAULT_MODEL, init_gemini, is_gemini_configured, generate_gemini_response_async
+from utils.pipeline_utils import MedAssistPipeline, format_fallback_response
+from utils.rate_limit_utils import ServiceBusyError, get_rate_limiter
+
+# Load environment variables
+load_dotenv()
+
+# Retry settings for throttled or failed Gemini calls
+DEFAULT_MAX_RETRIES = 5
+
+
+def load_completed_ids(output_path: str) -> Set[str]:
+    """
+    Read the ids of queries already answered successfully in a previous run.
+
+    Args:
+        output_path: Path of the results file
+
+    Returns:
+        Set of completed query ids
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut off by the interruption; that query is simply redone
+                continue
+            if result.get("status") == "ok":
+                completed.add(str(result["id"]))
+    return completed
+
+
+def read_queries(input_path: str, query_field: str, id_field: str) -> Iterator[Tuple[str, str]]:
+    """
+    Stream (id, query) pairs from a JSONL file without loading it into memory.
+
+    Args:
+        input_path: Path of the queries file
+        query_field: Name of the field holding the query text
+        id_field: Name of the field holding the query id
+
+    Yields:
+        (id, query) pairs
+    """
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"Skipping line {line_number}: not valid JSON", file=sys.stderr)
+                continue
+            query = record.get(query_field)
+            if not isinstance(query, str) or not query.strip():
+                print(f"Skipping line {line_number}: no '{query_field}' field", file=sys.stderr)
+                continue
+            yield str(record.get(id_field, line_number)), query
+
+
+class BatchRunner:
+    """
+    Runs queries through the pipeline with a fixed number of requests in flight.
+
+    Gemini calls share the process-wide rate limiter, so when the quota is
+    exhausted all workers queue together instead of each one hammering the API on
+    its own schedule. While the circuit breaker is open, workers wait for it to
+    close rather than failing their queries.
+    """
+
+    def __init__(
+        self,
+        pipeline: MedAssistPipeline,
+        concurrency: int = 8,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        model_name: str = DEFAULT_MODEL
+    ):
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.model_name = model_name
+        self.stats = {"ok": 0, "error": 0, "skipped": 0, "retries": 0}
+
+    async def generate(self, query: str, relevant_docs) -> Tuple[str, int]:
+        """
+        Generate a response, waiting out a busy or unavailable Gemini API.
+
+        Transient API errors are retried with backoff inside the Gemini client
+        helpers; this only retries calls rejected before they were sent.
+
+        Args:
+            query: User's question
+            relevant_docs: Context documents
+
+        Returns:
+            tuple: (response text, number of attempts)
+        """
+        if not is_gemini_configured():
+            return format_fallback_response(relevant_docs), 1
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await asyncio.wait_for(
+                    generate_gemini_response_async(
+                        query,
+                        relevant_docs=relevant_docs,
+                        model_name=self.model_name,
+                        raise_errors=True,
+                        max_retries=self.max_retries
+                    ),
+                    self.pipeline.generation_timeout
+                )
+                return response, attempt
+            except ServiceBusyError as e:
+                if attempt > self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(e.retry_after)
+
+    async def process(self, query_id: str, query: str) -> Dict[str, Any]:
+        """
+        Answer one query.
+
+        Args:
+            query_id: Id of the query
+            query: Query text
+
+        Returns:
+            Result record for the output file
+        """
+        started = time.perf_counter()
+        relevant_docs = await self.pipeline.retrieve(query)
+        result: Dict[str, Any] = {
+            "id": query_id,
+            "query": query,
+            "relevant_docs": [doc["title"] for doc in relevant_docs],
+        }
+        try:
+            response, attempts = await self.generate(query, relevant_docs)
+            result.update(status="ok", response=response, attempts=attempts)
+        except Exception as e:
+            result.update(status="error", error=f"{type(e).__name__}: {e}")
+        result["latency"] = round(time.perf_counter() - started, 4)
+        return result
+
+    async def run(self, input_path: str, output_path: str, query_field: str = "query", id_field: str = "id") -> Dict[str, int]:
+        """
+        Process a queries file, appending results to the output file.
+
+        Args:
+            input_path: Path of the JSONL queries file
+            output_path: Path of the JSONL results file (also the resume checkpoint)
+            query_field: Name of the field holding the query text
+            id_field: Name of the field holding the query id
+
+        Returns:
+            Counts of successful, failed and skipped queries and of retries
+        """
+        completed = load_completed_ids(output_path)
+        limiter = get_rate_limiter()
+        api_retries = limiter.stats["retries"]
+        # Bounded queue: the input is read only as fast as workers take queries
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        with open(output_path, "a+", encoding="utf-8") as output:
+            # Terminate a line left incomplete by an interrupted run before appending
+            if output.tell() > 0:
+                output.seek(output.tell() - 1)
+                if output.read(1) != "\n":
+                    output.write("\n")
+
+            async def worker():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    result = await self.process(*item)
+                    self.stats[result["status"]] += 1
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            for query_id, query in read_queries(input_path, query_field, id_field):
+                if query_id in completed:
+                    self.stats["skipped"] += 1
+                    continue
+                await queue.put((query_id, query))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+        self.stats["retries"] += limiter.stats["retries"] - api_retries
+        return self.stats
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through MedAssist.")
+    parser.add_argument("input", help="JSONL file with one query object per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to append results to; also used to resume")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once (default: 8)")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES, help="Retries per query for transient errors")
+    parser.add_argument("--query-field", default="query", help="Input field holding the query text (default: query)")
+    parser.add_argument("--id-field", default="id", help="Input field holding the query id (default: id)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Gemini model name")
+    parser.add_argument("--no-retrieval", action="store_true", help="Skip knowledge base retrieval; keyword matching only")
+    args = parser.parse_args(argv)
+
+    if not init_gemini():
+        print("GEMINI_API_KEY is not set; answering with the matching product list only", file=sys.stderr)
+
+    vector_store = None
+    if not args.no_retrieval:
+        try:
+            from utils.rag_utils import get_vector_store
+            vector_store = get_vector_store()
+        except Exception as e:
+            print(f"Error loading vector store, continuing without retrieval: {e}", file=sys.stderr)
+
+    pipeline = MedAssistPipeline(vector_store=vector_store, model_name=args.model)
+    runner = BatchRunner(pipeline, concurrency=args.concurrency, max_retries=args.max_retries, model_name=args.model)
+
+    started = time.perf_counter()
+    stats = asyncio.run(runner.run(args.input, args.output, args.query_field, args.id_field))
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done in {elapsed:.1f}s: {stats['ok']} ok, {stats['error']} failed, "
+        f"{stats['skipped']} already done, {stats['retries']} retries",
+        file=sys.stderr
+    )
+    return 1 if stats["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
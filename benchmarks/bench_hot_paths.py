@@ -0,0 +1,327 @@
+"""
+Benchmarks for the MedAssist request hot path.
+
+Measures each stage a chat request goes through, with the product catalog and
+the knowledge base scaled from the 5 Biofina products up to 10k synthetic ones,
+and writes p50/p95/p99 latencies and throughput as JSON:
+
+    python -m benchmarks.bench_hot_paths -o bench.json
+    python -m benchmarks.bench_hot_paths --sizes 5,1000 --baseline bench.json
+
+Generation goes through a local fake of genai.GenerativeModel (see
+benchmarks/fake_gemini.py), embeddings use the offline hashing backend, and
+everything is written to a temporary directory, so runs need no API keys and
+leave the data directory alone. With --baseline, results are compared to an
+earlier run and the exit status is 1 if any p50 regressed beyond --max-regression.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+# Benchmarks measure the code, not the quota: no rate limiting and no response cache
+os.environ["MEDASSIST_GEMINI_RPM"] = "0"
+os.environ["MEDASSIST_GEMINI_TPM"] = "0"
+os.environ["MEDASSIST_CACHE_SIZE"] = "0"
+
+from benchmarks.fake_gemini import DEFAULT_CHUNK_LATENCY, DEFAULT_CHUNKS, DEFAULT_LATENCY, fake_gemini
+from utils import catalog_utils
+from utils.catalog_utils import DEFAULT_PRODUCTS, Catalog, CatalogStore, find_relevant_products
+from utils.data_utils import create_sample_data, get_medication_for_symptom
+from utils.hf_utils import BatchedEmbeddings, LocalHashingBackend
+from utils.pipeline_utils import MedAssistPipeline
+from utils.rag_utils import VectorIndexManager, get_relevant_documents
+
+DEFAULT_SIZES = "5,100,1000,10000"
+DEFAULT_ITERATIONS = 200
+DEFAULT_GENERATION_ITERATIONS = 30
+DEFAULT_BUILD_ITERATIONS = 3
+DEFAULT_MAX_REGRESSION = 1.2
+
+QUERIES = [
+    "I have a headache and a fever",
+    "What helps with seasonal allergies?",
+    "I can't sleep at night",
+    "My stomach feels bloated after meals",
+    "Is there something for a sore throat and cough?",
+    "What are the side effects of the sleep aid?",
+]
+SYMPTOMS = ["headache", "fever", "insomnia", "allergies", "cough", "bloating", "joint pain", "heartburn"]
+
+# Vocabulary of the synthetic products
+SYNTHETIC_INDICATIONS = [
+    "headache", "migraine", "fever", "muscle aches", "back pain", "joint pain", "arthritis", "cough",
+    "sore throat", "congestion", "runny nose", "sneezing", "itchy eyes", "hay fever", "heartburn",
+    "acid reflux", "bloating", "constipation", "diarrhea", "nausea", "motion sickness", "insomnia",
+    "jet lag", "anxiety", "fatigue", "dry skin", "eczema", "acne", "sunburn", "cold sores",
+    "toothache", "earache", "menstrual cramps", "leg cramps", "dizziness", "hiccups", "dandruff",
+]
+SYNTHETIC_INGREDIENTS = [
+    "acetaminophen", "ibuprofen", "naproxen", "loratadine", "cetirizine", "dextromethorphan",
+    "guaifenesin", "phenylephrine", "omeprazole", "famotidine", "simethicone", "loperamide",
+    "melatonin", "valerian root", "chamomile", "zinc", "vitamin c", "magnesium", "menthol", "aloe",
+]
+SYNTHETIC_FORMS = ["Tablets", "Capsules", "Syrup", "Gel", "Drops", "Spray", "Lozenges", "Patch"]
+SYNTHETIC_CONTRAINDICATIONS = ["pregnancy", "liver disease", "kidney disease", "high blood pressure", "asthma"]
+
+
+def make_products(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Build a catalog of `count` products: the default products, then synthetic ones.
+
+    Args:
+        count: Number of products
+        seed: Random seed, so every run benchmarks the same catalog
+
+    Returns:
+        List of product records
+    """
+    rng = random.Random(seed)
+    products = [dict(product) for product in DEFAULT_PRODUCTS[:count]]
+    for number in range(len(products), count):
+        indications = rng.sample(SYNTHETIC_INDICATIONS, 3)
+        ingredients = rng.sample(SYNTHETIC_INGREDIENTS, 2)
+        title = f"Biofina {indications[0].title()} {rng.choice(SYNTHETIC_FORMS)} {number}"
+        products.append({
+            "title": title,
+            "description": f"For {', '.join(indications)}.",
+            "active_ingredients": ingredients,
+            "indications": indications,
+            "contraindications": rng.sample(SYNTHETIC_CONTRAINDICATIONS, rng.randint(0, 2)),
+            "side_effects": ["nausea"] if rng.random() < 0.5 else ["drowsiness"],
+            "dosage": f"{rng.randint(1, 2)} doses every {rng.choice([4, 6, 8, 12])} hours",
+            "keywords": sorted({word for phrase in indications for word in phrase.split()} | set(ingredients)),
+            "image_url": "",
+            "buy_link": f"https://example.com/buy/product-{number}",
+        })
+    return products
+
+
+def use_catalog(path: str) -> None:
+    """Point the shared catalog store at another database."""
+    os.environ["MEDASSIST_CATALOG_PATH"] = path
+    catalog_utils.get_catalog_store.cache_clear()
+    catalog_utils._catalog = None
+
+
+def summarize(name: str, size: int, samples: List[float]) -> Dict[str, Any]:
+    """
+    Reduce latency samples to the reported statistics.
+
+    Args:
+        name: Benchmark name
+        size: Number of products in the catalog
+        samples: Latencies in seconds
+
+    Returns:
+        Result record with percentiles in milliseconds and throughput per second
+    """
+    latencies = np.asarray(samples, dtype=np.float64) * 1000
+    total = float(np.sum(samples))
+    return {
+        "name": name,
+        "size": size,
+        "iterations": len(samples),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+        "min_ms": float(latencies.min()),
+        "max_ms": float(latencies.max()),
+        "throughput_per_s": len(samples) / total if total > 0 else float("inf"),
+    }
+
+
+def measure(func: Callable[[int], Any], iterations: int, warmup: int = 1) -> List[float]:
+    """
+    Time repeated calls of a function.
+
+    Args:
+        func: Function taking the iteration number
+        iterations: Number of timed calls
+        warmup: Untimed calls made first, so one-off setup isn't measured
+
+    Returns:
+        Latency of each timed call in seconds
+    """
+    for iteration in range(warmup):
+        func(iteration)
+    samples = []
+    for iteration in range(iterations):
+        started = time.perf_counter()
+        func(iteration)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_size(size: int, args: argparse.Namespace, workdir: str) -> List[Dict[str, Any]]:
+    """
+    Run every benchmark against a catalog and knowledge base of one size.
+
+    Args:
+        size: Number of products
+        args: Command-line arguments
+        workdir: Empty directory for the catalog, documents and index
+
+    Returns:
+        Result records
+    """
+    results = []
+
+    def record(name, samples):
+        result = summarize(name, size, samples)
+        results.append(result)
+        print(
+            f"{name:<26} size={size:<6} p50={result['p50_ms']:9.3f}ms p95={result['p95_ms']:9.3f}ms "
+            f"p99={result['p99_ms']:9.3f}ms {result['throughput_per_s']:10.1f}/s",
+            file=sys.stderr
+        )
+
+    # Catalog: loading a snapshot, keyword product matching and symptom lookups
+    catalog_path = os.path.join(workdir, "catalog.db")
+    store = CatalogStore(catalog_path, seed_products=make_products(size))
+    use_catalog(catalog_path)
+    record("catalog_load", measure(lambda i: Catalog(*store.snapshot()), max(1, args.build_iterations * 3)))
+    record("find_relevant_products", measure(lambda i: find_relevant_products(QUERIES[i % len(QUERIES)]), args.iterations))
+    record("get_medication_for_symptom", measure(
+        lambda i: get_medication_for_symptom(SYMPTOMS[i % len(SYMPTOMS)]), args.iterations
+    ))
+
+    # Knowledge base: a full index build, then hybrid retrieval
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir)
+    create_sample_data(data_dir)
+    embeddings = BatchedEmbeddings(LocalHashingBackend())
+    stores = []
+
+    def build(i):
+        manager = VectorIndexManager(data_dir, os.path.join(workdir, f"vector_store_{i}"), embeddings=embeddings)
+        stores.append(manager.sync())
+
+    record("create_vector_store", measure(build, args.build_iterations, warmup=0))
+    vector_store = stores[-1]
+    record("get_relevant_documents", measure(
+        lambda i: get_relevant_documents(QUERIES[i % len(QUERIES)], vector_store, k=3), args.iterations
+    ))
+
+    # Full request through the pipeline the app and API use: retrieval then generation against the fake model
+    pipeline = MedAssistPipeline(vector_store=vector_store)
+    with fake_gemini(args.latency, args.chunk_latency, args.chunks):
+        record("pipeline_run", measure(
+            lambda i: pipeline.run_sync(QUERIES[i % len(QUERIES)]), args.generation_iterations
+        ))
+
+        first_chunk, complete = [], []
+        for i in range(args.generation_iterations + 1):
+            started = time.perf_counter()
+            chunks = pipeline.stream_sync(QUERIES[i % len(QUERIES)])
+            next(chunks)
+            first = time.perf_counter()
+            for _ in chunks:
+                pass
+            if i:
+                first_chunk.append(first - started)
+                complete.append(time.perf_counter() - started)
+        record("stream_first_chunk", first_chunk)
+        record("stream_response", complete)
+
+    store.close()
+    return results
+
+
+def get_git_revision() -> Dict[str, Any]:
+    """Get the commit the benchmarks ran on, and whether the tree had local changes."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=root, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, text=True).strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> List[str]:
+    """
+    Compare results with an earlier run.
+
+    Args:
+        results: Result records of this run
+        baseline_path: JSON file written by an earlier run
+        max_regression: Largest acceptable ratio of p50 latencies (this run / baseline)
+
+    Returns:
+        Descriptions of the benchmarks that regressed beyond max_regression
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(result["name"], result["size"]): result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["name"], result["size"]))
+        if previous is None or previous["p50_ms"] <= 0:
+            continue
+        ratio = result["p50_ms"] / previous["p50_ms"]
+        line = f"{result['name']:<26} size={result['size']:<6} p50 {previous['p50_ms']:9.3f}ms -> {result['p50_ms']:9.3f}ms ({ratio:5.2f}x)"
+        print(line, file=sys.stderr)
+        if ratio > max_regression:
+            regressions.append(line)
+    return regressions
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the MedAssist request hot path.")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated catalog sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Timed calls per lookup benchmark")
+    parser.add_argument("--generation-iterations", type=int, default=DEFAULT_GENERATION_ITERATIONS, help="Timed calls per generation benchmark")
+    parser.add_argument("--build-iterations", type=int, default=DEFAULT_BUILD_ITERATIONS, help="Timed index builds per size")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="Fake Gemini seconds to first chunk")
+    parser.add_argument("--chunk-latency", type=float, default=DEFAULT_CHUNK_LATENCY, help="Fake Gemini seconds between chunks")
+    parser.add_argument("--chunks", type=int, default=DEFAULT_CHUNKS, help="Fake Gemini chunks per response")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION, help="Acceptable p50 ratio against the baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix=f"medassist-bench-{size}-") as workdir:
+            results.extend(bench_size(size, args, workdir))
+
+    report = {
+        "meta": {
+            **get_git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.max_regression}x", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
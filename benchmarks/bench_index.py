@@ -0,0 +1,205 @@
+"""
+Recall-versus-latency report for the knowledge base index types.
+
+Builds every index type in utils/index_utils.py over the same vectors and
+measures, against exact search on the flat index:
+
+- recall@k (the share of the true k nearest rows that are returned)
+- single-query p50/p95 latency, unfiltered and with a metadata filter
+- build time and size on disk
+
+HNSW and IVF-PQ are also swept over their search breadth (efSearch, nprobe).
+
+    python -m benchmarks.bench_index -o index.json
+    python -m benchmarks.bench_index --count 1000000 --types flat,ivfpq,sq8
+
+Vectors are synthetic: clustered Gaussian points with the dimension of the
+default embeddings, so runs need no corpus or embedding backend. Use --vectors
+to benchmark real embeddings saved as a float32 .npy file instead.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from utils.index_utils import INDEX_TYPES, HNSW, IVFPQ, build_index, exact_search, get_search_params, read_index
+
+DEFAULT_COUNT = 200_000
+DEFAULT_DIM = 384
+DEFAULT_QUERIES = 200
+DEFAULT_K = 10
+# Share of the rows a filtered query may match, like a per-product filter
+DEFAULT_FILTER_FRACTION = 0.01
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+NPROBE_SWEEP = (4, 8, 16, 32, 64)
+
+
+def make_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    """
+    Make clustered, normalized vectors that look like sentence embeddings to an index.
+
+    Args:
+        count: Number of vectors
+        dim: Vector dimension
+        seed: Random seed
+
+    Returns:
+        float32 array of shape (count, dim)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 500), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)]
+    vectors += 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    """Get the mean share of the true nearest rows found per query."""
+    hits = sum(len(set(row[row >= 0].tolist()) & set(expected.tolist())) for row, expected in zip(found, truth))
+    return hits / truth.size
+
+
+def search_each(index: Any, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None,
+                params: Any = None) -> Dict[str, Any]:
+    """
+    Search one query at a time, as the retriever does.
+
+    Args:
+        index: FAISS index
+        queries: float32 array of query vectors
+        k: Rows per query
+        rows: Allowed rows for filtered searches
+        params: FAISS search parameters
+
+    Returns:
+        Dictionary with the found rows and the p50/p95 latency in milliseconds
+    """
+    found, samples = [], []
+    for query in queries:
+        query = query[None, :]
+        started = time.perf_counter()
+        if rows is not None and params is None:
+            result = exact_search(index, query, k, rows)
+            result = np.pad(result, (0, k - len(result)), constant_values=-1)
+        else:
+            result = index.search(query, k, params=params)[1][0]
+        samples.append(time.perf_counter() - started)
+        found.append(result)
+    latencies = np.asarray(samples) * 1000
+    return {
+        "found": np.asarray(found),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def bench_type(index_type: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+               filtered_truth: np.ndarray, allowed: np.ndarray, args: argparse.Namespace,
+               workdir: str) -> List[Dict[str, Any]]:
+    """
+    Build one index type and measure it unfiltered, filtered and over its search breadths.
+
+    Returns:
+        Result records
+    """
+    started = time.perf_counter()
+    index = build_index(vectors, index_type)
+    build_s = time.perf_counter() - started
+    path = os.path.join(workdir, f"{index_type}.faiss")
+    faiss.write_index(index, path)
+    # Measure the index as it is served: memory-mapped from disk
+    index = read_index(path, mmap=True)
+
+    base = {"type": index_type, "build_s": build_s, "size_mb": os.path.getsize(path) / 2 ** 20}
+    results = []
+
+    def record(setting: str, run: Dict[str, Any], expected: np.ndarray, filtered: bool) -> None:
+        result = dict(base, setting=setting, filtered=filtered, recall=recall(run["found"], expected),
+                      p50_ms=run["p50_ms"], p95_ms=run["p95_ms"])
+        results.append(result)
+        print(
+            f"{index_type:<6} {setting:<14} {'filtered' if filtered else '':<9} recall@{args.k}={result['recall']:.3f} "
+            f"p50={result['p50_ms']:8.3f}ms p95={result['p95_ms']:8.3f}ms size={result['size_mb']:8.1f}MB "
+            f"build={build_s:6.1f}s",
+            file=sys.stderr
+        )
+
+    if index_type == HNSW:
+        sweep = [("efSearch", value) for value in EF_SEARCH_SWEEP]
+    elif index_type == IVFPQ:
+        sweep = [("nprobe", value) for value in NPROBE_SWEEP]
+    else:
+        sweep = [("default", None)]
+    for name, value in sweep:
+        if name == "efSearch":
+            index.hnsw.efSearch = value
+        elif name == "nprobe":
+            faiss.extract_index_ivf(index).nprobe = value
+        setting = name if value is None else f"{name}={value}"
+        record(setting, search_each(index, queries, args.k), truth, False)
+        params = get_search_params(index, allowed)
+        record(setting, search_each(index, queries, args.k, allowed, params), filtered_truth, True)
+    return results
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare recall and latency of the knowledge base index types.")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Comma-separated index types")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="Synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="Synthetic vector dimension")
+    parser.add_argument("--vectors", help="float32 .npy file of real embeddings to index instead")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries per setting")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="Rows per query")
+    parser.add_argument("--filter-fraction", type=float, default=DEFAULT_FILTER_FRACTION,
+                        help="Share of rows matched by the filtered queries")
+    args = parser.parse_args(argv)
+
+    vectors = np.load(args.vectors).astype(np.float32) if args.vectors else make_vectors(args.count, args.dim)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed copies of indexed vectors, so each has true near neighbours
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    allowed = np.sort(rng.choice(len(vectors), max(1, int(len(vectors) * args.filter_fraction)), replace=False))
+
+    # Ground truth from exact search
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    truth = exact.search(queries, args.k)[1]
+    filtered_truth = exact.search(queries, args.k, params=faiss.SearchParameters(sel=faiss.IDSelectorBatch(allowed)))[1]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="medassist-index-") as workdir:
+        for index_type in [name.strip() for name in args.types.split(",") if name.strip()]:
+            results.extend(bench_type(index_type, vectors, queries, truth, filtered_truth, allowed, args, workdir))
+
+    report = {
+        "meta": {
+            "count": len(vectors),
+            "dim": int(vectors.shape[1]),
+            "python": platform.python_version(),
+            "faiss": faiss.__version__,
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Startup benchmarks for MedAssist: module import time and Streamlit reruns.
+
+Each entry module is imported in a fresh interpreter with -X importtime and
+checked against an import-time budget, and against the heavy packages that
+must only be loaded on first use (google-generativeai, langchain and FAISS).
+Calls that every chat session makes early, such as condensing the first
+follow-up question, are run the same way against Gemini replaced by the local
+fake, so a deferred import inside them is caught too.
+The Streamlit app is then run headless, timing the first run of the script
+and the reruns that follow every widget interaction:
+
+    python -m benchmarks.bench_startup -o startup.json
+    python -m benchmarks.bench_startup --budget-scale 2   # slower machines
+
+The exit status is 1 if any module is over budget or imports a deferred package.
+The app runs against a temporary catalog with Gemini disabled, so runs need no
+API key and leave the data directory alone.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import budgets in milliseconds, as cumulative -X importtime of the module itself
+# (interpreter startup excluded). They leave room for slower machines; the deferred
+# package check below is what catches a heavy import creeping back in.
+IMPORT_BUDGETS_MS = {
+    "utils.gemini_utils": 250,
+    "utils.pipeline_utils": 250,
+    "utils.memory_utils": 250,
+    "utils.data_utils": 250,
+    "utils.rag_utils": 500,
+    "api": 300,
+    "batch": 300,
+}
+
+# First calls on the chat path, as code run in a fresh interpreter with Gemini faked.
+# Budgets in milliseconds cover importing the module and making the call.
+CALL_BUDGETS_MS = {
+    "utils.memory_utils condense": 300,
+}
+CALL_PROBES = {
+    "utils.memory_utils condense": (
+        "from benchmarks.fake_gemini import fake_gemini\n"
+        "from utils.memory_utils import ConversationMemory\n"
+        "memory = ConversationMemory()\n"
+        "memory.add_turn('I have a headache', 'Biofina Pain Relief may help.')\n"
+        "with fake_gemini(latency=0, chunk_latency=0):\n"
+        "    memory.condense_question('Can I take it before bed?')\n"
+    ),
+}
+
+# Packages that are imported on first use only, never by importing the modules above
+DEFERRED_PACKAGES = ("google.generativeai", "langchain", "langchain_core", "langchain_community", "faiss")
+
+DEFAULT_IMPORT_RUNS = 5
+DEFAULT_RERUNS = 20
+
+IMPORT_PROBE = (
+    "import sys, json; import {module}; "
+    "print(json.dumps([name for name in {deferred!r} if name in sys.modules]))"
+)
+
+CALL_PROBE = (
+    "import sys, json, time\nstarted = time.perf_counter()\n{code}"
+    "elapsed_ms = (time.perf_counter() - started) * 1000\n"
+    "print(json.dumps([elapsed_ms, [name for name in {deferred!r} if name in sys.modules]]))"
+)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Get the q-th percentile (0-100) of samples, interpolating between ranks."""
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def measure_import(module: str) -> Dict[str, Any]:
+    """
+    Import a module in a fresh interpreter.
+
+    Args:
+        module: Dotted module name
+
+    Returns:
+        Dictionary with the import time in milliseconds and the deferred packages it loaded
+    """
+    code = IMPORT_PROBE.format(module=module, deferred=DEFERRED_PACKAGES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    import_ms = None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            import_ms = int(parts[1]) / 1000
+    return {"import_ms": import_ms, "deferred_loaded": json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+def bench_imports(runs: int, budget_scale: float) -> List[Dict[str, Any]]:
+    """
+    Measure every budgeted module, keeping the median of several cold imports.
+
+    Args:
+        runs: Fresh interpreters per module
+        budget_scale: Factor applied to every budget
+
+    Returns:
+        Result records
+    """
+    results = []
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        samples = [measure_import(module) for _ in range(runs)]
+        import_ms = statistics.median(sample["import_ms"] for sample in samples)
+        deferred = sorted({name for sample in samples for name in sample["deferred_loaded"]})
+        result = {
+            "name": f"import {module}",
+            "import_ms": import_ms,
+            "budget_ms": budget * budget_scale,
+            "deferred_loaded": deferred,
+            "ok": import_ms <= budget * budget_scale and not deferred,
+        }
+        results.append(result)
+        print(
+            f"import {module:<22} {import_ms:8.1f}ms  budget {result['budget_ms']:6.0f}ms"
+            f"{'  loads ' + ', '.join(deferred) if deferred else ''}{'' if result['ok'] else '  FAIL'}",
+            file=sys.stderr
+        )
+    return results
+
+
+def measure_call(name: str, workdir: str) -> Dict[str, Any]:
+    """
+    Run a call probe in a fresh interpreter.
+
+    Args:
+        name: Key of the probe in CALL_PROBES
+        workdir: Directory for the probe's catalog, so the data directory is left alone
+
+    Returns:
+        Dictionary with the time in milliseconds and the deferred packages it loaded
+    """
+    code = CALL_PROBE.format(code=CALL_PROBES[name], deferred=DEFERRED_PACKAGES)
+    env = dict(os.environ, MEDASSIST_CATALOG_PATH=os.path.join(workdir, "catalog.db"))
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    call_ms, deferred = json.loads(result.stdout.strip().splitlines()[-1])
+    return {"call_ms": call_ms, "deferred_loaded": deferred}
+
+
+def bench_calls(runs: int, budget_scale: float) -> List[Dict[str, Any]]:
+    """
+    Measure every budgeted first call, keeping the median of several cold runs.
+
+    Args:
+        runs: Fresh interpreters per call
+        budget_scale: Factor applied to every budget
+
+    Returns:
+        Result records
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="medassist-startup-") as workdir:
+        for name, budget in CALL_BUDGETS_MS.items():
+            samples = [measure_call(name, workdir) for _ in range(runs)]
+            call_ms = statistics.median(sample["call_ms"] for sample in samples)
+            deferred = sorted({package for sample in samples for package in sample["deferred_loaded"]})
+            result = {
+                "name": f"call {name}",
+                "call_ms": call_ms,
+                "budget_ms": budget * budget_scale,
+                "deferred_loaded": deferred,
+                "ok": call_ms <= budget * budget_scale and not deferred,
+            }
+            results.append(result)
+            print(
+                f"call {name:<24} {call_ms:8.1f}ms  budget {result['budget_ms']:6.0f}ms"
+                f"{'  loads ' + ', '.join(deferred) if deferred else ''}{'' if result['ok'] else '  FAIL'}",
+                file=sys.stderr
+            )
+    return results
+
+
+def bench_app(reruns: int) -> List[Dict[str, Any]]:
+    """
+    Time the Streamlit app's first run and its reruns, headless.
+
+    The first run includes importing the app's modules and loading the catalog;
+    reruns are what every click and chat message pays before anything else.
+
+    Args:
+        reruns: Timed reruns
+
+    Returns:
+        Result records, or none if Streamlit's test harness isn't available
+    """
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("streamlit.testing is not available; skipping the app benchmark", file=sys.stderr)
+        return []
+
+    with tempfile.TemporaryDirectory(prefix="medassist-startup-") as workdir:
+        os.environ["MEDASSIST_CATALOG_PATH"] = os.path.join(workdir, "catalog.db")
+        # An empty key is never loaded over by .env and leaves Gemini unconfigured
+        os.environ["GEMINI_API_KEY"] = ""
+        app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+
+        started = time.perf_counter()
+        app.run()
+        first_run = time.perf_counter() - started
+        if app.exception:
+            raise RuntimeError(f"App failed: {app.exception[0].message}")
+
+        samples = []
+        for _ in range(reruns):
+            started = time.perf_counter()
+            app.run()
+            samples.append(time.perf_counter() - started)
+
+    results = [
+        {"name": "app first run", "ms": first_run * 1000},
+        {
+            "name": "app rerun",
+            "iterations": len(samples),
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+        },
+    ]
+    print(f"app first run {first_run * 1000:10.1f}ms", file=sys.stderr)
+    print(f"app rerun     p50={results[1]['p50_ms']:.1f}ms p95={results[1]['p95_ms']:.1f}ms", file=sys.stderr)
+    return results
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark MedAssist import time and Streamlit reruns.")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("--import-runs", type=int, default=DEFAULT_IMPORT_RUNS, help="Cold imports per module and runs per call")
+    parser.add_argument("--reruns", type=int, default=DEFAULT_RERUNS, help="Timed app reruns")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Factor applied to every import budget")
+    parser.add_argument("--no-app", action="store_true", help="Only check the import budgets")
+    args = parser.parse_args(argv)
+
+    results = bench_imports(args.import_runs, args.budget_scale)
+    results.extend(bench_calls(args.import_runs, args.budget_scale))
+    failures = [result["name"] for result in results if not result["ok"]]
+    if not args.no_app:
+        results.extend(bench_app(args.reruns))
+
+    report = {"meta": {"python": sys.version.split()[0], "args": vars(args)}, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if failures:
+        print(f"{len(failures)} modules or calls over their budget or loading deferred packages", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Local stand-in for google.generativeai.GenerativeModel, for benchmarks.
+
+The fake accepts the same constructor arguments as the real model and answers
+generate_content / generate_content_async, streaming or not, with a canned reply
+after a configurable delay, so the request path can be measured without network
+access or API quota.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Iterator, List
+
+# Delay before the first chunk, and between chunks, in seconds
+DEFAULT_LATENCY = 0.05
+DEFAULT_CHUNK_LATENCY = 0.005
+DEFAULT_CHUNKS = 8
+
+REPLY = (
+    "Based on your symptoms, a Biofina product may help. Take it as directed on the label "
+    "and stop if you notice side effects. Please consult a healthcare professional before "
+    "starting any new medication."
+)
+
+
+class FakeChunk:
+    """A chunk of a fake response, with the .text attribute of the real one."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeResponse:
+    """Fake synchronous response: iterating it streams the chunks with their delays."""
+
+    def __init__(self, chunks: List[str], chunk_latency: float):
+        self.chunks = chunks
+        self.chunk_latency = chunk_latency
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def __iter__(self) -> Iterator[FakeChunk]:
+        for position, chunk in enumerate(self.chunks):
+            if position:
+                time.sleep(self.chunk_latency)
+            yield FakeChunk(chunk)
+
+
+class FakeAsyncResponse(FakeResponse):
+    """Fake asynchronous response: async iteration streams the chunks with their delays."""
+
+    async def __aiter__(self):
+        for position, chunk in enumerate(self.chunks):
+            if position:
+                await asyncio.sleep(self.chunk_latency)
+            yield FakeChunk(chunk)
+
+
+def split_reply(text: str, chunks: int) -> List[str]:
+    """Split a reply into about `chunks` pieces at word boundaries."""
+    words = text.split(" ")
+    size = max(1, -(-len(words) // max(1, chunks)))
+    return [" ".join(words[start:start + size]) + " " for start in range(0, len(words), size)]
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in replacement for genai.GenerativeModel with simulated latency.
+
+    A non-streaming call takes latency plus chunk_latency per remaining chunk, the
+    same total as consuming a streaming call, which returns after latency.
+    """
+
+    # Class-level settings, so models created inside the code under test pick them up
+    latency = DEFAULT_LATENCY
+    chunk_latency = DEFAULT_CHUNK_LATENCY
+    chunks = DEFAULT_CHUNKS
+    reply = REPLY
+    calls = 0
+
+    def __init__(self, model_name: str = "fake", generation_config: Any = None,
+                 safety_settings: Any = None, system_instruction: Any = None):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.safety_settings = safety_settings
+        self.system_instruction = system_instruction
+
+    def _chunks(self) -> List[str]:
+        type(self).calls += 1
+        return split_reply(self.reply, self.chunks)
+
+    def generate_content(self, contents: Any, stream: bool = False, **kwargs) -> FakeResponse:
+        chunks = self._chunks()
+        time.sleep(self.latency)
+        if not stream:
+            time.sleep(self.chunk_latency * (len(chunks) - 1))
+        return FakeResponse(chunks, self.chunk_latency)
+
+    async def generate_content_async(self, contents: Any, stream: bool = False, **kwargs) -> FakeAsyncResponse:
+        chunks = self._chunks()
+        await asyncio.sleep(self.latency)
+        if not stream:
+            await asyncio.sleep(self.chunk_latency * (len(chunks) - 1))
+        return FakeAsyncResponse(chunks, self.chunk_latency)
+
+
+@contextmanager
+def fake_gemini(latency: float = DEFAULT_LATENCY, chunk_latency: float = DEFAULT_CHUNK_LATENCY,
+                chunks: int = DEFAULT_CHUNKS) -> Iterator[type]:
+    """
+    Route every Gemini call made through utils.gemini_utils to FakeGenerativeModel.
+
+    Args:
+        latency: Seconds before the first chunk of a response
+        chunk_latency: Seconds between chunks
+        chunks: Number of chunks per response
+
+    Yields:
+        The FakeGenerativeModel class, whose `calls` counts the requests made
+    """
+    from utils import gemini_utils
+
+    saved = (gemini_utils.get_genai, gemini_utils.api_key, gemini_utils._gemini_initialized)
+    FakeGenerativeModel.latency = latency
+    FakeGenerativeModel.chunk_latency = chunk_latency
+    FakeGenerativeModel.chunks = chunks
+    FakeGenerativeModel.calls = 0
+
+    gemini_utils.init_gemini("fake-benchmark-key")
+    gemini_utils.get_genai = lambda: SimpleNamespace(GenerativeModel=FakeGenerativeModel)
+    gemini_utils._model_registry.clear()
+    gemini_utils._model_catalog_versions.clear()
+    try:
+        yield FakeGenerativeModel
+    finally:
+        gemini_utils.get_genai, gemini_utils.api_key, gemini_utils._gemini_initialized = saved
+        gemini_utils._model_registry.clear()
+        gemini_utils._model_catalog_versions.clear()
@@ -0,0 +1,55 @@
+import pytest
+
+from benchmarks.fake_gemini import fake_gemini
+from utils import catalog_utils, gemini_utils
+from utils.catalog_utils import get_catalog, get_catalog_store
+from utils.pipeline_utils import format_fallback_response
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEDASSIST_CATALOG_PATH", str(tmp_path / "catalog.db"))
+    monkeypatch.setattr(catalog_utils, "_catalog", None)
+    get_catalog_store.cache_clear()
+    yield get_catalog_store()
+    get_catalog_store().close()
+    get_catalog_store.cache_clear()
+
+
+def add_products(store, count):
+    store.upsert_products(
+        {"title": f"Biofina Product {number}", "description": f"For condition {number}.", "keywords": [f"cond{number}"]}
+        for number in range(count)
+    )
+
+
+def test_system_prompt_and_fallback_are_bounded(catalog):
+    small_prompt = gemini_utils.format_system_prompt()
+    assert "Biofina Sleep Aid" in small_prompt
+    assert "Biofina Sleep Aid" in format_fallback_response([])
+
+    add_products(catalog, 1000)
+    prompt = gemini_utils.format_system_prompt()
+    assert "1005 medications" in prompt
+    assert "Biofina Product" not in prompt
+    assert len(prompt) <= len(small_prompt)
+    assert len(format_fallback_response([])) < 1000
+
+    # Matched products are described in the request context instead
+    product = get_catalog().get("Biofina Product 7")
+    assert "condition 7" in gemini_utils.format_product_context(product)
+
+
+def test_model_registry_evicts_superseded_catalog_prompts(catalog):
+    with fake_gemini():
+        first = gemini_utils.get_gemini_model()
+        assert gemini_utils.get_gemini_model() is first
+        helper = gemini_utils.get_gemini_model(system_instruction=gemini_utils.HELPER_INSTRUCTION)
+
+        for number in range(3):
+            add_products(catalog, number + 1)
+            gemini_utils.get_gemini_model()
+        assert first not in gemini_utils._model_registry.values()
+        assert len(gemini_utils._model_catalog_versions) == 1
+        # Models with their own system instruction don't depend on the catalog
+        assert gemini_utils.get_gemini_model(system_instruction=gemini_utils.HELPER_INSTRUCTION) is helper
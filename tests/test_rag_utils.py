@@ -0,0 +1,142 @@
+import os
+import functools
+
+import pytest
+
+from utils import catalog_utils, index_utils
+from utils.hf_utils import BatchedEmbeddings, LocalHashingBackend
+from utils.index_utils import IVFPQ, get_index_kind
+from utils.pipeline_utils import MedAssistPipeline
+from utils import rag_utils
+from utils.rag_utils import HybridRetriever, VectorIndexManager, get_hybrid_retriever, get_relevant_documents
+
+
+def write_sections(path, topics):
+    """Write one "##" section per topic, each with its own words."""
+    with open(path, "w", encoding="utf-8") as f:
+        for topic in topics:
+            f.write(f"## Topic {topic}\n\nNotes on topic{topic} about word{topic} and term{topic * 7}.\n\n")
+
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEDASSIST_CHUNKING", "*.md=sections")
+    monkeypatch.setenv("MEDASSIST_INGEST_WORKERS", "1")
+    # A catalog of the test's own, whose product sheet is written next to the documents
+    monkeypatch.setenv("MEDASSIST_CATALOG_PATH", str(tmp_path / "catalog.db"))
+    monkeypatch.setattr(catalog_utils, "_catalog", None)
+    catalog_utils.get_catalog_store.cache_clear()
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+
+    make_manager = functools.partial(
+        VectorIndexManager,
+        data_dir=str(data_dir),
+        vector_store_path=str(tmp_path / "vector_store"),
+        embeddings=BatchedEmbeddings(LocalHashingBackend()),
+    )
+    yield data_dir, make_manager
+    catalog_utils.get_catalog_store().close()
+    catalog_utils.get_catalog_store.cache_clear()
+
+
+@pytest.fixture
+def ivfpq_manager(knowledge_base, monkeypatch):
+    monkeypatch.setenv("MEDASSIST_INDEX_TYPE", IVFPQ)
+    # Quantize a corpus small enough to build in a test
+    monkeypatch.setitem(index_utils.MIN_VECTORS, IVFPQ, 1000)
+    monkeypatch.setattr(index_utils, "PQ_DIMS_PER_CODE", 32)
+    return knowledge_base
+
+
+def assert_finds_own_chunks(vector_store, topics):
+    """Check that searching for each topic's text finds its chunk, by a row the store knows."""
+    assert get_index_kind(vector_store.index) == IVFPQ
+    assert vector_store.index.ntotal == len(vector_store.index_to_docstore_id)
+    retriever = HybridRetriever(vector_store)
+    found = 0
+    for topic in topics:
+        rows = retriever.dense_search(f"Topic {topic}\n\nNotes on topic{topic}", 1)
+        assert all(0 <= row < len(retriever.documents) for row in rows)
+        found += bool(rows) and retriever.documents[rows[0]].page_content.startswith(f"## Topic {topic}\n")
+    # Product quantization may rank a near neighbour first now and then
+    assert found >= 0.9 * len(topics)
+
+
+def test_sync_deletes_from_ivfpq_index(ivfpq_manager):
+    data_dir, make_manager = ivfpq_manager
+    write_sections(data_dir / "a.md", range(600))
+    write_sections(data_dir / "b.md", range(600, 1200))
+    vector_store = make_manager().sync()
+    assert get_index_kind(vector_store.index) == IVFPQ
+    assert len(HybridRetriever(vector_store).filter_rows({"source": "b.md"})) == 600
+
+    # Drop every other section of a.md, so the rows of the chunks after them shift down
+    write_sections(data_dir / "a.md", range(0, 600, 2))
+    assert_finds_own_chunks(make_manager().sync(), list(range(0, 600, 20)) + list(range(600, 1200, 20)))
+    # The saved version reads back the same
+    assert_finds_own_chunks(make_manager().sync(), list(range(0, 600, 20)) + list(range(600, 1200, 20)))
+
+
+def test_sync_removes_file_from_ivfpq_index(ivfpq_manager):
+    data_dir, make_manager = ivfpq_manager
+    write_sections(data_dir / "a.md", range(600))
+    write_sections(data_dir / "b.md", range(600, 1200))
+    make_manager().sync()
+
+    os.remove(data_dir / "a.md")
+    vector_store = make_manager().sync()
+    retriever = HybridRetriever(vector_store)
+    sources = {
+        retriever.documents[row].metadata["source"]
+        for topic in range(600, 1200, 50)
+        for row in retriever.dense_search(f"Topic {topic}", 5)
+    }
+    assert sources == {"b.md"}
+    assert len(retriever.filter_rows({"source": "a.md"})) == 0
+    assert len(retriever.filter_rows({"source": "b.md"})) == 600
+
+
+def test_catalog_edit_reaches_vector_store(knowledge_base, monkeypatch):
+    data_dir, make_manager = knowledge_base
+    write_sections(data_dir / "a.md", range(10))
+    monkeypatch.setattr(rag_utils, "VectorIndexManager", make_manager)
+    vector_store = rag_utils.get_vector_store()
+    assert rag_utils.refresh_vector_store(vector_store) is vector_store
+    pipeline = MedAssistPipeline(vector_store=vector_store)
+
+    catalog_utils.get_catalog_store().upsert_product({
+        "title": "Biofina Test Balm",
+        "description": "For zzyzx rashes.",
+        "keywords": ["zzyzx"],
+    })
+    refreshed = rag_utils.refresh_vector_store(vector_store)
+    assert refreshed is not vector_store
+    assert rag_utils.refresh_vector_store(vector_store) is refreshed
+    assert "Biofina Test Balm" in (data_dir / "biofina_medications.txt").read_text(encoding="utf-8")
+    documents = get_relevant_documents("zzyzx rashes", refreshed, k=1, filters={"source": "biofina_medications.txt"})
+    assert documents[0].page_content.startswith("## Biofina Test Balm")
+
+    passages = pipeline.retrieve_sync("zzyzx rashes", {"source": "biofina_medications.txt"})
+    assert pipeline.vector_store is refreshed
+    assert any("content" in passage and passage["title"].startswith("Biofina Test Balm") for passage in passages)
+
+
+def test_sync_replacing_chunks_refreshes_retriever(knowledge_base):
+    data_dir, make_manager = knowledge_base
+    write_sections(data_dir / "a.md", range(10))
+    manager = make_manager()
+    vector_store = manager.sync()
+    # Cached for the store before it changes
+    get_hybrid_retriever(vector_store)
+
+    # As many chunks added as removed, in the same store object
+    write_sections(data_dir / "a.md", range(5, 15))
+    assert manager.sync() is vector_store
+    retriever = get_hybrid_retriever(vector_store)
+    contents = {document.page_content for document in retriever.documents}
+    assert any(content.startswith("## Topic 14\n") for content in contents)
+    assert not any(content.startswith("## Topic 0\n") for content in contents)
+    assert retriever.sparse_search("topic14", 1) == [
+        row for row, document in enumerate(retriever.documents) if document.page_content.startswith("## Topic 14\n")
+    ]
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from utils import rate_limit_utils
+from utils.rate_limit_utils import CircuitBreaker, RateLimiter, call_with_retry_async
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    # Half-open: the reset timeout has passed, so the next call is the trial call
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    monkeypatch.setattr(rate_limit_utils, "get_circuit_breaker", lambda: breaker)
+    return breaker
+
+
+def test_trial_call_cancelled_while_queued_releases_breaker(breaker, monkeypatch):
+    # One request per minute, already used, so the next call queues for quota
+    limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=0, max_wait=60.0)
+    limiter.acquire()
+    monkeypatch.setattr(rate_limit_utils, "get_rate_limiter", lambda: limiter)
+
+    async def answer():
+        return "ok"
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(call_with_retry_async(answer), 0.1))
+    assert breaker.state == "half-open"
+    assert not breaker._trial_in_flight
+
+    # The next call is let through as the trial call and closes the circuit
+    monkeypatch.setattr(rate_limit_utils, "get_rate_limiter", lambda: RateLimiter(requests_per_minute=0, tokens_per_minute=0))
+    assert asyncio.run(call_with_retry_async(answer)) == "ok"
+    assert breaker.state == "closed"
+
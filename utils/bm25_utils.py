@@ -0,0 +1,104 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens for sparse retrieval.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of tokens
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 index with array-backed postings.
+
+    Postings are stored in CSR form (one offsets array, one document-id array and
+    one weight array for all terms), and the full BM25 weight of every posting is
+    computed at build time, so scoring a query is a few vectorized additions.
+    """
+
+    def __init__(self, texts: List[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.num_docs = len(texts)
+        self.vocabulary: Dict[str, int] = {}
+
+        term_doc_counts: List[Dict[int, int]] = []
+        doc_lengths = np.zeros(self.num_docs, dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            for token in tokens:
+                term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+                if term_id == len(term_doc_counts):
+                    term_doc_counts.append({})
+                counts = term_doc_counts[term_id]
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        average_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        length_norm = k1 * (1 - b + b * doc_lengths / (average_length or 1.0))
+
+        self.indptr = np.zeros(len(term_doc_counts) + 1, dtype=np.int64)
+        for term_id, counts in enumerate(term_doc_counts):
+            self.indptr[term_id + 1] = self.indptr[term_id] + len(counts)
+        self.doc_ids = np.empty(self.indptr[-1], dtype=np.int32)
+        self.weights = np.empty(self.indptr[-1], dtype=np.float32)
+
+        for term_id, counts in enumerate(term_doc_counts):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+            tfs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            idf = np.log(1 + (self.num_docs - len(counts) + 0.5) / (len(counts) + 0.5))
+            self.doc_ids[start:end] = docs
+            self.weights[start:end] = idf * tfs * (k1 + 1) / (tfs + length_norm[docs])
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Compute the BM25 score of every document for a query.
+
+        Args:
+            query: Query text
+
+        Returns:
+            float32 array with one score per document
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for token in tokenize(query):
+            term_id = self.vocabulary.get(token)
+            if term_id is not None:
+                start, end = self.indptr[term_id], self.indptr[term_id + 1]
+                scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Find the best matching documents for a query.
+
+        Args:
+            query: Query text
+            k: Maximum number of documents to return
+            allowed: Positions of the documents that may be returned (all if None)
+
+        Returns:
+            List of (document position, score) pairs, best first, excluding non-matching documents
+        """
+        scores = self.score(query)
+        candidates = np.arange(self.num_docs) if allowed is None else np.asarray(allowed, dtype=np.int64)
+        k = min(k, len(candidates))
+        if k <= 0:
+            return []
+        candidate_scores = scores[candidates]
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = candidates[top[np.argsort(-candidate_scores[top], kind="stable")]]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in top if scores[doc_id] > 0]
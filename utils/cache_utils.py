@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Cache settings, overridable through environment variables
+DEFAULT_CACHE_SIZE = 512
+DEFAULT_CACHE_TTL = 6 * 60 * 60  # seconds
+DEFAULT_QUERY_CACHE_SIZE = 1024
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a user query so trivially different phrasings share a cache entry.
+
+    Lowercases, drops punctuation and collapses whitespace, so
+    "What can help with my headache?" and "what can help with my headache"
+    produce the same key.
+
+    Args:
+        query: User's question
+
+    Returns:
+        Normalized query text
+    """
+    query = re.sub(r"[^\w\s&]", " ", query.lower())
+    return " ".join(query.split())
+
+
+def make_cache_key(
+    query: str,
+    relevant_docs: Optional[List[Dict[str, Any]]],
+    model_name: str,
+    history: Optional[str] = None,
+    catalog_version: Optional[int] = None
+) -> str:
+    """
+    Build the cache key for a generated response.
+
+    Args:
+        query: User's question
+        relevant_docs: Documents passed to the model as context
+        model_name: Name of the model generating the response
+        history: Conversation history passed to the model, if any
+        catalog_version: Version of the product catalog the model was told about, if any
+
+    Returns:
+        Hex digest identifying the response
+    """
+    titles = sorted({doc["title"] for doc in relevant_docs or []})
+    key = [normalize_query(query), titles, model_name]
+    if history:
+        # Follow-up questions depend on the conversation, so they only match the same conversation
+        key.append(history)
+    if catalog_version is not None:
+        # Answers quote product details, so they expire when the catalog changes
+        key.append(f"catalog:{catalog_version}")
+    payload = json.dumps(key)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_query_embedding_key(query: str, model_name: str) -> str:
+    """
+    Build the cache key for a query embedding.
+
+    Args:
+        query: User's question
+        model_name: Name of the embedding model
+
+    Returns:
+        Key made of the model name and the normalized query
+    """
+    return f"{model_name}\n{normalize_query(query)}"
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache with a time-to-live for generated responses.
+
+    Thread-safe, so a single instance can be shared by all Streamlit sessions.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response.
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            The cached response, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if time.time() - created_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store a response, evicting the least recently used entries when full.
+
+        Args:
+            key: Cache key from make_cache_key
+            value: Response text to cache
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dictionary with size, hits, misses and evictions
+        """
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Response cache persisted in a SQLite database, so entries survive restarts
+    and can be shared between processes on the same host.
+    """
+
+    def __init__(self, path: str, max_size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value, created_at = row
+                if now - created_at <= self.ttl:
+                    self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return value
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        if self.max_size <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            # Drop expired entries, then the least recently used ones beyond the size bound
+            expired = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            ).rowcount
+            self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the process-wide response cache.
+
+    Configured through environment variables:
+    MEDASSIST_CACHE_SIZE (maximum entries, 0 disables caching),
+    MEDASSIST_CACHE_TTL (seconds an entry stays valid) and
+    MEDASSIST_CACHE_PATH (SQLite file for a persistent cache; in-memory if unset).
+
+    Returns:
+        ResponseCache instance
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                max_size = int(os.getenv("MEDASSIST_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+                ttl = float(os.getenv("MEDASSIST_CACHE_TTL", DEFAULT_CACHE_TTL))
+                path = os.getenv("MEDASSIST_CACHE_PATH")
+                if path:
+                    _response_cache = SQLiteResponseCache(path, max_size=max_size, ttl=ttl)
+                else:
+                    _response_cache = ResponseCache(max_size=max_size, ttl=ttl)
+    return _response_cache
+
+
+class QueryEmbeddingCache(ResponseCache):
+    """
+    In-memory LRU cache of query embeddings, keyed by make_query_embedding_key.
+
+    Embeddings don't go stale, so entries only leave the cache when evicted.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_QUERY_CACHE_SIZE):
+        super().__init__(max_size=max_size, ttl=math.inf)
+
+
+_query_embedding_cache: Optional[QueryEmbeddingCache] = None
+_query_embedding_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """
+    Get the process-wide query embedding cache.
+
+    Configured through MEDASSIST_QUERY_CACHE_SIZE (maximum entries, 0 disables caching).
+
+    Returns:
+        QueryEmbeddingCache instance
+    """
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        with _query_embedding_cache_lock:
+            if _query_embedding_cache is None:
+                max_size = int(os.getenv("MEDASSIST_QUERY_CACHE_SIZE", DEFAULT_QUERY_CACHE_SIZE))
+                _query_embedding_cache = QueryEmbeddingCache(max_size=max_size)
+    return _query_embedding_cache
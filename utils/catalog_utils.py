@@ -0,0 +1,696 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from utils.metrics_utils import traced
+from utils.search_utils import TrigramIndex
+
+# Default location of the catalog database, overridable with MEDASSIST_CATALOG_PATH
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "catalog.db")
+
+PRODUCT_IMAGE_URL = "https://img.freepik.com/free-vector/realistic-white-bottle-mock-up-pills_1017-17273.jpg"
+
+# Biofina products the catalog is seeded with when it is first created, as described
+# by the original system prompt; fields it said nothing about (e.g. dosage) are left empty
+DEFAULT_PRODUCTS = [
+    {
+        "title": "Biofina Pain Relief",
+        "description": "For headaches, muscle aches, and fever reduction.",
+        "active_ingredients": ["acetaminophen"],
+        "indications": ["headache", "muscle aches", "fever"],
+        "contraindications": ["liver conditions"],
+        "side_effects": ["nausea", "drowsiness"],
+        "dosage": "",
+        "keywords": ["pain", "relief", "headache", "muscle", "ache", "fever", "acetaminophen"],
+        "image_url": PRODUCT_IMAGE_URL,
+        "buy_link": "https://example.com/buy/pain-relief"
+    },
+    {
+        "title": "Biofina Allergy Relief",
+        "description": "For seasonal allergies, providing 24-hour relief from sneezing, runny nose, and itchy eyes. Non-drowsy formula.",
+        "active_ingredients": ["loratadine"],
+        "indications": ["seasonal allergies", "allergies", "sneezing", "runny nose", "itchy eyes"],
+        "contraindications": [],
+        "side_effects": ["dry mouth", "headache"],
+        "dosage": "",
+        "keywords": ["allergy", "allergies", "sneezing", "runny nose", "itchy", "eyes", "loratadine", "antihistamine", "non-drowsy"],
+        "image_url": PRODUCT_IMAGE_URL,
+        "buy_link": "https://example.com/buy/allergy-relief"
+    },
+    {
+        "title": "Biofina Cold & Flu",
+        "description": "For symptom relief of common cold and influenza.",
+        "active_ingredients": ["acetaminophen", "dextromethorphan", "phenylephrine"],
+        "indications": ["common cold", "cold", "flu", "influenza"],
+        "contraindications": ["high blood pressure"],
+        "side_effects": ["drowsiness"],
+        "dosage": "",
+        "keywords": ["cold", "flu", "cough", "congestion", "fever", "sore throat", "dextromethorphan", "phenylephrine"],
+        "image_url": PRODUCT_IMAGE_URL,
+        "buy_link": "https://example.com/buy/cold-flu"
+    },
+    {
+        "title": "Biofina Digestive Health",
+        "description": "A probiotic supplement supporting gut health and digestion. Helps with bloating and gas.",
+        "active_ingredients": ["beneficial bacteria including Lactobacillus and Bifidobacterium strains"],
+        "indications": ["bloating", "gas", "digestion", "gut health"],
+        "contraindications": [],
+        "side_effects": [],
+        "dosage": "",
+        "keywords": ["digestive", "stomach", "bloating", "gas", "bowel", "probiotic", "gut", "digestion"],
+        "image_url": PRODUCT_IMAGE_URL,
+        "buy_link": "https://example.com/buy/digestive-health"
+    },
+    {
+        "title": "Biofina Sleep Aid",
+        "description": "A non-habit forming sleep supplement that helps reduce time to fall asleep.",
+        "active_ingredients": ["melatonin", "valerian root", "chamomile"],
+        "indications": ["trouble falling asleep"],
+        "contraindications": ["pregnancy"],
+        "side_effects": ["vivid dreams"],
+        "dosage": "",
+        "keywords": ["sleep", "insomnia", "melatonin", "valerian", "chamomile", "rest", "drowsy", "dreams"],
+        "image_url": PRODUCT_IMAGE_URL,
+        "buy_link": "https://example.com/buy/sleep-aid"
+    }
+]
+
+# Product fields holding lists, stored as JSON arrays
+LIST_FIELDS = ("active_ingredients", "indications", "contraindications", "side_effects", "keywords")
+TEXT_FIELDS = ("description", "dosage", "image_url", "buy_link")
+PRODUCT_FIELDS = ("title",) + TEXT_FIELDS + LIST_FIELDS
+
+# Fields covered by the full-text index
+SEARCH_FIELDS = ("title", "keywords", "indications", "contraindications")
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    description TEXT NOT NULL DEFAULT '',
+    dosage TEXT NOT NULL DEFAULT '',
+    image_url TEXT NOT NULL DEFAULT '',
+    buy_link TEXT NOT NULL DEFAULT '',
+    active_ingredients TEXT NOT NULL DEFAULT '[]',
+    indications TEXT NOT NULL DEFAULT '[]',
+    contraindications TEXT NOT NULL DEFAULT '[]',
+    side_effects TEXT NOT NULL DEFAULT '[]',
+    keywords TEXT NOT NULL DEFAULT '[]'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    title, keywords, indications, contraindications,
+    content='products', content_rowid='id', tokenize='porter unicode61'
+);
+
+-- Bumped by every change to the products, so readers in any process can tell
+-- that their copy of the catalog is out of date
+CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 0);
+
+CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, title, keywords, indications, contraindications)
+    VALUES (new.id, new.title, new.keywords, new.indications, new.contraindications);
+    UPDATE catalog_meta SET value = value + 1 WHERE key = 'version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, title, keywords, indications, contraindications)
+    VALUES ('delete', old.id, old.title, old.keywords, old.indications, old.contraindications);
+    UPDATE catalog_meta SET value = value + 1 WHERE key = 'version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, title, keywords, indications, contraindications)
+    VALUES ('delete', old.id, old.title, old.keywords, old.indications, old.contraindications);
+    INSERT INTO products_fts (rowid, title, keywords, indications, contraindications)
+    VALUES (new.id, new.title, new.keywords, new.indications, new.contraindications);
+    UPDATE catalog_meta SET value = value + 1 WHERE key = 'version';
+END;
+"""
+
+
+def normalize_product(product: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Bring a product record into the catalog's shape.
+
+    List fields may be given as lists or as comma-separated strings (as in a
+    CSV product sheet); missing fields are left empty.
+
+    Args:
+        product: Product record with at least a title
+
+    Returns:
+        Product dictionary with every catalog field
+    """
+    title = str(product.get("title") or "").strip()
+    if not title:
+        raise ValueError("Product has no title")
+
+    normalized: Dict[str, Any] = {"title": title}
+    for field in TEXT_FIELDS:
+        normalized[field] = str(product.get(field) or "").strip()
+    for field in LIST_FIELDS:
+        value = product.get(field) or []
+        if isinstance(value, str):
+            value = value.split(",")
+        normalized[field] = [str(item).strip() for item in value if str(item).strip()]
+    return normalized
+
+
+def make_match_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query matching any of its words.
+
+    Args:
+        text: Query text
+
+    Returns:
+        FTS5 match expression, or "" if the text has no words
+    """
+    words = dict.fromkeys(re.findall(r"\w+", text.lower()))
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+class CatalogStore:
+    """
+    Product catalog kept in a SQLite database with a full-text index.
+
+    Edits made through this class, another process or the sqlite3 shell all
+    bump the catalog version, which is how readers know to reload.
+    """
+
+    def __init__(self, path: str, seed_products: Optional[Iterable[Dict[str, Any]]] = DEFAULT_PRODUCTS):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(CATALOG_SCHEMA)
+
+        # Seed a new catalog only once, so removing every product sticks
+        if seed_products is not None:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    seeded = self._conn.execute(
+                        "INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('seeded', 1)"
+                    ).rowcount
+                    if seeded:
+                        for product in seed_products:
+                            self._upsert(normalize_product(product))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+
+    def _upsert(self, product: Dict[str, Any]) -> None:
+        values = [product[field] for field in PRODUCT_FIELDS]
+        values = [json.dumps(value) if isinstance(value, list) else value for value in values]
+        columns = ", ".join(PRODUCT_FIELDS)
+        updates = ", ".join(f"{field} = excluded.{field}" for field in PRODUCT_FIELDS[1:])
+        self._conn.execute(
+            f"INSERT INTO products ({columns}) VALUES ({', '.join('?' * len(PRODUCT_FIELDS))}) "
+            f"ON CONFLICT (title) DO UPDATE SET {updates}",
+            values
+        )
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        product = dict(zip(PRODUCT_FIELDS, row))
+        for field in LIST_FIELDS:
+            product[field] = json.loads(product[field])
+        return product
+
+    def upsert_products(self, products: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add products, or replace the products with the same titles, in one transaction.
+
+        Args:
+            products: Product records
+
+        Returns:
+            Number of products written
+        """
+        products = [normalize_product(product) for product in products]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for product in products:
+                    self._upsert(product)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(products)
+
+    def upsert_product(self, product: Dict[str, Any]) -> None:
+        """Add a product, or replace the product with the same title."""
+        self.upsert_products([product])
+
+    def delete_product(self, title: str) -> bool:
+        """
+        Remove a product.
+
+        Args:
+            title: Product title
+
+        Returns:
+            True if the product was in the catalog
+        """
+        with self._lock:
+            return self._conn.execute("DELETE FROM products WHERE title = ?", (title,)).rowcount > 0
+
+    def version(self) -> int:
+        """Get the catalog version, which changes whenever a product does."""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()[0]
+
+    def get_product(self, title: str) -> Optional[Dict[str, Any]]:
+        """Look up a product by its exact title."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products WHERE title = ?", (title,)
+            ).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Read the whole catalog consistently.
+
+        Returns:
+            Tuple of (catalog version, products in the order they were added)
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                version = self._conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()[0]
+                rows = self._conn.execute(f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products ORDER BY id").fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        return version, [self._decode(row) for row in rows]
+
+    def search(self, query: str, fields: Sequence[str] = SEARCH_FIELDS, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Full-text search over the catalog.
+
+        Args:
+            query: Free text; products matching any of its words are returned
+            fields: Indexed fields to search (any of SEARCH_FIELDS)
+            limit: Maximum number of products to return
+
+        Returns:
+            Matching products, best match (by BM25) first
+        """
+        unknown = set(fields) - set(SEARCH_FIELDS)
+        if unknown:
+            raise ValueError(f"Fields are not indexed: {', '.join(sorted(unknown))}")
+        match = make_match_query(query)
+        if not match or not fields:
+            return []
+
+        columns = ", ".join(f"p.{field}" for field in PRODUCT_FIELDS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM products_fts JOIN products p ON p.id = products_fts.rowid "
+                f"WHERE products_fts MATCH ? ORDER BY bm25(products_fts), p.id LIMIT ?",
+                (f"{{{' '.join(fields)}}} : ({match})", limit)
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Score weights for the different kinds of matches
+TITLE_MATCH_SCORE = 10
+TITLE_WORD_MATCH_SCORE = 5
+KEYWORD_MATCH_SCORE = 3
+WORD_IN_KEYWORD_SCORE = 2
+WORD_PREFIX_SCORE = 1
+
+
+class ProductIndex:
+    """
+    Keyword index over a product catalog, compiled once and queried per message.
+
+    Scoring is the same as matching every query word against every product
+    keyword, but the work per query depends on the query and the number of
+    matching products rather than on the size of the catalog.
+    """
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        self.products = list(products)
+
+        # Patterns that score when they occur in the query: the full title,
+        # the longer title words and every keyword
+        pattern_scores: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        # Products for each keyword, for the query-word-in-keyword checks
+        keyword_products: Dict[str, Set[int]] = defaultdict(set)
+
+        for product_id, product in enumerate(self.products):
+            title_lower = product["title"].lower()
+            pattern_scores[title_lower].append((product_id, TITLE_MATCH_SCORE))
+            for word in title_lower.split():
+                if len(word) > 3:
+                    pattern_scores[word].append((product_id, TITLE_WORD_MATCH_SCORE))
+
+            for keyword in product["keywords"]:
+                keyword_lower = keyword.lower()
+                pattern_scores[keyword_lower].append((product_id, KEYWORD_MATCH_SCORE))
+                keyword_products[keyword_lower].add(product_id)
+
+        self._pattern_scores = list(pattern_scores.values())
+        self._patterns = TrigramIndex(pattern_scores.keys())
+
+        self._keyword_products = list(keyword_products.values())
+        self._keywords = TrigramIndex(keyword_products.keys())
+
+        # Only keywords longer than four characters take part in prefix matching
+        long_keywords = [k for k in keyword_products if len(k) > 4]
+        self._long_keyword_products = [keyword_products[k] for k in long_keywords]
+        self._long_keywords = TrigramIndex(long_keywords)
+
+        # Query words repeat a lot between messages, so their matches are memoized
+        self._match_word = lru_cache(maxsize=4096)(self._compute_word_matches)
+
+    def _compute_word_matches(self, word: str) -> Tuple[frozenset, frozenset]:
+        """
+        Find the products a single query word matches.
+
+        Args:
+            word: Lowercase query word longer than three characters
+
+        Returns:
+            Tuple of (products with a keyword containing the word,
+            products with a long keyword containing the word's first four letters only)
+        """
+        full = set()
+        for keyword_id in self._keywords.containing(word):
+            full.update(self._keyword_products[keyword_id])
+
+        # Partial word match for possible misspellings
+        prefix = set()
+        for keyword_id in self._long_keywords.containing(word[:4]):
+            prefix.update(self._long_keyword_products[keyword_id])
+
+        return frozenset(full), frozenset(prefix - full)
+
+    def score(self, query: str) -> Dict[int, int]:
+        """
+        Score the products against a query.
+
+        Args:
+            query: User's question
+
+        Returns:
+            Dictionary mapping product positions to their non-zero scores
+        """
+        query_lower = query.lower()
+        scores: Dict[int, int] = defaultdict(int)
+
+        # Titles, title words and keywords that appear in the query
+        for pattern_id in self._patterns.contained_in(query_lower):
+            for product_id, points in self._pattern_scores[pattern_id]:
+                scores[product_id] += points
+
+        # General word matching with length check to avoid short common words
+        for word in query_lower.split():
+            if len(word) > 3:
+                full, prefix = self._match_word(word)
+                for product_id in full:
+                    scores[product_id] += WORD_IN_KEYWORD_SCORE
+                for product_id in prefix:
+                    scores[product_id] += WORD_PREFIX_SCORE
+
+        return {product_id: score for product_id, score in scores.items() if score > 0}
+
+    def search(self, query: str, top_k: int = 2) -> List[Dict[str, Any]]:
+        """
+        Find the best matching products for a query.
+
+        Args:
+            query: User's question
+            top_k: Maximum number of products to return
+
+        Returns:
+            List of product dictionaries, best match first
+        """
+        # Sort by score (descending), keeping catalog order for ties
+        ranked = sorted(self.score(query).items(), key=lambda item: (-item[1], item[0]))
+        return [self.products[product_id] for product_id, _ in ranked[:top_k]]
+
+
+class Catalog:
+    """
+    Immutable snapshot of the product catalog at one version, with its keyword index.
+    """
+
+    def __init__(self, version: int, products: List[Dict[str, Any]]):
+        self.version = version
+        self.products = products
+        self.index = ProductIndex(products)
+        self._by_title = {product["title"]: product for product in products}
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def get(self, title: str) -> Optional[Dict[str, Any]]:
+        """Look up a product by its exact title."""
+        return self._by_title.get(title)
+
+    def indication_map(self) -> Dict[str, List[str]]:
+        """
+        Map every indication in the catalog to the products that treat it.
+
+        Returns:
+            Dictionary of indication to product titles, both in catalog order
+        """
+        indications: Dict[str, List[str]] = {}
+        for product in self.products:
+            for indication in product["indications"]:
+                titles = indications.setdefault(indication.lower(), [])
+                if product["title"] not in titles:
+                    titles.append(product["title"])
+        return indications
+
+
+@lru_cache(maxsize=None)
+def get_catalog_store() -> CatalogStore:
+    """
+    Get the shared catalog store.
+
+    The database is MEDASSIST_CATALOG_PATH, or data/catalog.db by default, and
+    is created with the default products if it doesn't exist.
+
+    Returns:
+        CatalogStore instance
+    """
+    return CatalogStore(os.getenv("MEDASSIST_CATALOG_PATH", DEFAULT_CATALOG_PATH))
+
+
+_catalog: Optional[Catalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """
+    Get the current catalog snapshot.
+
+    The catalog is loaded once and reloaded only when its version changes, so
+    edits to the database take effect on the next lookup without a restart.
+
+    Returns:
+        Catalog instance
+    """
+    global _catalog
+    store = get_catalog_store()
+    version = store.version()
+    if _catalog is None or _catalog.version != version:
+        with _catalog_lock:
+            if _catalog is None or _catalog.version != version:
+                _catalog = Catalog(*store.snapshot())
+    return _catalog
+
+
+def get_product_index() -> ProductIndex:
+    """
+    Get the keyword index over the current catalog.
+
+    Returns:
+        ProductIndex of the current catalog snapshot
+    """
+    return get_catalog().index
+
+
+@traced("keyword")
+def find_relevant_products(query: str, top_k: int = 2) -> List[Dict[str, Any]]:
+    """
+    Identify the Biofina products relevant to a query.
+
+    Args:
+        query: User's question
+        top_k: Maximum number of products to return
+
+    Returns:
+        List of relevant product dictionaries
+    """
+    return get_product_index().search(query, top_k)
+
+
+def search_products(query: str, fields: Sequence[str] = SEARCH_FIELDS, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Full-text search of the catalog's titles, keywords, indications and contraindications.
+
+    Args:
+        query: Free text
+        fields: Indexed fields to search
+        limit: Maximum number of products to return
+
+    Returns:
+        Matching products, best match first
+    """
+    return get_catalog_store().search(query, fields, limit)
+
+
+def find_products_for_indication(symptom: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Find the products indicated for a symptom or condition.
+
+    Args:
+        symptom: Symptom or condition
+        limit: Maximum number of products to return
+
+    Returns:
+        Matching products, best match first
+    """
+    return search_products(symptom, ("indications",), limit)
+
+
+def find_contraindicated_products(condition: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Find the products that are not recommended with a condition.
+
+    Args:
+        condition: Condition, e.g. "pregnancy" or "high blood pressure"
+        limit: Maximum number of products to return
+
+    Returns:
+        Matching products, best match first
+    """
+    return search_products(condition, ("contraindications",), limit)
+
+
+def join_words(items: Sequence[str]) -> str:
+    """Join items into an English list, e.g. "a, b, and c"."""
+    items = list(items)
+    if len(items) <= 2:
+        return " and ".join(items)
+    return ", ".join(items[:-1]) + ", and " + items[-1]
+
+
+def describe_product(product: Dict[str, Any]) -> str:
+    """
+    Describe a product in a few sentences, for the system prompt.
+
+    Args:
+        product: Catalog product
+
+    Returns:
+        Product description with its ingredients, dosage, side effects and contraindications
+    """
+    description = product["description"]
+    sentences = [f"{product['title']} - {description[:1].lower() + description[1:]}"]
+    if product["active_ingredients"]:
+        sentences.append(f"Contains {join_words(product['active_ingredients'])}.")
+    if product["dosage"]:
+        sentences.append(f"Dosage: {product['dosage']}.")
+    if product["side_effects"]:
+        sentences.append(f"Side effects may include {join_words(product['side_effects'])}.")
+    if product["contraindications"]:
+        sentences.append(f"Not recommended for {join_words(product['contraindications'])}.")
+    return " ".join(sentence for sentence in sentences if sentence.strip())
+
+
+def format_product_sheet(products: Iterable[Dict[str, Any]]) -> str:
+    """
+    Format products as a Markdown document for the knowledge base.
+
+    Args:
+        products: Catalog products
+
+    Returns:
+        Document with one section per product
+    """
+    sections = ["# Biofina Pharmaceuticals Medications"]
+    for product in products:
+        lines = [f"## {product['title']}"]
+        if product["description"]:
+            lines.append(product["description"])
+        for label, field in (
+            ("Active ingredients", "active_ingredients"),
+            ("Indications", "indications"),
+        ):
+            if product[field]:
+                lines.append(f"{label}: {', '.join(product[field])}")
+        if product["dosage"]:
+            lines.append(f"Dosage: {product['dosage']}")
+        for label, field in (
+            ("Side effects", "side_effects"),
+            ("Contraindications", "contraindications"),
+        ):
+            if product[field]:
+                lines.append(f"{label}: {', '.join(product[field])}")
+        sections.append("\n".join(lines))
+    return "\n" + "\n\n".join(sections) + "\n"
+
+
+def main(argv: Optional[list] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or edit the MedAssist product catalog.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="print the products as JSON lines")
+    import_parser = commands.add_parser("import", help="add or replace products from a JSON, JSONL or CSV file")
+    import_parser.add_argument("path")
+    remove_parser = commands.add_parser("remove", help="remove a product by title")
+    remove_parser.add_argument("title")
+    search_parser = commands.add_parser("search", help="full-text search of the catalog")
+    search_parser.add_argument("query")
+    args = parser.parse_args(argv)
+
+    store = get_catalog_store()
+    if args.command == "list":
+        for product in store.snapshot()[1]:
+            print(json.dumps(product))
+    elif args.command == "import":
+        if args.path.lower().endswith(".csv"):
+            import csv
+            with open(args.path, "r", encoding="utf-8", newline="") as f:
+                products = list(csv.DictReader(f))
+        else:
+            from utils.ingest_utils import iter_json_records
+            products = list(iter_json_records(args.path))
+        print(f"Imported {store.upsert_products(products)} products")
+    elif args.command == "remove":
+        if not store.delete_product(args.title):
+            print(f"No product titled {args.title!r}")
+            return 1
+    elif args.command == "search":
+        for product in store.search(args.query):
+            print(product["title"])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
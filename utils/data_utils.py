@@ -1,27 +1,112 @@
 import os
 import json
-from langchain.docstore.document import Document
-from langchain_community.document_loaders import TextLoader, DirectoryLoader
+import threading
+from functools import lru_cache
+from utils.catalog_utils import get_catalog, format_product_sheet
+from utils.metrics_utils import traced
+from utils.ingest_utils import SUPPORTED_EXTENSIONS, iter_documents
+from utils.search_utils import AhoCorasick, TrigramIndex
 
-def load_medical_data():
+# Directory holding the medical knowledge base
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+# Generated data kept next to the documents, which must not be indexed as documents
+IGNORED_DIRS = {"vector_store", "embedding_cache"}
+IGNORED_FILES = {"symptom_medication_map.json"}
+
+# Knowledge base document generated from the product catalog
+PRODUCT_SHEET_FILE = "biofina_medications.txt"
+
+# Catalog version the product sheet of each data directory was last written for
+_product_sheet_versions = {}
+_product_sheet_lock = threading.Lock()
+
+def sync_product_sheet(data_dir=DATA_DIR):
     """
-    Load medical data from the data directory.
+    Write the product sheet from the product catalog, if the catalog has changed since it was last written.
+    
+    The sheet is only rewritten when its content differs, so an unchanged sheet
+    keeps its hash and isn't embedded again.
+    
+    Args:
+        data_dir: Directory containing the data files
+    """
+    catalog = get_catalog()
+    if _product_sheet_versions.get(data_dir) == catalog.version:
+        return
+    with _product_sheet_lock:
+        if _product_sheet_versions.get(data_dir) == catalog.version:
+            return
+        path = os.path.join(data_dir, PRODUCT_SHEET_FILE)
+        content = format_product_sheet(catalog.products)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = None
+        if current != content:
+            # Written to a temporary file first, so indexing never reads a partial sheet
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        _product_sheet_versions[data_dir] = catalog.version
+
+def get_source_files(data_dir=DATA_DIR):
+    """
+    List the documents in the data directory, creating the sample data if there are none.
     
+    Text, Markdown, JSON and CSV files are included; the vector store, the
+    embedding cache and the symptom map are not. The product sheet is brought
+    up to date with the product catalog first.
+    
+    Args:
+        data_dir: Directory containing the data files
+        
     Returns:
-        List of Document objects containing medical information
+        Sorted list of paths to the source documents
     """
     # Create data directory if it doesn't exist
-    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
     os.makedirs(data_dir, exist_ok=True)
+    ignored_paths = {os.path.realpath(os.getenv("MEDASSIST_EMBEDDING_CACHE_DIR", os.path.join(data_dir, "embedding_cache")))}
+    
+    def find_files():
+        source_files = []
+        for root, dirs, files in os.walk(data_dir):
+            dirs[:] = [
+                name for name in dirs
+                if name not in IGNORED_DIRS and not name.startswith(".")
+                and os.path.realpath(os.path.join(root, name)) not in ignored_paths
+            ]
+            source_files.extend(
+                os.path.join(root, name) for name in files
+                if name.lower().endswith(SUPPORTED_EXTENSIONS) and name not in IGNORED_FILES
+            )
+        return sorted(source_files)
     
     # Check if data files exist, if not create them
-    if not os.listdir(data_dir):
+    if not find_files():
         create_sample_data(data_dir)
+    sync_product_sheet(data_dir)
+    
+    return find_files()
+
+def load_medical_data():
+    """
+    Load medical data from the data directory.
+    
+    Large files are read in segments and product sheets record by record; use
+    ingest_utils.iter_documents directly to stream them instead of building a list.
+    
+    Returns:
+        List of Document objects containing medical information
+    """
+    data_dir = DATA_DIR
     
     # Load documents from data directory
     try:
-        loader = DirectoryLoader(data_dir, glob="**/*.txt", loader_cls=TextLoader)
-        documents = loader.load()
+        files = [(path, path) for path in get_source_files(data_dir)]
+        documents = list(iter_documents(files))
         return documents
     except Exception as e:
         print(f"Error loading documents: {e}")
@@ -32,6 +117,8 @@ def create_sample_data(data_dir):
     """
     Create sample medical data files for the chatbot.
     
+    The medications document is written from the product catalog.
+    
     Args:
         data_dir: Directory to save the data files
     """
@@ -71,69 +158,7 @@ Shortness of breath may indicate respiratory conditions, heart problems, anxiety
 Abdominal pain can be due to digestive issues, menstrual cramps, kidney stones, appendicitis, or other internal conditions.
 """,
         
-        "biofina_medications.txt": """
-# Biofina Pharmaceuticals Medications
-
-## Biorelief (Paracetamol 500mg)
-Indications: Mild to moderate pain relief, fever reduction
-Dosage: 1-2 tablets every 4-6 hours as needed, not exceeding 8 tablets in 24 hours
-Side effects: Rare when taken as directed; may include nausea, rash
-Contraindications: Liver disease, alcoholism
-
-## Inflacalm (Ibuprofen 400mg)
-Indications: Pain relief, inflammation reduction, fever
-Dosage: 1 tablet every 6-8 hours after food, not exceeding 3 tablets in 24 hours
-Side effects: Stomach upset, heartburn, dizziness
-Contraindications: Stomach ulcers, heart conditions, pregnancy (third trimester)
-
-## Allerease (Cetirizine 10mg)
-Indications: Allergies, hay fever, hives
-Dosage: 1 tablet daily
-Side effects: Drowsiness, dry mouth
-Contraindications: Kidney disease (may require dose adjustment)
-
-## Gastroguard (Omeprazole 20mg)
-Indications: Acid reflux, heartburn, stomach ulcers
-Dosage: 1 capsule daily before breakfast
-Side effects: Headache, diarrhea, nausea
-Contraindications: Liver disease (may require dose adjustment)
-
-## Slumbersure (Melatonin 3mg)
-Indications: Sleep difficulties, jet lag
-Dosage: 1 tablet 30 minutes before bedtime
-Side effects: Drowsiness, headache
-Contraindications: Autoimmune disorders, depression
-
-## Immunoboost (Vitamin C 1000mg + Zinc 15mg)
-Indications: Immune system support, cold prevention
-Dosage: 1 tablet daily
-Side effects: Stomach upset at high doses
-Contraindications: Kidney stones (high doses of Vitamin C)
-
-## Flexocare (Glucosamine 500mg + Chondroitin 400mg)
-Indications: Joint pain, osteoarthritis
-Dosage: 2 capsules daily with food
-Side effects: Mild stomach upset, nausea
-Contraindications: Shellfish allergy (glucosamine often derived from shellfish)
-
-## Cardioguard (Atorvastatin 10mg)
-Indications: High cholesterol, cardiovascular disease prevention
-Dosage: 1 tablet daily in the evening
-Side effects: Muscle pain, liver enzyme elevation
-Contraindications: Pregnancy, liver disease
-
-## Diabecontrol (Metformin 500mg)
-Indications: Type 2 diabetes management
-Dosage: 1-2 tablets twice daily with meals
-Side effects: Digestive upset, metallic taste
-Contraindications: Kidney disease, heart failure
-
-## Tensioease (Amlodipine 5mg)
-Indications: High blood pressure, angina
-Dosage: 1 tablet daily
-Side effects: Ankle swelling, flushing, headache
-Contraindications: Severe hypotension, heart failure
-""",
+        PRODUCT_SHEET_FILE: format_product_sheet(get_catalog().products),
         
         "medical_advice.txt": """
 # Important Medical Advice
@@ -194,57 +219,119 @@ Contraindications: Severe hypotension, heart failure
         file_path = os.path.join(data_dir, filename)
         with open(file_path, "w", encoding="utf-8") as f:
             f.write(content)
+
+class SymptomIndex:
+    """
+    Compiled symptom-to-medication map for matching free-text queries.
+
+    Symptoms mentioned in the query are found with one Aho-Corasick pass, and
+    queries that are part of a longer symptom name (e.g. "pain" for "joint pain")
+    are found through a trigram substring index.
+    """
     
-    # Create a JSON file with symptom-medication mappings
-    symptom_medication_map = {
-        "headache": ["Biorelief", "Inflacalm"],
-        "fever": ["Biorelief", "Inflacalm"],
-        "allergies": ["Allerease"],
-        "acid reflux": ["Gastroguard"],
-        "heartburn": ["Gastroguard"],
-        "insomnia": ["Slumbersure"],
-        "sleep problems": ["Slumbersure"],
-        "cold": ["Immunoboost", "Biorelief"],
-        "immune support": ["Immunoboost"],
-        "joint pain": ["Flexocare", "Inflacalm"],
-        "arthritis": ["Flexocare", "Inflacalm"],
-        "high cholesterol": ["Cardioguard"],
-        "diabetes": ["Diabecontrol"],
-        "high blood pressure": ["Tensioease"],
-        "hypertension": ["Tensioease"]
-    }
+    def __init__(self, symptom_medication_map):
+        self.symptoms = [symptom.lower() for symptom in symptom_medication_map]
+        self.medications = list(symptom_medication_map.values())
+        self._automaton = AhoCorasick(self.symptoms)
+        self._substrings = TrigramIndex(self.symptoms)
     
-    symptom_map_path = os.path.join(data_dir, "symptom_medication_map.json")
-    with open(symptom_map_path, "w", encoding="utf-8") as f:
-        json.dump(symptom_medication_map, f, indent=4)
+    def match(self, text):
+        """
+        Find the symptoms that match a query.
+        
+        Args:
+            text: Query text
+            
+        Returns:
+            List of (symptom, medications) pairs, in the order of the symptom map
+        """
+        text = text.lower()
+        if not text:
+            return []
+        
+        # Symptoms occurring in the query, and symptoms the query is a part of
+        symptom_ids = self._automaton.find_all(text) | self._substrings.containing(text)
+        return [(self.symptoms[i], self.medications[i]) for i in sorted(symptom_ids)]
 
-def get_medication_for_symptom(symptom):
+# Compiled symptom map from a JSON file, reloaded when the file changes on disk
+_symptom_index = None
+_symptom_index_mtime = None
+_symptom_index_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def get_catalog_symptom_index(catalog):
     """
-    Get recommended medications for a specific symptom.
+    Compile the indications of a catalog snapshot into a symptom map.
     
     Args:
-        symptom: The symptom to look up
+        catalog: Catalog snapshot
         
     Returns:
-        List of recommended medications
+        SymptomIndex mapping each indication to the products that treat it
     """
-    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-    symptom_map_path = os.path.join(data_dir, "symptom_medication_map.json")
+    return SymptomIndex(catalog.indication_map())
+
+def get_symptom_index(symptom_map_path=None):
+    """
+    Get the compiled symptom map.
     
-    try:
-        with open(symptom_map_path, "r", encoding="utf-8") as f:
-            symptom_medication_map = json.load(f)
-        
-        # Normalize symptom text for lookup
-        symptom_lower = symptom.lower()
+    By default the map is built from the indications in the product catalog and
+    follows catalog updates. A JSON symptom-medication map can be given instead;
+    it is loaded on first use and whenever the file is modified.
+    
+    Args:
+        symptom_map_path: Path to a symptom-medication JSON map (optional)
         
-        # Find matching symptoms
-        for key, medications in symptom_medication_map.items():
-            if key in symptom_lower or symptom_lower in key:
-                return medications
+    Returns:
+        SymptomIndex instance
+    """
+    global _symptom_index, _symptom_index_mtime
+    if symptom_map_path is None:
+        return get_catalog_symptom_index(get_catalog())
+    
+    mtime = (symptom_map_path, os.stat(symptom_map_path).st_mtime_ns)
+    if mtime != _symptom_index_mtime:
+        with _symptom_index_lock:
+            if mtime != _symptom_index_mtime:
+                with open(symptom_map_path, "r", encoding="utf-8") as f:
+                    symptom_medication_map = json.load(f)
+                _symptom_index = SymptomIndex(symptom_medication_map)
+                _symptom_index_mtime = mtime
+    
+    return _symptom_index
+
+def get_symptoms_for_query(query):
+    """
+    Get every symptom in the symptom map that matches a query, with its medications.
+    
+    Args:
+        query: The symptom or free-text question to look up
         
-        # No exact match found
-        return []
+    Returns:
+        List of (symptom, medications) pairs
+    """
+    try:
+        return get_symptom_index().match(query)
     except Exception as e:
         print(f"Error retrieving medication for symptom: {e}")
-        return []
\ No newline at end of file
+        return []
+
+@traced("symptom_lookup")
+def get_medication_for_symptom(symptom):
+    """
+    Get recommended medications for a specific symptom.
+    
+    Medications for all matching symptoms are combined, without duplicates.
+    
+    Args:
+        symptom: The symptom to look up
+        
+    Returns:
+        List of recommended medications
+    """
+    medications = []
+    for _, symptom_medications in get_symptoms_for_query(symptom):
+        for medication in symptom_medications:
+            if medication not in medications:
+                medications.append(medication)
+    return medications
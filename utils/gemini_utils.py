@@ -1,19 +1,74 @@
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+import json
+import threading
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+from utils.cache_utils import get_response_cache, make_cache_key
+from utils.catalog_utils import Catalog, describe_product, get_catalog
+from utils.metrics_utils import record_cache, record_size, traced
+from utils.rate_limit_utils import (
+    CHARS_PER_TOKEN,
+    ServiceBusyError,
+    call_with_retry,
+    call_with_retry_async,
+    estimate_tokens,
+)
 
-# Load environment variables
-load_dotenv()
-
-# Configure the Gemini API with the key from environment variables
-api_key = os.getenv("GEMINI_API_KEY")
-if api_key and api_key != "your_gemini_api_key_here":
-    genai.configure(api_key=api_key)
+# Gemini API key, read once per process by init_gemini()
+api_key: Optional[str] = None
+_gemini_initialized = False
+_gemini_init_lock = threading.Lock()
 
 # Default model to use
 DEFAULT_MODEL = "gemini-1.5-flash"
 
+# Largest catalog described product by product in the system prompt
+MAX_PROMPT_PRODUCTS = 20
+
+def init_gemini(key: Optional[str] = None) -> bool:
+    """
+    Set up Gemini for this process.
+    
+    Reads the API key from GEMINI_API_KEY unless one is given. Entry points call
+    this once after loading their .env file; the functions below call it on first
+    use otherwise, so importing this module has no side effects. The
+    google-generativeai package itself is only imported when the first model is
+    created (see get_genai()).
+    
+    Args:
+        key: API key to use instead of GEMINI_API_KEY
+        
+    Returns:
+        bool: True if a usable API key is configured
+    """
+    global api_key, _gemini_initialized
+    with _gemini_init_lock:
+        if key is not None or not _gemini_initialized:
+            key = key if key is not None else os.getenv("GEMINI_API_KEY")
+            if _gemini_initialized and key != api_key:
+                # Models created with the old key must not be reused
+                get_genai.cache_clear()
+                _model_registry.clear()
+                _model_catalog_versions.clear()
+            api_key = key
+            _gemini_initialized = True
+    return is_gemini_configured()
+
+@lru_cache(maxsize=None)
+def get_genai():
+    """
+    Import google-generativeai and configure it with the API key, once.
+    
+    The package takes over a second to import, so this happens when the first
+    model is created rather than at startup.
+    
+    Returns:
+        The configured google.generativeai module
+    """
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai
+
 # Check if Gemini API is configured
 def is_gemini_configured() -> bool:
     """
@@ -22,15 +77,93 @@ def is_gemini_configured() -> bool:
     Returns:
         bool: True if configured, False otherwise
     """
-    return api_key is not None and api_key != "your_gemini_api_key_here"
+    if not _gemini_initialized:
+        init_gemini()
+    return bool(api_key) and api_key != "your_gemini_api_key_here"
+
+# Generation settings shared by every request
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+}
+
+# Token budgets, overridable through environment variables. The prompt budget covers
+# everything sent per request (context, question and formatting instructions) but not
+# the system instruction, which is part of the model configuration.
+DEFAULT_MAX_OUTPUT_TOKENS = GENERATION_CONFIG["max_output_tokens"]
+DEFAULT_MAX_PROMPT_TOKENS = 2048
+# Smallest part of a knowledge base passage worth including when it has to be cut to fit
+MIN_PASSAGE_TOKENS = 64
+
+def get_generation_config() -> Dict[str, Any]:
+    """
+    Get the generation config, with max_output_tokens from MEDASSIST_MAX_OUTPUT_TOKENS.
+    
+    Returns:
+        Dict[str, Any]: Generation config for the model
+    """
+    return dict(
+        GENERATION_CONFIG,
+        max_output_tokens=int(os.getenv("MEDASSIST_MAX_OUTPUT_TOKENS", DEFAULT_MAX_OUTPUT_TOKENS))
+    )
+
+def get_max_prompt_tokens() -> int:
+    """
+    Get the per-request prompt budget in tokens (MEDASSIST_MAX_PROMPT_TOKENS).
+    
+    Returns:
+        int: Token budget
+    """
+    return int(os.getenv("MEDASSIST_MAX_PROMPT_TOKENS", DEFAULT_MAX_PROMPT_TOKENS))
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+]
+
+# Process-wide registry of model instances, shared across Streamlit sessions
+_model_registry: Dict[Tuple[str, str, str, str], Any] = {}
+_model_registry_lock = threading.Lock()
+# Catalog version of the registry entries using the catalog system prompt; entries of
+# superseded versions are evicted, since their prompt won't be asked for again
+_model_catalog_versions: Dict[Tuple[str, str, str, str], int] = {}
 
 # Initialize the Gemini model
-def get_gemini_model(model_name: str = DEFAULT_MODEL):
+def get_gemini_model(
+    model_name: str = DEFAULT_MODEL,
+    generation_config: Optional[Dict[str, Any]] = None,
+    safety_settings: Optional[List[Dict[str, str]]] = None,
+    system_instruction: Optional[str] = None
+):
     """
     Get a Gemini model instance.
     
+    Models are created once per model name and configuration and then reused,
+    so repeated requests don't pay for constructing the client objects again.
+    The MedAssist system prompt is set as the model's system instruction, so it
+    is not part of the per-request prompt.
+    
     Args:
         model_name: Name of the Gemini model to use
+        generation_config: Generation config for the model (defaults to get_generation_config())
+        safety_settings: Safety settings for the model (defaults to SAFETY_SETTINGS)
+        system_instruction: System instruction for the model (defaults to format_system_prompt())
         
     Returns:
         GenerativeModel: The Gemini model instance
@@ -38,143 +171,643 @@ def get_gemini_model(model_name: str = DEFAULT_MODEL):
     if not is_gemini_configured():
         raise ValueError("Gemini API key not configured. Please add your API key to the .env file.")
     
-    return genai.GenerativeModel(model_name)
+    if generation_config is None:
+        generation_config = get_generation_config()
+    if safety_settings is None:
+        safety_settings = SAFETY_SETTINGS
+    catalog_version = None
+    if system_instruction is None:
+        catalog = get_catalog()
+        catalog_version = catalog.version
+        system_instruction = build_system_prompt(catalog)
+    
+    key = (
+        model_name,
+        json.dumps(generation_config, sort_keys=True),
+        json.dumps(safety_settings, sort_keys=True),
+        system_instruction,
+    )
+    model = _model_registry.get(key)
+    if model is None:
+        with _model_registry_lock:
+            model = _model_registry.get(key)
+            if model is None:
+                model = get_genai().GenerativeModel(
+                    model_name,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                    system_instruction=system_instruction
+                )
+                _model_registry[key] = model
+                if catalog_version is not None:
+                    for old_key, version in list(_model_catalog_versions.items()):
+                        if version != catalog_version:
+                            _model_registry.pop(old_key, None)
+                            del _model_catalog_versions[old_key]
+                    _model_catalog_versions[key] = catalog_version
+    
+    return model
 
 # Format system prompt for medical assistant
 def format_system_prompt() -> str:
     """
     Format a system prompt for the Gemini model with information about Biofina Pharmaceuticals.
     
+    The product list comes from the catalog, so the prompt (and the models
+    created with it) follow catalog updates.
+    
     Returns:
         str: Formatted system prompt
     """
+    return build_system_prompt(get_catalog())
+
+def describes_catalog(catalog: Catalog) -> bool:
+    """
+    Check whether the system prompt describes every product in a catalog.
+    
+    Args:
+        catalog: Catalog snapshot
+        
+    Returns:
+        bool: True if the catalog is small enough to list in the system prompt
+    """
+    return len(catalog) <= MAX_PROMPT_PRODUCTS
+
+@lru_cache(maxsize=4)
+def build_system_prompt(catalog: Catalog) -> str:
+    """
+    Build the system prompt for one version of the product catalog.
+    
+    Catalogs of up to MAX_PROMPT_PRODUCTS products are described in full. Larger
+    ones would make every request pay for the whole catalog, so only the products
+    matched to a question are described, in its context.
+    
+    Args:
+        catalog: Catalog snapshot
+        
+    Returns:
+        str: Formatted system prompt
+    """
+    if describes_catalog(catalog):
+        products = "Biofina Pharmaceuticals offers the following medications:\n" + "".join(
+            f"{number}. {describe_product(product)}\n" for number, product in enumerate(catalog.products, 1)
+        )
+    else:
+        products = (
+            f"Biofina Pharmaceuticals offers {len(catalog)} medications. "
+            "The ones relevant to each question are described along with it.\n"
+        )
     return (
         "You are MedAssist, an AI medical assistant created by Biofina Pharmaceuticals. "
         "Your purpose is to provide helpful information about symptoms and suggest appropriate "
         "Biofina medications that might help with those symptoms. Be empathetic, professional, and detailed. "
-        "\n\nBiofina Pharmaceuticals offers the following medications:\n"
-        "1. Biofina Pain Relief - for headaches, muscle aches, and fever reduction. Contains acetaminophen. "
-        "Side effects may include nausea and drowsiness. Not recommended for liver conditions.\n"
-        "2. Biofina Allergy Relief - for seasonal allergies, providing 24-hour relief from sneezing, runny nose, and itchy eyes. "
-        "Contains loratadine, a non-drowsy formula. Side effects may include dry mouth and headache.\n"
-        "3. Biofina Cold & Flu - for symptom relief of common cold and influenza. Contains acetaminophen, dextromethorphan, and phenylephrine. "
-        "May cause drowsiness. Not recommended for high blood pressure.\n"
-        "4. Biofina Digestive Health - a probiotic supplement supporting gut health and digestion. "
-        "Contains beneficial bacteria including Lactobacillus and Bifidobacterium strains. Helps with bloating and gas.\n"
-        "5. Biofina Sleep Aid - a non-habit forming sleep supplement with melatonin, valerian root, and chamomile. "
-        "Helps reduce time to fall asleep. May cause vivid dreams. Not for pregnant women.\n\n"
+        f"\n\n{products}\n"
         "When responding to users, provide detailed information about these medications based on their symptoms or questions. "
         "Include dosage information, side effects, and contraindications when relevant. "
         "Always remind users to consult healthcare professionals before starting any medication."
     )
 
+# Fixed text around the context in every prompt
+PRODUCTS_HEADER = "Based on your question, these medications might be relevant:\n\n"
+PRODUCTS_FOOTER = (
+    "Please provide detailed information about these medications in your response. "
+    "If appropriate, include the image URLs and purchase links in your response using HTML.\n"
+)
+PASSAGES_HEADER = "\nReference information from the Biofina knowledge base:\n\n"
+HISTORY_HEADER = "Conversation so far:\n\n"
+HISTORY_FOOTER = "\n\n"
+QUESTION_PREFIX = "\n\nUser Question: "
+FORMAT_INSTRUCTIONS = "\n\nPlease format your response in markdown. If relevant, include HTML for images and 'Buy Now' buttons. Make your response visually appealing."
+
+def format_product_context(doc: Dict[str, Any]) -> str:
+    """
+    Format a keyword-matched product for the prompt context.
+    
+    Args:
+        doc: Product dictionary
+        
+    Returns:
+        str: Product entry
+    """
+    # Include all available information including image and buy link if available
+    context = f"- {doc['title']}\n"
+    
+    # Products of large catalogs aren't in the system prompt, so they are described here
+    if "description" in doc and not describes_catalog(get_catalog()):
+        context += f"  {describe_product(doc)}\n"
+    
+    if 'image_url' in doc and doc['image_url']:
+        context += f"  Image available at: {doc['image_url']}\n"
+        
+    if 'buy_link' in doc and doc['buy_link']:
+        context += f"  Purchase link: {doc['buy_link']}\n"
+    
+    return context + "\n"
+
+def format_passage_context(doc: Dict[str, Any]) -> str:
+    """
+    Format a knowledge base passage for the prompt context.
+    
+    Args:
+        doc: Passage dictionary with title and content
+        
+    Returns:
+        str: Passage entry
+    """
+    return f"[{doc['title']}]\n{doc['content'].strip()}\n\n"
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text to roughly max_tokens, at a word boundary.
+    
+    Args:
+        text: Text to shorten
+        max_tokens: Token budget
+        
+    Returns:
+        str: The text, shortened with an ellipsis if it didn't fit
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(max_tokens - 1, 0) * CHARS_PER_TOKEN]
+    return cut[:cut.rfind(" ")].rstrip() + " ..." if " " in cut else cut + " ..."
+
+def pack_context(relevant_docs: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """
+    Choose the context documents that fit in a token budget.
+    
+    Documents are taken in rank order (products, then passages by relevance).
+    Documents that don't fit are skipped, except that a passage is cut down to the
+    remaining budget when at least MIN_PASSAGE_TOKENS of it would fit.
+    
+    Args:
+        relevant_docs: Ranked products and knowledge base passages
+        budget: Tokens available for the context
+        
+    Returns:
+        List[Dict[str, Any]]: Documents to include, some passages possibly shortened
+    """
+    packed = []
+    remaining = budget
+    has_products = has_passages = False
+    for doc in relevant_docs or []:
+        is_passage = "content" in doc
+        # A document's cost includes its section header and footer if it is the first of its kind
+        if is_passage:
+            overhead = 0 if has_passages else estimate_tokens(PASSAGES_HEADER)
+            cost = overhead + estimate_tokens(format_passage_context(doc))
+        else:
+            overhead = 0 if has_products else estimate_tokens([PRODUCTS_HEADER, PRODUCTS_FOOTER])
+            cost = overhead + estimate_tokens(format_product_context(doc))
+        
+        if cost > remaining:
+            available = remaining - overhead - estimate_tokens(f"[{doc['title']}]\n\n\n")
+            if not is_passage or available < MIN_PASSAGE_TOKENS:
+                continue
+            doc = dict(doc, content=truncate_to_tokens(doc["content"].strip(), available))
+            cost = overhead + estimate_tokens(format_passage_context(doc))
+        
+        packed.append(doc)
+        remaining -= cost
+        has_passages = has_passages or is_passage
+        has_products = has_products or not is_passage
+    return packed
+
+# Build the prompt parts sent to Gemini
+def build_prompt_parts(
+    query: str,
+    relevant_docs: List[Dict[str, Any]] = None,
+    max_prompt_tokens: Optional[int] = None,
+    history: Optional[str] = None
+) -> List[str]:
+    """
+    Build the prompt for a user question, including context about relevant medications.
+    
+    The system prompt is not included; it is the model's system instruction. Context
+    documents are packed, highest ranked first, into what is left of the prompt
+    budget after the conversation history, question and instructions.
+    
+    Args:
+        query: User's question
+        relevant_docs: List of relevant medication documents and knowledge base passages (optional)
+        max_prompt_tokens: Prompt budget in tokens (defaults to get_max_prompt_tokens())
+        history: Earlier conversation, already fitted to its own token budget (optional)
+        
+    Returns:
+        List[str]: Prompt parts to pass to generate_content
+    """
+    if max_prompt_tokens is None:
+        max_prompt_tokens = get_max_prompt_tokens()
+    history_part = f"{HISTORY_HEADER}{history}{HISTORY_FOOTER}" if history else ""
+    budget = max_prompt_tokens - estimate_tokens([history_part, QUESTION_PREFIX, query, FORMAT_INSTRUCTIONS])
+    relevant_docs = pack_context(relevant_docs, budget)
+    
+    # Keyword-matched products and knowledge base passages are presented separately
+    products = [doc for doc in relevant_docs if "content" not in doc]
+    passages = [doc for doc in relevant_docs if "content" in doc]
+    
+    # Prepare context information if relevant docs are provided
+    context = ""
+    if products:
+        context = PRODUCTS_HEADER
+        context += "".join(format_product_context(doc) for doc in products)
+        context += PRODUCTS_FOOTER
+    
+    if passages:
+        context += PASSAGES_HEADER
+        context += "".join(format_passage_context(doc) for doc in passages)
+    
+    # Prepare the prompt with context
+    return [
+        history_part,
+        context,
+        QUESTION_PREFIX,
+        query,
+        FORMAT_INSTRUCTIONS
+    ]
+
+# Instruction for short internal tasks (condensing follow-up questions, summarizing
+# the conversation), which should not answer in the MedAssist persona
+HELPER_INSTRUCTION = (
+    "You rewrite and summarize conversations between a user and MedAssist, "
+    "a medical assistant by Biofina Pharmaceuticals. Reply with only the requested text."
+)
+HELPER_MAX_OUTPUT_TOKENS = 256
+
+@traced("helper_generation")
+def generate_gemini_text(prompt: str, model_name: str = DEFAULT_MODEL, max_output_tokens: int = HELPER_MAX_OUTPUT_TOKENS) -> str:
+    """
+    Run a short helper prompt, without the MedAssist system prompt, context or caching.
+    
+    Args:
+        prompt: Complete prompt text
+        model_name: Name of the Gemini model to use
+        max_output_tokens: Maximum length of the reply
+        
+    Returns:
+        str: Model reply
+        
+    Raises:
+        Exception: Any API error, so the caller can fall back to a local method
+    """
+    generation_config = dict(get_generation_config(), temperature=0.2, max_output_tokens=max_output_tokens)
+    model = get_gemini_model(model_name, generation_config=generation_config, system_instruction=HELPER_INSTRUCTION)
+    response = call_with_retry(
+        lambda: model.generate_content(prompt), estimate_tokens([HELPER_INSTRUCTION, prompt])
+    )
+    return response.text.strip()
+
+def estimate_request_tokens(prompt_parts: List[str]) -> int:
+    """
+    Estimate the input tokens a request is billed for, including the system instruction.
+    
+    Args:
+        prompt_parts: Prompt parts from build_prompt_parts
+        
+    Returns:
+        int: Approximate token count
+    """
+    return estimate_tokens(prompt_parts) + estimate_tokens(format_system_prompt())
+
+# Disclaimer appended to responses that don't already include one
+DISCLAIMER = "\n\n*Remember to consult with a healthcare professional before starting any new medication.*"
+
+def needs_disclaimer(response_text: str) -> bool:
+    """
+    Check whether a response still needs the healthcare professional disclaimer.
+    
+    Args:
+        response_text: Generated response text
+        
+    Returns:
+        bool: True if the disclaimer should be appended
+    """
+    return "consult with a healthcare professional" not in response_text.lower()
+
+def format_error_response(error: Exception) -> str:
+    """
+    Format the fallback message shown when a Gemini request fails.
+    
+    Args:
+        error: The exception raised while generating
+        
+    Returns:
+        str: User-facing error message
+    """
+    error_message = str(error)
+    return (
+        f"I apologize, but I encountered an error while generating a response: {error_message}\n\n"
+        "Please try again later or contact support if the issue persists. "
+        "In the meantime, you can ask about Biofina medications such as Pain Relief, Allergy Relief, "
+        "Cold & Flu, Digestive Health, or Sleep Aid."
+    )
+
+def lookup_cached_response(
+    query: str,
+    relevant_docs: List[Dict[str, Any]],
+    model_name: str,
+    use_cache: bool,
+    history: Optional[str] = None
+):
+    """
+    Look up a previously generated response in the response cache.
+    
+    Args:
+        query: User's question
+        relevant_docs: Documents passed to the model as context
+        model_name: Name of the Gemini model
+        use_cache: Whether the cache should be used at all
+        history: Conversation history passed to the model, if any
+        
+    Returns:
+        tuple: (cache or None, cache key, cached response or None)
+    """
+    cache = get_response_cache() if use_cache else None
+    cache_key = make_cache_key(query, relevant_docs, model_name, history, get_catalog().version)
+    cached_response = cache.get(cache_key) if cache is not None else None
+    if cache is not None:
+        record_cache("response", hits=int(cached_response is not None), misses=int(cached_response is None))
+    return cache, cache_key, cached_response
+
+def get_chunk_text(chunk) -> str:
+    """
+    Get the text of a streamed response chunk.
+    
+    Args:
+        chunk: Chunk from a streaming generate_content call
+        
+    Returns:
+        str: Chunk text, empty for chunks without text parts (e.g. only safety metadata)
+    """
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
 # Generate response using Gemini
+@traced("generation")
 def generate_gemini_response(
     query: str, 
     medical_data: List[Dict[str, Any]] = None, 
     relevant_docs: List[Dict[str, Any]] = None,
-    model_name: str = DEFAULT_MODEL
+    model_name: str = DEFAULT_MODEL,
+    use_cache: bool = True,
+    history: Optional[str] = None
 ) -> str:
     """
     Generate a response using the Gemini model.
     
+    Successful responses are cached by normalized query, context titles and model,
+    so repeated questions are answered without another Gemini round trip. Calls go
+    through the shared rate limiter and circuit breaker, and transient errors are
+    retried with jittered exponential backoff.
+    
     Args:
         query: User's question
         medical_data: List of all medication data dictionaries (optional, for backward compatibility)
         relevant_docs: List of relevant medication documents (optional)
         model_name: Name of the Gemini model to use
+        use_cache: Whether to read and write the response cache
+        history: Earlier conversation, as formatted by ConversationMemory (optional)
         
     Returns:
         str: Generated response
+        
+    Raises:
+        ServiceBusyError: If the circuit breaker is open or the request quota queue is full
     """
     try:
         if not is_gemini_configured():
             raise ValueError("Gemini API key not configured")
         
+        # Serve repeated questions from the response cache
+        cache, cache_key, cached_response = lookup_cached_response(query, relevant_docs, model_name, use_cache, history)
+        if cached_response is not None:
+            return cached_response
+        
         # Get the model
         model = get_gemini_model(model_name)
         
-        # Create system prompt
-        system_prompt = format_system_prompt()
-        
-        # Prepare context information if relevant docs are provided
-        context = ""
-        if relevant_docs and len(relevant_docs) > 0:
-            context = "Based on your question, these medications might be relevant:\n\n"
-            for doc in relevant_docs:
-                # Include all available information including image and buy link if available
-                context += f"- {doc['title']}\n"
-                
-                if 'image_url' in doc and doc['image_url']:
-                    context += f"  Image available at: {doc['image_url']}\n"
-                    
-                if 'buy_link' in doc and doc['buy_link']:
-                    context += f"  Purchase link: {doc['buy_link']}\n"
-                    
-                context += "\n"
-            
-            context += "Please provide detailed information about these medications in your response. "
-            context += "If appropriate, include the image URLs and purchase links in your response using HTML.\n"
-        
-        # Configure the model with the system prompt
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 1024,
-        }
-        
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-        ]
-        
-        # Prepare the prompt with context
-        prompt_parts = [
-            system_prompt,
-            "\n\n",
-            context,
-            "\n\nUser Question: ",
-            query,
-            "\n\nPlease format your response in markdown. If relevant, include HTML for images and 'Buy Now' buttons. Make your response visually appealing."
-        ]
-        
-        # Generate response
-        response = model.generate_content(
-            prompt_parts,
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
+        # Generate response, queueing for quota and retrying transient errors
+        prompt_parts = build_prompt_parts(query, relevant_docs, history=history)
+        prompt_tokens = estimate_request_tokens(prompt_parts)
+        record_size("prompt_tokens", prompt_tokens)
+        response = call_with_retry(lambda: model.generate_content(prompt_parts), prompt_tokens)
         
         # Format the response
         formatted_response = response.text
         
         # Add disclaimer if not already included
-        if "consult with a healthcare professional" not in formatted_response.lower():
-            formatted_response += "\n\n*Remember to consult with a healthcare professional before starting any new medication.*"
+        if needs_disclaimer(formatted_response):
+            formatted_response += DISCLAIMER
+        
+        record_size("response_chars", len(formatted_response))
+        if cache is not None:
+            cache.set(cache_key, formatted_response)
         
         return formatted_response
         
+    except ServiceBusyError:
+        # Gemini is throttled or down; let the caller fall back to keyword matching
+        raise
     except Exception as e:
         # Fallback response in case of API errors
-        error_message = str(e)
-        return (
-            f"I apologize, but I encountered an error while generating a response: {error_message}\n\n"
-            "Please try again later or contact support if the issue persists. "
-            "In the meantime, you can ask about Biofina medications such as Pain Relief, Allergy Relief, "
-            "Cold & Flu, Digestive Health, or Sleep Aid."
-        )
\ No newline at end of file
+        return format_error_response(e)
+
+# Stream a response from Gemini as it is generated
+@traced("generation_stream")
+def generate_gemini_response_stream(
+    query: str, 
+    relevant_docs: List[Dict[str, Any]] = None,
+    model_name: str = DEFAULT_MODEL,
+    use_cache: bool = True,
+    history: Optional[str] = None
+) -> Iterator[str]:
+    """
+    Generate a response using the Gemini model, yielding text as the model produces it.
+    
+    Cached responses are yielded in one piece; completed streams are added to the cache.
+    
+    Args:
+        query: User's question
+        relevant_docs: List of relevant medication documents (optional)
+        model_name: Name of the Gemini model to use
+        use_cache: Whether to read and write the response cache
+        history: Earlier conversation, as formatted by ConversationMemory (optional)
+        
+    Yields:
+        str: Chunks of the generated response
+        
+    Raises:
+        ServiceBusyError: If the circuit breaker is open or the request quota queue is full
+    """
+    streamed_text = ""
+    try:
+        if not is_gemini_configured():
+            raise ValueError("Gemini API key not configured")
+        
+        cache, cache_key, cached_response = lookup_cached_response(query, relevant_docs, model_name, use_cache, history)
+        if cached_response is not None:
+            yield cached_response
+            return
+        
+        model = get_gemini_model(model_name)
+        
+        prompt_parts = build_prompt_parts(query, relevant_docs, history=history)
+        prompt_tokens = estimate_request_tokens(prompt_parts)
+        record_size("prompt_tokens", prompt_tokens)
+        response = call_with_retry(
+            lambda: model.generate_content(prompt_parts, stream=True), prompt_tokens
+        )
+        
+        for chunk in response:
+            text = get_chunk_text(chunk)
+            if text:
+                streamed_text += text
+                yield text
+        
+        # Add disclaimer if not already included
+        if needs_disclaimer(streamed_text):
+            streamed_text += DISCLAIMER
+            yield DISCLAIMER
+        
+        record_size("response_chars", len(streamed_text))
+        if cache is not None:
+            cache.set(cache_key, streamed_text)
+        
+    except ServiceBusyError:
+        raise
+    except Exception as e:
+        # Fallback response in case of API errors, after whatever was already streamed
+        yield ("\n\n" if streamed_text else "") + format_error_response(e)
+
+# Generate response using Gemini without blocking the event loop
+@traced("generation")
+async def generate_gemini_response_async(
+    query: str, 
+    relevant_docs: List[Dict[str, Any]] = None,
+    model_name: str = DEFAULT_MODEL,
+    use_cache: bool = True,
+    raise_errors: bool = False,
+    max_retries: Optional[int] = None,
+    history: Optional[str] = None
+) -> str:
+    """
+    Generate a response using the async Gemini client.
+    
+    Behaves like generate_gemini_response, including caching and error handling.
+    
+    Args:
+        query: User's question
+        relevant_docs: List of relevant medication documents (optional)
+        model_name: Name of the Gemini model to use
+        use_cache: Whether to read and write the response cache
+        raise_errors: Raise API errors instead of returning an apology message,
+            for callers that report failures themselves
+        max_retries: Retries for transient errors (defaults to MEDASSIST_GEMINI_MAX_RETRIES)
+        history: Earlier conversation, as formatted by ConversationMemory (optional)
+        
+    Returns:
+        str: Generated response
+        
+    Raises:
+        ServiceBusyError: If the circuit breaker is open or the request quota queue is full
+    """
+    try:
+        if not is_gemini_configured():
+            raise ValueError("Gemini API key not configured")
+        
+        cache, cache_key, cached_response = lookup_cached_response(query, relevant_docs, model_name, use_cache, history)
+        if cached_response is not None:
+            return cached_response
+        
+        model = get_gemini_model(model_name)
+        
+        prompt_parts = build_prompt_parts(query, relevant_docs, history=history)
+        prompt_tokens = estimate_request_tokens(prompt_parts)
+        record_size("prompt_tokens", prompt_tokens)
+        response = await call_with_retry_async(
+            lambda: model.generate_content_async(prompt_parts), prompt_tokens, max_retries
+        )
+        
+        formatted_response = response.text
+        if needs_disclaimer(formatted_response):
+            formatted_response += DISCLAIMER
+        
+        record_size("response_chars", len(formatted_response))
+        if cache is not None:
+            cache.set(cache_key, formatted_response)
+        
+        return formatted_response
+        
+    except ServiceBusyError:
+        raise
+    except Exception as e:
+        if raise_errors:
+            raise
+        return format_error_response(e)
+
+# Stream a response from Gemini without blocking the event loop
+@traced("generation_stream")
+async def generate_gemini_response_stream_async(
+    query: str, 
+    relevant_docs: List[Dict[str, Any]] = None,
+    model_name: str = DEFAULT_MODEL,
+    use_cache: bool = True,
+    history: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Stream a response using the async Gemini client.
+    
+    Behaves like generate_gemini_response_stream, including caching and error handling.
+    
+    Args:
+        query: User's question
+        relevant_docs: List of relevant medication documents (optional)
+        model_name: Name of the Gemini model to use
+        use_cache: Whether to read and write the response cache
+        history: Earlier conversation, as formatted by ConversationMemory (optional)
+        
+    Yields:
+        str: Chunks of the generated response
+        
+    Raises:
+        ServiceBusyError: If the circuit breaker is open or the request quota queue is full
+    """
+    streamed_text = ""
+    try:
+        if not is_gemini_configured():
+            raise ValueError("Gemini API key not configured")
+        
+        cache, cache_key, cached_response = lookup_cached_response(query, relevant_docs, model_name, use_cache, history)
+        if cached_response is not None:
+            yield cached_response
+            return
+        
+        model = get_gemini_model(model_name)
+        
+        prompt_parts = build_prompt_parts(query, relevant_docs, history=history)
+        prompt_tokens = estimate_request_tokens(prompt_parts)
+        record_size("prompt_tokens", prompt_tokens)
+        response = await call_with_retry_async(
+            lambda: model.generate_content_async(prompt_parts, stream=True), prompt_tokens
+        )
+        
+        async for chunk in response:
+            text = get_chunk_text(chunk)
+            if text:
+                streamed_text += text
+                yield text
+        
+        if needs_disclaimer(streamed_text):
+            streamed_text += DISCLAIMER
+            yield DISCLAIMER
+        
+        record_size("response_chars", len(streamed_text))
+        if cache is not None:
+            cache.set(cache_key, streamed_text)
+        
+    except ServiceBusyError:
+        raise
+    except Exception as e:
+        yield ("\n\n" if streamed_text else "") + format_error_response(e)
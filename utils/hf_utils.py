@@ -0,0 +1,328 @@
+import os
+import re
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+from langchain_core.embeddings import Embeddings
+
+from utils.data_utils import DATA_DIR
+from utils.metrics_utils import record_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process cache access only
+    fcntl = None
+
+# Embedding settings, overridable through environment variables
+DEFAULT_HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_LOCAL_DIM = 384
+DEFAULT_BATCH_SIZE = 32
+TRIGRAM_WEIGHT = 0.25
+EMBEDDING_CACHE_DIR = os.path.join(DATA_DIR, "embedding_cache")
+
+HF_INFERENCE_URL = "https://api-inference.huggingface.co/pipeline/feature-extraction/{model}"
+
+
+class LocalHashingBackend:
+    """
+    Offline embedding backend based on feature hashing.
+
+    Words and character trigrams are hashed into a fixed number of signed buckets
+    and the result is L2-normalized. It needs no model download or network access,
+    so indexes can always be built, and texts sharing vocabulary end up close together.
+    """
+
+    def __init__(self, dim: int = DEFAULT_LOCAL_DIM):
+        self.dim = dim
+        self.model_name = f"local-hashing-{dim}"
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        # Whole words carry most of the signal; trigrams add tolerance to misspellings
+        words = [word for word in re.findall(r"\w+", text.lower()) if len(word) > 2]
+        features = [(word, 1.0) for word in words]
+        for word in words:
+            padded = f" {word} "
+            features.extend((padded[i:i + 3], TRIGRAM_WEIGHT) for i in range(len(padded) - 2))
+        return features
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            float32 array of shape (len(texts), dim)
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += weight if (value >> 63) else -weight
+        # Dampen repeated terms so long chunks aren't dominated by their most frequent words
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class HuggingFaceInferenceBackend:
+    """
+    Embedding backend using the HuggingFace Inference API feature-extraction pipeline.
+    """
+
+    def __init__(self, model: str = DEFAULT_HF_MODEL, api_token: Optional[str] = None, timeout: float = 60.0):
+        self.model_name = model
+        self.api_token = api_token
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts with one API request.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            float32 array of shape (len(texts), dim)
+        """
+        headers = {"Authorization": f"Bearer {self.api_token}"} if self.api_token else {}
+        response = self._session.post(
+            HF_INFERENCE_URL.format(model=self.model_name),
+            headers=headers,
+            json={"inputs": texts, "options": {"wait_for_model": True}},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return np.asarray(response.json(), dtype=np.float32).reshape(len(texts), -1)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk cache of embedding vectors for one model.
+
+    Vectors are appended to a flat float32 file that is read through a memory map,
+    and a key file maps the SHA-256 of each text to its row, so unchanged chunks
+    are never sent to the embedding backend twice.
+    """
+
+    def __init__(self, cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self.keys_path = os.path.join(cache_dir, "keys.txt")
+        self.lock_path = os.path.join(cache_dir, ".lock")
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._file_sizes = (0, 0)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh()
+
+    def _get_file_sizes(self):
+        keys_size = os.path.getsize(self.keys_path) if os.path.exists(self.keys_path) else 0
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        return keys_size, vectors_size
+
+    def _read_keys(self) -> List[str]:
+        with open(self.keys_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        if lines and lines[0].startswith("dim="):
+            self.dim = int(lines[0][4:])
+        return lines[1:]
+
+    def _refresh(self) -> None:
+        """Pick up rows appended since the last read, including by other processes."""
+        file_sizes = self._get_file_sizes()
+        if file_sizes == self._file_sizes:
+            return
+        self._file_sizes = file_sizes
+
+        keys = self._read_keys()
+        rows = file_sizes[1] // (4 * self.dim) if self.dim else 0
+        # Only keys whose vector has been fully written are visible
+        self._rows = {key: row for row, key in enumerate(keys[:rows])}
+        self._vectors = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            if rows else None
+        )
+
+    @staticmethod
+    def key(text: str) -> str:
+        """
+        Get the cache key of a text.
+
+        Args:
+            text: Text that was embedded
+
+        Returns:
+            Hex digest of the text
+        """
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up cached vectors.
+
+        Args:
+            keys: Cache keys from key()
+
+        Returns:
+            List with the cached vector, or None, for each key
+        """
+        with self._lock:
+            self._refresh()
+            results = []
+            for key in keys:
+                row = self._rows.get(key)
+                results.append(None if row is None else np.array(self._vectors[row]))
+            return results
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> None:
+        """
+        Append vectors to the cache.
+
+        Args:
+            keys: Cache keys from key()
+            vectors: float32 array with one row per key
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, open(self.lock_path, "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            if not os.path.exists(self.keys_path):
+                with open(self.keys_path, "w", encoding="utf-8") as f:
+                    f.write(f"dim={vectors.shape[1]}\n")
+            existing_keys = self._read_keys()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dim}")
+
+            # Rows are numbered by position: drop whatever an interrupted append left half-written
+            row_bytes = 4 * self.dim
+            vectors_size = self._get_file_sizes()[1]
+            count = min(len(existing_keys), vectors_size // row_bytes)
+            if vectors_size != count * row_bytes:
+                self._vectors = None
+                with open(self.vectors_path, "ab") as f:
+                    f.truncate(count * row_bytes)
+            if len(existing_keys) != count:
+                with open(self.keys_path, "w", encoding="utf-8") as f:
+                    f.write(f"dim={self.dim}\n" + "".join(key + "\n" for key in existing_keys[:count]))
+
+            known = set(existing_keys[:count])
+            new_keys, new_vectors = [], []
+            for key, vector in zip(keys, vectors):
+                if key not in known:
+                    known.add(key)
+                    new_keys.append(key)
+                    new_vectors.append(vector)
+
+            # Vectors first, so a key never points past the end of the vector file
+            if new_keys:
+                with open(self.vectors_path, "ab") as f:
+                    f.write(np.vstack(new_vectors).tobytes())
+                with open(self.keys_path, "a", encoding="utf-8") as f:
+                    f.write("".join(key + "\n" for key in new_keys))
+            self._refresh()
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    LangChain embeddings that batch requests to a backend and reuse cached vectors.
+    """
+
+    def __init__(self, backend, batch_size: int = DEFAULT_BATCH_SIZE, cache_dir: Optional[str] = None):
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.batch_size = max(1, batch_size)
+        self.cache = None
+        if cache_dir is not None:
+            safe_name = re.sub(r"[^\w.-]", "_", self.model_name)
+            self.cache = EmbeddingCache(os.path.join(cache_dir, safe_name))
+
+    def embed_vectors(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts, only sending those without a cached vector to the backend.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            float32 array with one row per text
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        keys = [EmbeddingCache.key(text) for text in texts]
+        cached = self.cache.get_many(keys) if self.cache is not None else [None] * len(texts)
+        if self.cache is not None:
+            hits = sum(vector is not None for vector in cached)
+            record_cache("embedding", hits=hits, misses=len(texts) - hits)
+
+        # Embed each distinct missing text once, in batches
+        missing: Dict[str, str] = {}
+        for key, text, vector in zip(keys, texts, cached):
+            if vector is None:
+                missing.setdefault(key, text)
+        missing_keys = list(missing)
+        computed: Dict[str, np.ndarray] = {}
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[start:start + self.batch_size]
+            vectors = self.backend.embed_batch([missing[key] for key in batch_keys])
+            if self.cache is not None:
+                self.cache.put_many(batch_keys, vectors)
+            computed.update(zip(batch_keys, vectors))
+
+        return np.vstack([
+            vector if vector is not None else computed[key]
+            for key, vector in zip(keys, cached)
+        ]).astype(np.float32, copy=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_vectors(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.backend.embed_batch([text])[0].tolist()
+
+
+@lru_cache(maxsize=None)
+def get_hf_embeddings() -> BatchedEmbeddings:
+    """
+    Get the shared embeddings used for indexing and retrieval.
+
+    Configured through environment variables:
+    MEDASSIST_EMBEDDINGS ("huggingface" or "local"; defaults to "huggingface" when
+    HUGGINGFACEHUB_API_TOKEN is set and "local" otherwise),
+    MEDASSIST_EMBEDDING_MODEL (HuggingFace model name),
+    MEDASSIST_EMBEDDING_BATCH_SIZE (texts per backend request) and
+    MEDASSIST_EMBEDDING_CACHE_DIR (on-disk vector cache).
+
+    Returns:
+        BatchedEmbeddings instance
+    """
+    api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+    backend_name = os.getenv("MEDASSIST_EMBEDDINGS", "huggingface" if api_token else "local")
+
+    if backend_name == "huggingface":
+        backend = HuggingFaceInferenceBackend(
+            model=os.getenv("MEDASSIST_EMBEDDING_MODEL", DEFAULT_HF_MODEL),
+            api_token=api_token
+        )
+    elif backend_name == "local":
+        backend = LocalHashingBackend()
+    else:
+        raise ValueError(f"Unknown embeddings backend: {backend_name}")
+
+    return BatchedEmbeddings(
+        backend,
+        batch_size=int(os.getenv("MEDASSIST_EMBEDDING_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+        cache_dir=os.getenv("MEDASSIST_EMBEDDING_CACHE_DIR", EMBEDDING_CACHE_DIR)
+    )
@@ -0,0 +1,296 @@
+import os
+import math
+from typing import Any, Optional
+
+import numpy as np
+
+# Index types for the knowledge base, selected with MEDASSIST_INDEX_TYPE:
+# flat searches every float32 vector exactly; hnsw adds a navigable graph over them
+# for sublinear search; sq8 stores each dimension in one byte (4x smaller, still a
+# full scan); ivfpq clusters the vectors and keeps product-quantized codes, for the
+# largest corpora on the least memory
+FLAT = "flat"
+HNSW = "hnsw"
+IVFPQ = "ivfpq"
+SQ8 = "sq8"
+INDEX_TYPES = (FLAT, HNSW, IVFPQ, SQ8)
+DEFAULT_INDEX_TYPE = FLAT
+
+# Below these sizes an index stays flat, which is fast enough there; IVF-PQ needs
+# 39 training vectors per PQ centroid. Training uses at most a fixed-seed sample.
+MIN_VECTORS = {HNSW: 1000, SQ8: 1000, IVFPQ: 10_000}
+MAX_TRAINING_VECTORS = 100_000
+
+# Graph degree and build/search breadth of HNSW indexes
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+DEFAULT_HNSW_EF_SEARCH = 64
+# Filtered searches widen efSearch by the inverse of the filter's selectivity; filters
+# too selective for that are searched exactly over their rows instead
+HNSW_MAX_EF_SEARCH = 1024
+EXACT_SEARCH_BATCH = 8192
+
+# IVF lists probed per query, and vector dimensions encoded by each PQ byte (4 keeps
+# 96 bytes of a 384-dim vector: 16x smaller than flat, at a clear cost in recall)
+DEFAULT_IVF_NPROBE = 16
+PQ_DIMS_PER_CODE = 4
+
+
+def get_index_type() -> str:
+    """
+    Get the configured index type (MEDASSIST_INDEX_TYPE).
+
+    Returns:
+        One of INDEX_TYPES
+    """
+    index_type = os.getenv("MEDASSIST_INDEX_TYPE", DEFAULT_INDEX_TYPE).strip().lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+    return index_type
+
+
+def use_mmap() -> bool:
+    """Whether saved indexes are memory-mapped rather than read into memory (MEDASSIST_INDEX_MMAP)."""
+    return os.getenv("MEDASSIST_INDEX_MMAP", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def get_factory_string(index_type: str, dim: int, count: int) -> str:
+    """
+    Get the faiss.index_factory description of an index type for a corpus.
+
+    Args:
+        index_type: One of INDEX_TYPES
+        dim: Vector dimension
+        count: Number of vectors to be indexed
+
+    Returns:
+        Factory string, e.g. "IVF1024,PQ96"
+    """
+    if index_type == FLAT or count < MIN_VECTORS[index_type]:
+        return "Flat"
+    if index_type == HNSW:
+        return f"HNSW{HNSW_M}"
+    if index_type == SQ8:
+        return "SQ8"
+    # About 4 * sqrt(n) lists, with enough vectors per list to train the centroids
+    nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+    # The number of PQ bytes per vector has to divide the dimension
+    codes = max(1, dim // PQ_DIMS_PER_CODE)
+    while dim % codes:
+        codes -= 1
+    return f"IVF{nlist},PQ{codes}"
+
+
+def get_index_kind(index: Any) -> str:
+    """
+    Get the type of a FAISS index, as one of INDEX_TYPES.
+
+    Args:
+        index: FAISS index
+
+    Returns:
+        Index type
+    """
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSW):
+        return HNSW
+    if isinstance(index, faiss.IndexIVF):
+        return IVFPQ
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return SQ8
+    return FLAT
+
+
+def configure_index(index: Any) -> Any:
+    """
+    Apply the search-time settings (MEDASSIST_HNSW_EF_SEARCH, MEDASSIST_IVF_NPROBE) to an index.
+
+    Args:
+        index: FAISS index
+
+    Returns:
+        The same index
+    """
+    import faiss
+
+    kind = get_index_kind(index)
+    if kind == HNSW:
+        index.hnsw.efSearch = int(os.getenv("MEDASSIST_HNSW_EF_SEARCH", DEFAULT_HNSW_EF_SEARCH))
+    elif kind == IVFPQ:
+        faiss.extract_index_ivf(index).nprobe = int(os.getenv("MEDASSIST_IVF_NPROBE", DEFAULT_IVF_NPROBE))
+    return index
+
+
+def build_index(vectors: np.ndarray, index_type: str, metric: Optional[int] = None) -> Any:
+    """
+    Build an index of a given type over vectors, training its quantizer on them first.
+
+    Args:
+        vectors: float32 array of shape (n, dim); row i of the array becomes row i of the index
+        index_type: One of INDEX_TYPES; corpora under its MIN_VECTORS get a flat index
+        metric: FAISS metric (defaults to L2)
+
+    Returns:
+        FAISS index
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    metric = faiss.METRIC_L2 if metric is None else metric
+    index = faiss.index_factory(dim, get_factory_string(index_type, dim, count), metric)
+
+    if not index.is_trained:
+        training = vectors
+        if count > MAX_TRAINING_VECTORS:
+            rows = np.random.default_rng(0).choice(count, MAX_TRAINING_VECTORS, replace=False)
+            training = vectors[np.sort(rows)]
+        index.train(training)
+    if get_index_kind(index) == HNSW:
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if isinstance(index, faiss.IndexIVFPQ):
+        # Precomputed tables cost nlist * 256 floats per PQ byte in every process; skip them
+        index.use_precomputed_table = -1
+    index.add(vectors)
+    return configure_index(index)
+
+
+def convert_index(index: Any, index_type: str) -> Any:
+    """
+    Rebuild an index as another type, keeping its rows in order.
+
+    Vectors are read back from the index, so converting a flat index is lossless;
+    converting a quantized one carries over its quantization error.
+
+    Args:
+        index: FAISS index
+        index_type: One of INDEX_TYPES
+
+    Returns:
+        The same index if it already has that type, or is too small to quantize; otherwise a new index
+    """
+    kind = get_index_kind(index)
+    if kind == index_type or (kind == FLAT and index.ntotal < MIN_VECTORS[index_type]):
+        return index
+    if kind == IVFPQ:
+        import faiss
+        faiss.extract_index_ivf(index).make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    return build_index(vectors, index_type, index.metric_type)
+
+
+def renumber_removed(index: Any, removed_rows: np.ndarray) -> Any:
+    """
+    Renumber the rows of an index after remove_ids, as flat indexes do themselves.
+
+    Flat and SQ8 indexes shift the rows after a removed one down, which is the
+    numbering FAISS vector stores assume. IVF indexes keep the ids they stored,
+    so these are shifted down in place here; HNSW indexes can't remove vectors.
+
+    Args:
+        index: FAISS index that removed_rows were just removed from
+        removed_rows: Sorted int64 array of the removed rows
+
+    Returns:
+        The same index
+    """
+    import faiss
+
+    if get_index_kind(index) != IVFPQ or not len(removed_rows):
+        return index
+    invlists = faiss.extract_index_ivf(index).invlists
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            # A view of the list's ids; every id drops by the number of removed rows below it
+            ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+            ids -= np.searchsorted(removed_rows, ids)
+    return index
+
+
+def read_index(path: str, mmap: bool = True) -> Any:
+    """
+    Read a saved index, memory-mapping it if requested.
+
+    A memory-mapped index is read-only and backed by the page cache, so every
+    process serving the same file shares one copy of its vectors: flat, HNSW and
+    SQ8 indexes map their vector or code arrays, IVF indexes their inverted lists.
+
+    Args:
+        path: Index file written by faiss.write_index
+        mmap: Map the file instead of reading it into memory
+
+    Returns:
+        FAISS index
+    """
+    import faiss
+
+    if not mmap:
+        return configure_index(faiss.read_index(path))
+    with open(path, "rb") as f:
+        # IVF index headers start with "Iw"
+        is_ivf = f.read(2) == b"Iw"
+    return configure_index(faiss.read_index(path, faiss.IO_FLAG_MMAP if is_ivf else faiss.IO_FLAG_MMAP_IFC))
+
+
+def get_search_params(index: Any, rows: np.ndarray) -> Optional[Any]:
+    """
+    Get search parameters that restrict a search to some rows.
+
+    Approximate indexes only look at part of the corpus per query, so a filter
+    leaving a fraction f of the rows would return about f of the hits. HNSW
+    efSearch and IVF nprobe are widened by 1 / f to compensate, up to searching
+    every IVF list; a filter too selective for HNSW is left to exact_search().
+
+    Args:
+        index: FAISS index
+        rows: Sorted int64 array of allowed rows
+
+    Returns:
+        FAISS search parameters, or None if the rows should be searched with exact_search()
+    """
+    import faiss
+
+    selector = faiss.IDSelectorBatch(rows)
+    kind = get_index_kind(index)
+    widen = index.ntotal / max(len(rows), 1)
+    if kind == HNSW:
+        ef_search = math.ceil(index.hnsw.efSearch * widen)
+        if ef_search > HNSW_MAX_EF_SEARCH:
+            return None
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    if kind == IVFPQ:
+        ivf = faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, math.ceil(ivf.nprobe * widen)))
+    return faiss.SearchParameters(sel=selector)
+
+
+def exact_search(index: Any, query_vector: np.ndarray, k: int, rows: np.ndarray) -> np.ndarray:
+    """
+    Search a subset of rows exhaustively, from the vectors stored in the index.
+
+    Args:
+        index: FAISS index whose vectors can be reconstructed (flat, HNSW or SQ8)
+        query_vector: float32 array of shape (1, dim)
+        k: Number of rows to return
+        rows: Sorted int64 array of rows to search
+
+    Returns:
+        Up to k rows, best first
+    """
+    import faiss
+
+    query = query_vector[0]
+    distances = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), EXACT_SEARCH_BATCH):
+        vectors = index.reconstruct_batch(rows[start:start + EXACT_SEARCH_BATCH])
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            distances[start:start + len(vectors)] = -(vectors @ query)
+        else:
+            distances[start:start + len(vectors)] = ((vectors - query) ** 2).sum(axis=1)
+    k = min(k, len(rows))
+    if k <= 0:
+        return rows[:0]
+    best = np.argpartition(distances, k - 1)[:k]
+    return rows[best[np.argsort(distances[best], kind="stable")]]
@@ -0,0 +1,601 @@
+import io
+import os
+import re
+import csv
+import json
+import fnmatch
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Chunking parameters for indexed documents
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SEPARATORS = ["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+
+# Characters of text handed to a worker at a time. Files are read one segment at a
+# time and only a few segments per worker are in flight, so memory use depends on
+# this and the number of workers, not on the size of the files.
+SEGMENT_SIZE = 1 << 20
+# Characters read from a JSON file at a time while looking for the next record
+JSON_READ_SIZE = 1 << 16
+# Below this many bytes of input, splitting in-process is faster than starting workers
+PARALLEL_MIN_BYTES = 4 * SEGMENT_SIZE
+
+# Record fields used as the title of a product sheet entry
+TITLE_FIELDS = ("title", "name", "product", "product_name")
+
+# Chunking strategies: generic recursive splitting with overlap, or one chunk per
+# "##" section of a Markdown-style document
+RECURSIVE = "recursive"
+SECTIONS = "sections"
+# Sections longer than this are split further, each piece keeping the section heading
+MAX_SECTION_SIZE = 2 * CHUNK_SIZE
+SECTION_HEADING = re.compile(r"^##(?!#)[ \t]*(.*?)[ \t#]*$", re.MULTILINE)
+
+# Chunking of the bundled documents, as (source pattern, strategy, section type).
+# MEDASSIST_CHUNKING adds rules in front of these.
+DEFAULT_CHUNKING_RULES = (
+    ("biofina_medications.txt", SECTIONS, "product"),
+    ("common_symptoms.txt", SECTIONS, "symptom"),
+    ("medical_advice.txt", SECTIONS, "advice"),
+)
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> "RecursiveCharacterTextSplitter":
+    """
+    Get the text splitter used to chunk documents before indexing.
+
+    Args:
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared by consecutive chunks
+
+    Returns:
+        RecursiveCharacterTextSplitter instance
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=SEPARATORS,
+        length_function=len
+    )
+
+
+@lru_cache(maxsize=None)
+def get_chunking_rules() -> Tuple[Tuple[str, str, Optional[str]], ...]:
+    """
+    Get the rules choosing how each source is chunked.
+
+    MEDASSIST_CHUNKING holds comma-separated "pattern=strategy[:section type]"
+    entries, e.g. "faq/*.md=sections:faq,notes.txt=recursive", which take
+    precedence over DEFAULT_CHUNKING_RULES.
+
+    Returns:
+        Tuple of (source pattern, strategy, section type) rules, first match wins
+    """
+    rules = []
+    for entry in os.getenv("MEDASSIST_CHUNKING", "").split(","):
+        if not entry.strip():
+            continue
+        pattern, _, rule = entry.partition("=")
+        strategy, _, section_type = rule.strip().partition(":")
+        if strategy not in (RECURSIVE, SECTIONS):
+            raise ValueError(f"Unknown chunking strategy {strategy!r} in MEDASSIST_CHUNKING")
+        rules.append((pattern.strip(), strategy, section_type.strip() or None))
+    return tuple(rules) + DEFAULT_CHUNKING_RULES
+
+
+def get_chunking_rule(source: str) -> Tuple[str, Optional[str]]:
+    """
+    Choose the chunking strategy for a source.
+
+    Args:
+        source: Source path, relative to the data directory
+
+    Returns:
+        Tuple of (strategy, section type); RECURSIVE with no section type if no rule matches
+    """
+    source = source.replace(os.sep, "/")
+    for pattern, strategy, section_type in get_chunking_rules():
+        if fnmatch.fnmatch(source, pattern) or fnmatch.fnmatch(os.path.basename(source), pattern):
+            return strategy, section_type
+    return RECURSIVE, None
+
+
+def format_chunking_rule(rule: Tuple[str, Optional[str]]) -> str:
+    """Describe a chunking rule as a string, e.g. "sections:product", for the index manifest."""
+    strategy, section_type = rule
+    return f"{strategy}:{section_type}" if section_type else strategy
+
+
+def get_section_metadata(heading: str, section_type: Optional[str]) -> Dict[str, str]:
+    """
+    Build the metadata of a section chunk.
+
+    Args:
+        heading: Section heading
+        section_type: Kind of section, e.g. "product" or "symptom" (optional)
+
+    Returns:
+        Metadata with the section heading and, if the type is known, the type and the subject under its name
+    """
+    metadata = {"section": heading}
+    if section_type:
+        metadata["section_type"] = section_type
+        # Sections are named after their subject, e.g. {"product": "Biofina Sleep Aid"}
+        metadata[section_type] = heading
+    return metadata
+
+
+def split_sections(
+    text: str,
+    section_type: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    max_section_size: int = MAX_SECTION_SIZE
+) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Split a Markdown-style document into one chunk per "##" section.
+
+    Subsections stay with their section. Text before the first section is a
+    chunk of its own unless it is only headings. Sections longer than
+    max_section_size are split with the recursive splitter, and every piece
+    starts with the section heading.
+
+    Args:
+        text: Document text
+        section_type: Kind of section, recorded in the metadata (optional)
+        chunk_size: Maximum characters per piece of an oversized section
+        chunk_overlap: Characters shared by consecutive pieces of an oversized section
+        max_section_size: Longest section kept as a single chunk
+
+    Returns:
+        List of (chunk text, metadata) pairs, in document order
+    """
+    starts = [match.start() for match in SECTION_HEADING.finditer(text)]
+    chunks: List[Tuple[str, Dict[str, str]]] = []
+
+    preamble = text[:starts[0]] if starts else text
+    if any(line.strip() and not line.lstrip().startswith("#") for line in preamble.splitlines()):
+        chunks.extend((chunk, {}) for chunk in get_text_splitter(chunk_size, chunk_overlap).split_text(preamble))
+
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        section = text[start:end].strip()
+        heading_line, _, body = section.partition("\n")
+        metadata = get_section_metadata(SECTION_HEADING.match(heading_line).group(1), section_type)
+        if len(section) <= max_section_size:
+            chunks.append((section, metadata))
+        else:
+            pieces = get_text_splitter(chunk_size, chunk_overlap).split_text(body)
+            chunks.extend((f"{heading_line}\n{piece}", metadata) for piece in pieces)
+    return chunks
+
+
+def iter_text_segments(path: str, segment_size: int = SEGMENT_SIZE, markdown: bool = False) -> Iterator[str]:
+    """
+    Read a text file as a sequence of segments of about segment_size characters.
+
+    Segments end at a blank line, or for Markdown before a heading, so chunks
+    rarely straddle two segments. A segment is cut at any line boundary once it
+    reaches twice the segment size, and inside a line if a line is that long.
+
+    Args:
+        path: Path of the file
+        segment_size: Target segment size in characters
+        markdown: Whether headings also count as segment boundaries
+
+    Yields:
+        Consecutive pieces of the file
+    """
+    lines: List[str] = []
+    size = 0
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in iter(lambda: f.readline(segment_size), ""):
+            if size >= segment_size:
+                if markdown and line.startswith("#"):
+                    # The heading starts the next segment
+                    yield "".join(lines)
+                    lines, size = [], 0
+                elif not line.strip() or size >= 2 * segment_size:
+                    lines.append(line)
+                    yield "".join(lines)
+                    lines, size = [], 0
+                    continue
+            lines.append(line)
+            size += len(line)
+    if lines:
+        yield "".join(lines)
+
+
+def iter_json_records(path: str) -> Iterator[Any]:
+    """
+    Read the records of a JSON file one at a time.
+
+    Supports a top-level array of records, a single record, and JSON Lines (or
+    any sequence of concatenated JSON values). Only the record being decoded
+    is held in memory, except for a single top-level object, which is read whole.
+
+    Args:
+        path: Path of the file
+
+    Yields:
+        Decoded records
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        position = 0
+        eof = False
+        in_array = None
+
+        while True:
+            # Skip whitespace, and the brackets and commas of a top-level array
+            while True:
+                while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ",")):
+                    position += 1
+                if position < len(buffer) or eof:
+                    break
+                buffer, position = f.read(JSON_READ_SIZE), 0
+                eof = not buffer
+
+            if position >= len(buffer):
+                return
+            if in_array is None:
+                in_array = buffer[position] == "["
+                if in_array:
+                    position += 1
+                    continue
+            if in_array and buffer[position] == "]":
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                # A value ending exactly at the end of the buffer (e.g. a number) may be cut short
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if not complete:
+                more = f.read(JSON_READ_SIZE)
+                eof = not more
+                buffer, position = buffer[position:] + more, 0
+                continue
+
+            yield record
+            position = end
+            if position > JSON_READ_SIZE:
+                buffer, position = buffer[position:], 0
+
+
+def iter_line_blocks(path: str, segment_size: int = SEGMENT_SIZE, quoted: bool = False) -> Iterator[str]:
+    """
+    Read a line-oriented file (JSON Lines, CSV rows) as blocks of whole records.
+
+    Args:
+        path: Path of the file
+        segment_size: Target block size in characters
+        quoted: Whether records may contain quoted newlines (CSV); blocks then only
+            end where the number of double quotes read so far is even
+
+    Yields:
+        Blocks of consecutive lines
+    """
+    lines: List[str] = []
+    size = 0
+    open_quote = False
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if quoted and line.count('"') % 2:
+                open_quote = not open_quote
+            if size >= segment_size and not open_quote:
+                yield "".join(lines)
+                lines, size = [], 0
+    if lines:
+        yield "".join(lines)
+
+
+def iter_csv_units(path: str, segment_size: int = SEGMENT_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Read a CSV file with a header row as blocks of rows, each carrying the header.
+
+    Args:
+        path: Path of the file
+        segment_size: Target block size in characters
+
+    Yields:
+        ("csv", (header, block)) units
+    """
+    blocks = iter_line_blocks(path, segment_size, quoted=True)
+    first = next(blocks, "")
+    # The header is the first record; it may itself span lines if a column name is quoted
+    open_quote = False
+    for i, char in enumerate(first):
+        if char == '"':
+            open_quote = not open_quote
+        elif char == "\n" and not open_quote:
+            header_end = i + 1
+            break
+    else:
+        header_end = len(first)
+    header, rest = first[:header_end], first[header_end:]
+    if rest.strip():
+        yield "csv", (header, rest)
+    for block in blocks:
+        yield "csv", (header, block)
+
+
+def format_value(value: Any) -> str:
+    """
+    Format a record field value as text.
+
+    Args:
+        value: Field value
+
+    Returns:
+        Text representation; lists are comma-separated and objects are "key: value" pairs
+    """
+    if isinstance(value, list):
+        return ", ".join(format_value(item) for item in value)
+    if isinstance(value, dict):
+        return "; ".join(f"{key}: {format_value(item)}" for key, item in value.items())
+    return str(value).strip()
+
+
+def format_record(record: Any) -> str:
+    """
+    Format a product sheet record (JSON object or CSV row) as a Markdown document.
+
+    Args:
+        record: Record to format
+
+    Returns:
+        Document text with the record's title as a heading and one line per field
+    """
+    if not isinstance(record, dict):
+        return format_value(record)
+
+    title_field = next((field for field in TITLE_FIELDS if record.get(field)), None)
+    lines = [f"# {format_value(record[title_field])}", ""] if title_field else []
+    for key, value in record.items():
+        if key == title_field or key is None or value in (None, "", [], {}):
+            continue
+        lines.append(f"{str(key).replace('_', ' ').strip().capitalize()}: {format_value(value)}")
+    return "\n".join(lines)
+
+
+def iter_record_batches(records: Iterable[Any], segment_size: int = SEGMENT_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Group decoded records into batches of about segment_size characters.
+
+    Args:
+        records: Records to group
+        segment_size: Target batch size in characters, estimated from the records' JSON size
+
+    Yields:
+        ("records", list of records) units
+    """
+    batch: List[Any] = []
+    size = 0
+    for record in records:
+        batch.append(record)
+        size += len(json.dumps(record, default=str))
+        if size >= segment_size:
+            yield "records", batch
+            batch, size = [], 0
+    if batch:
+        yield "records", batch
+
+
+# Readers by file extension. Each yields a file's units of work as (kind, payload)
+# pairs; parsing, formatting and splitting the payload happens in split_unit, in
+# the worker processes. Every record is split on its own, so chunks never span records.
+READERS = {
+    ".txt": lambda path: (("text", segment) for segment in iter_text_segments(path)),
+    ".md": lambda path: (("text", segment) for segment in iter_text_segments(path, markdown=True)),
+    ".markdown": lambda path: (("text", segment) for segment in iter_text_segments(path, markdown=True)),
+    ".json": lambda path: iter_record_batches(iter_json_records(path)),
+    ".jsonl": lambda path: (("jsonl", block) for block in iter_line_blocks(path)),
+    ".csv": iter_csv_units,
+}
+
+SUPPORTED_EXTENSIONS = tuple(READERS)
+
+
+def iter_file_units(path: str, sections: bool = False) -> Iterator[Tuple[str, Any]]:
+    """
+    Read a source file as a sequence of units of work.
+
+    Args:
+        path: Path of the file
+        sections: Whether text is split into sections, so segments must end before headings
+
+    Yields:
+        (kind, payload) units for split_unit
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if sections and extension == ".txt":
+        extension = ".md"
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"Unsupported document type: {path}")
+    return reader(path)
+
+
+def get_unit_texts(kind: str, payload: Any) -> List[str]:
+    """
+    Turn a unit of work into the document texts it contains.
+
+    Args:
+        kind: Unit kind, as produced by the readers
+        payload: Unit payload
+
+    Returns:
+        Texts to split, one per segment or record
+    """
+    if kind == "text":
+        return [payload]
+    if kind == "csv":
+        header, block = payload
+        records = csv.DictReader(io.StringIO(header + block))
+    elif kind == "jsonl":
+        records = (json.loads(line) for line in block_lines(payload))
+    else:
+        records = payload
+    texts = (format_record(record) for record in records)
+    return [text for text in texts if text.strip()]
+
+
+def block_lines(block: str) -> Iterator[str]:
+    """Non-empty lines of a block. Only "\n" ends a line; JSON strings may contain other line separators."""
+    return (line for line in block.split("\n") if line.strip())
+
+
+def split_text(
+    text: str,
+    rule: Tuple[str, Optional[str]] = (RECURSIVE, None),
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Split a document text into chunks with a chunking rule.
+
+    Args:
+        text: Document text
+        rule: (strategy, section type), as returned by get_chunking_rule
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared by consecutive chunks
+
+    Returns:
+        List of (chunk text, metadata) pairs, in order
+    """
+    strategy, section_type = rule
+    if strategy == SECTIONS:
+        return split_sections(text, section_type, chunk_size, chunk_overlap)
+    return [(chunk, {}) for chunk in get_text_splitter(chunk_size, chunk_overlap).split_text(text)]
+
+
+def split_unit(
+    kind: str,
+    payload: Any,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    rule: Tuple[str, Optional[str]] = (RECURSIVE, None)
+) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Parse and split a unit of work into chunks. Runs in the worker processes.
+
+    Args:
+        kind: Unit kind, as produced by the readers
+        payload: Unit payload
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared by consecutive chunks
+        rule: Chunking rule for text units; records are always split on their own
+
+    Returns:
+        List of (chunk text, metadata) pairs, in order
+    """
+    if kind != "text":
+        rule = (RECURSIVE, None)
+    return [chunk for text in get_unit_texts(kind, payload) for chunk in split_text(text, rule, chunk_size, chunk_overlap)]
+
+
+def get_ingest_workers() -> int:
+    """
+    Get the number of worker processes used to split documents (MEDASSIST_INGEST_WORKERS).
+
+    Returns:
+        Number of workers, defaulting to the number of usable CPUs
+    """
+    workers = os.getenv("MEDASSIST_INGEST_WORKERS")
+    if workers:
+        return int(workers)
+    # CPUs this process may run on, which in a container can be fewer than the machine has
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def iter_chunks(
+    files: Iterable[Tuple[str, str]],
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> Iterator[Tuple[str, str, Dict[str, str]]]:
+    """
+    Stream the chunks of a set of files, parsing and splitting them in parallel.
+
+    Files are read lazily, a block at a time, in the calling process; records are
+    parsed and formatted and text is split in a pool of worker processes. At most
+    two units of work per worker are in flight, which bounds memory use, and
+    chunks are yielded in file order. Each file is chunked with the rule
+    get_chunking_rule chooses for its source.
+
+    Args:
+        files: (path, source) pairs
+        workers: Number of worker processes (defaults to get_ingest_workers())
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared by consecutive chunks
+
+    Yields:
+        (source, chunk text, chunk metadata) triples
+    """
+    files = list(files)
+    if workers is None:
+        workers = get_ingest_workers()
+    total_bytes = sum(os.path.getsize(path) for path, _ in files)
+    rules = {source: get_chunking_rule(source) for _, source in files}
+    units = (
+        (source, unit)
+        for path, source in files
+        for unit in iter_file_units(path, sections=rules[source][0] == SECTIONS)
+    )
+
+    if workers <= 1 or total_bytes < PARALLEL_MIN_BYTES:
+        for source, (kind, payload) in units:
+            for chunk, metadata in split_unit(kind, payload, chunk_size, chunk_overlap, rules[source]):
+                yield source, chunk, metadata
+        return
+
+    # Spawned workers are safe to start from threaded servers such as Streamlit
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending = deque()
+    try:
+        for source, (kind, payload) in units:
+            pending.append((source, pool.submit(split_unit, kind, payload, chunk_size, chunk_overlap, rules[source])))
+            if len(pending) >= 2 * workers:
+                source, future = pending.popleft()
+                for chunk, metadata in future.result():
+                    yield source, chunk, metadata
+        while pending:
+            source, future = pending.popleft()
+            for chunk, metadata in future.result():
+                yield source, chunk, metadata
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_documents(files: Iterable[Tuple[str, str]]) -> Iterator[Any]:
+    """
+    Stream the content of a set of files as documents, one per segment or record, without splitting.
+
+    Args:
+        files: (path, source) pairs; source is recorded in the document metadata
+
+    Yields:
+        Documents with the source in their metadata
+    """
+    from langchain.docstore.document import Document
+
+    for path, source in files:
+        for kind, payload in iter_file_units(path):
+            for text in get_unit_texts(kind, payload):
+                yield Document(page_content=text, metadata={"source": source})
@@ -0,0 +1,195 @@
+import os
+import re
+from typing import Callable, List, Optional, Tuple
+
+from utils.gemini_utils import DISCLAIMER, generate_gemini_text, is_gemini_configured, truncate_to_tokens
+from utils.prompt_utils import CONDENSE_QUESTION_PROMPT
+from utils.rate_limit_utils import CHARS_PER_TOKEN, estimate_tokens
+
+# Memory limits, overridable through environment variables
+DEFAULT_MAX_TURNS = 3
+DEFAULT_MAX_HISTORY_TOKENS = 512
+# Longest the rolling summary of older turns may grow
+MAX_SUMMARY_TOKENS = 200
+# Longest part of each assistant reply kept verbatim in memory
+MAX_REPLY_TOKENS = 200
+
+SUMMARY_PROMPT = """
+Update the summary of a conversation with its next exchange. Keep the symptoms, conditions, medications and preferences the user mentioned, and the Biofina products that were recommended. Leave out greetings and general advice. Write at most five sentences.
+
+Current summary:
+{summary}
+
+Next exchange:
+User: {question}
+Assistant: {answer}
+
+Updated summary:
+"""
+
+
+def clean_message(text: str) -> str:
+    """
+    Reduce a chat message to the plain text worth remembering.
+
+    Args:
+        text: Message as shown in the chat, possibly with HTML and markdown
+
+    Returns:
+        Message without HTML tags, the standard disclaimer and extra whitespace
+    """
+    text = text.replace(DISCLAIMER.strip(), "")
+    text = re.sub(r"<[^>]+>", " ", text)
+    text = re.sub(r"\s+([.,;:!?])", r"\1", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def keep_last_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text to roughly its last max_tokens, at a word boundary.
+
+    Args:
+        text: Text to shorten
+        max_tokens: Token budget
+
+    Returns:
+        The end of the text, prefixed with an ellipsis if it didn't fit
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[-max(max_tokens - 1, 0) * CHARS_PER_TOKEN:]
+    return "... " + cut[cut.find(" ") + 1:] if " " in cut else "... " + cut
+
+
+def summarize_turn(summary: str, question: str, answer: str) -> str:
+    """
+    Fold one exchange into the rolling conversation summary.
+
+    Uses Gemini when it is available, and otherwise appends a short extract of the
+    exchange, dropping the oldest part of the summary once it is too long.
+
+    Args:
+        summary: Summary of the conversation so far (may be empty)
+        question: User message of the exchange
+        answer: Assistant reply of the exchange
+
+    Returns:
+        Updated summary
+    """
+    if is_gemini_configured():
+        try:
+            prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", question=question, answer=answer)
+            return truncate_to_tokens(generate_gemini_text(prompt), MAX_SUMMARY_TOKENS)
+        except Exception as e:
+            print(f"Error summarizing conversation, using an extract instead: {e}")
+
+    first_sentence = re.split(r"(?<=[.!?])\s", answer, maxsplit=1)[0]
+    extract = f"The user asked: {question} The assistant answered: {truncate_to_tokens(first_sentence, 40)}"
+    return keep_last_tokens(f"{summary} {extract}".strip(), MAX_SUMMARY_TOKENS)
+
+
+class ConversationMemory:
+    """
+    Bounded memory of one chat conversation.
+
+    The last max_turns exchanges are kept verbatim; each older exchange is folded
+    into a rolling summary once, when it drops out of that window. The history
+    given to the model is fitted to max_history_tokens, dropping the oldest
+    verbatim turns first, so the prompt size does not grow with the conversation.
+    """
+
+    def __init__(
+        self,
+        max_turns: Optional[int] = None,
+        max_history_tokens: Optional[int] = None,
+        summarizer: Callable[[str, str, str], str] = summarize_turn
+    ):
+        self.max_turns = max_turns or int(os.getenv("MEDASSIST_MEMORY_TURNS", DEFAULT_MAX_TURNS))
+        self.max_history_tokens = max_history_tokens or int(
+            os.getenv("MEDASSIST_MAX_HISTORY_TOKENS", DEFAULT_MAX_HISTORY_TOKENS)
+        )
+        self.summarizer = summarizer
+        self.turns: List[Tuple[str, str]] = []
+        self.summary = ""
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def is_empty(self) -> bool:
+        """Check whether there is any earlier conversation."""
+        return not self.turns and not self.summary
+
+    def clear(self) -> None:
+        """Forget the conversation."""
+        self.turns = []
+        self.summary = ""
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """
+        Remember a completed exchange.
+
+        Args:
+            question: User message
+            answer: Assistant reply as shown in the chat
+        """
+        self.turns.append((clean_message(question), truncate_to_tokens(clean_message(answer), MAX_REPLY_TOKENS)))
+        while len(self.turns) > self.max_turns:
+            old_question, old_answer = self.turns.pop(0)
+            self.summary = self.summarizer(self.summary, old_question, old_answer)
+
+    def format_history(self, max_tokens: Optional[int] = None) -> str:
+        """
+        Format the conversation for a prompt, within a token budget.
+
+        Args:
+            max_tokens: Token budget (defaults to max_history_tokens)
+
+        Returns:
+            Summary of older turns followed by the most recent turns, or "" if there are none
+        """
+        if max_tokens is None:
+            max_tokens = self.max_history_tokens
+
+        # Take turns newest first until the budget is used up
+        remaining = max_tokens
+        recent: List[str] = []
+        for question, answer in reversed(self.turns):
+            turn = f"User: {question}\nAssistant: {answer}"
+            cost = estimate_tokens(turn)
+            if cost > remaining:
+                break
+            recent.append(turn)
+            remaining -= cost
+
+        parts = []
+        if self.summary and remaining > estimate_tokens("Earlier: "):
+            parts.append("Earlier: " + keep_last_tokens(self.summary, remaining - estimate_tokens("Earlier: ")))
+        parts.extend(reversed(recent))
+        return "\n\n".join(parts)
+
+    def condense_question(self, question: str) -> str:
+        """
+        Rewrite a follow-up question as a standalone query for retrieval.
+
+        Uses Gemini with the condense-question prompt when it is available, and
+        otherwise prefixes the previous question so retrieval still sees its topic.
+
+        Args:
+            question: Latest user message
+
+        Returns:
+            Standalone query, or the question itself if there is no earlier conversation
+        """
+        if self.is_empty():
+            return question
+
+        if is_gemini_configured():
+            try:
+                prompt = CONDENSE_QUESTION_PROMPT.format(chat_history=self.format_history(), question=question)
+                return generate_gemini_text(prompt) or question
+            except Exception as e:
+                print(f"Error condensing question, using it as is: {e}")
+
+        if self.turns:
+            return f"{self.turns[-1][0]} {question}"
+        return question
@@ -0,0 +1,448 @@
+import os
+import sys
+import json
+import time
+import inspect
+import asyncio
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Histogram bucket bounds: stage durations in seconds, and sizes in tokens or characters
+DURATION_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+SIZE_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+# Every exported metric, as name: (type, help text, histogram buckets)
+METRICS = {
+    "medassist_stage_duration_seconds": ("histogram", "Time spent in each request stage", DURATION_BUCKETS),
+    "medassist_stage_first_item_seconds": ("histogram", "Time until a streaming stage produced its first item", DURATION_BUCKETS),
+    "medassist_prompt_tokens": ("histogram", "Estimated tokens sent to Gemini per request", SIZE_BUCKETS),
+    "medassist_response_chars": ("histogram", "Characters in each generated response", SIZE_BUCKETS),
+    "medassist_cache_requests_total": ("counter", "Cache lookups by cache and result", None),
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, rendered in the Prometheus text format.
+
+    Recording a value is a bucket lookup and two additions under a lock, so
+    instrumenting a request costs microseconds. Metrics are per process; with
+    several API workers, each worker reports its own.
+    """
+
+    def __init__(self, metrics: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = METRICS):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # (name, labels) -> [bucket counts, sum] for histograms, or a number for counters
+        self._series: Dict[Tuple[str, Labels], Any] = {}
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        """
+        Record a value in a histogram.
+
+        Args:
+            name: Histogram name, from METRICS
+            value: Observed value
+            labels: Label pairs of the series
+        """
+        buckets = self.metrics[name][2]
+        index = bisect_left(buckets, value)
+        key = (name, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def increment(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        """
+        Add to a counter.
+
+        Args:
+            name: Counter name, from METRICS
+            labels: Label pairs of the series
+            amount: Amount to add
+        """
+        key = (name, labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def clear(self) -> None:
+        """Forget every recorded value."""
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            Exposition text
+        """
+        with self._lock:
+            series = {key: (list(value[0]), value[1]) if isinstance(value, list) else value
+                      for key, value in self._series.items()}
+
+        lines: List[str] = []
+        for name, (metric_type, help_text, buckets) in self.metrics.items():
+            keys = sorted(key for key in series if key[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for _, labels in keys:
+                value = series[(name, labels)]
+                if metric_type == "counter":
+                    lines.append(f"{name}{format_labels(labels)} {format_number(value)}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(buckets + (float("inf"),), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', format_number(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_number(total)}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def format_labels(labels: Labels) -> str:
+    """Format label pairs as {key="value",...}, escaping the values."""
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def format_number(value: float) -> str:
+    """Format a sample value the way Prometheus expects."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+@lru_cache(maxsize=None)
+def get_metrics_registry() -> MetricsRegistry:
+    """
+    Get the process-wide metrics registry.
+
+    Returns:
+        MetricsRegistry instance
+    """
+    return MetricsRegistry()
+
+
+def render_metrics() -> str:
+    """Render the process metrics in the Prometheus text format."""
+    return get_metrics_registry().render()
+
+
+class TraceLog:
+    """
+    Structured log of finished spans, one JSON object per line.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+@lru_cache(maxsize=None)
+def get_trace_log() -> Optional[TraceLog]:
+    """
+    Get the span log configured by MEDASSIST_TRACE_LOG.
+
+    "stderr" (or "-") logs to standard error; any other value is a file path to
+    append to. Logging is off if the variable is unset.
+
+    Returns:
+        TraceLog instance, or None if span logging is off
+    """
+    target = os.getenv("MEDASSIST_TRACE_LOG")
+    if not target:
+        return None
+    if target in ("stderr", "-"):
+        return TraceLog(sys.stderr)
+    return TraceLog(open(target, "a", encoding="utf-8", buffering=1))
+
+
+# Span currently running in this context, the parent of any span started inside it
+_current_span: ContextVar[Optional["Span"]] = ContextVar("medassist_current_span", default=None)
+
+
+class Span:
+    """
+    One timed stage of a request.
+
+    On finish, the duration is recorded under the stage and its outcome ("ok",
+    "error" or "cancelled"), and if span logging is on the span is logged with
+    its attributes and the ID of the request trace it belongs to.
+    """
+
+    __slots__ = ("stage", "attributes", "started", "first_item", "status", "trace_id", "parent")
+
+    def __init__(self, stage: str, attributes: Optional[Dict[str, Any]] = None):
+        self.stage = stage
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.first_item = None
+        parent = _current_span.get()
+        self.parent = parent.stage if parent is not None else None
+        if parent is not None:
+            self.trace_id = parent.trace_id
+        else:
+            self.trace_id = os.urandom(8).hex() if get_trace_log() is not None else None
+        self.started = time.perf_counter()
+
+    def set(self, **attributes: Any) -> None:
+        """Attach attributes to the span, for the span log."""
+        self.attributes.update(attributes)
+
+    def mark_first_item(self) -> None:
+        """Record that a streaming stage produced its first item."""
+        if self.first_item is None:
+            self.first_item = time.perf_counter() - self.started
+
+    def fail(self, error: BaseException) -> None:
+        """Record how the stage ended when it raised."""
+        cancelled = isinstance(error, (GeneratorExit, asyncio.CancelledError, KeyboardInterrupt))
+        self.status = "cancelled" if cancelled else "error"
+        if not cancelled:
+            self.attributes["error"] = type(error).__name__
+
+    def finish(self) -> None:
+        """Record the span's duration and log it."""
+        duration = time.perf_counter() - self.started
+        registry = get_metrics_registry()
+        registry.observe("medassist_stage_duration_seconds", duration, (("stage", self.stage), ("status", self.status)))
+        if self.first_item is not None:
+            registry.observe("medassist_stage_first_item_seconds", self.first_item, (("stage", self.stage),))
+
+        trace_log = get_trace_log()
+        if trace_log is not None:
+            record = {
+                "ts": time.time(),
+                "trace_id": self.trace_id,
+                "stage": self.stage,
+                "parent": self.parent,
+                "status": self.status,
+                "duration_ms": round(duration * 1000, 3),
+            }
+            if self.first_item is not None:
+                record["first_item_ms"] = round(self.first_item * 1000, 3)
+            record.update(self.attributes)
+            trace_log.write(record)
+
+
+@contextmanager
+def span(stage: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Time a block of code as a request stage.
+
+    Args:
+        stage: Stage name, used as the metric label
+        **attributes: Attributes for the span log
+
+    Yields:
+        The Span, to attach attributes or mark a first streamed item
+    """
+    current = Span(stage, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def annotate(**attributes: Any) -> None:
+    """Attach attributes to the span currently running, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def record_size(name: str, value: int) -> None:
+    """
+    Record a prompt or response size, in its histogram and on the current span.
+
+    Args:
+        name: "prompt_tokens" or "response_chars"
+        value: Size
+    """
+    get_metrics_registry().observe(f"medassist_{name}", value)
+    annotate(**{name: value})
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    """
+    Count cache lookups.
+
+    Args:
+        cache: Cache name, e.g. "response" or "embedding"
+        hits: Lookups that found an entry
+        misses: Lookups that didn't
+    """
+    registry = get_metrics_registry()
+    if hits:
+        registry.increment("medassist_cache_requests_total", (("cache", cache), ("result", "hit")), hits)
+    if misses:
+        registry.increment("medassist_cache_requests_total", (("cache", cache), ("result", "miss")), misses)
+    annotate(**{f"{cache}_cache_hits": hits, f"{cache}_cache_misses": misses})
+
+
+def traced(stage: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator timing every call of a function as a request stage.
+
+    Works for plain and async functions, and for sync and async generators, whose
+    span runs from the call until the generator is exhausted or closed and also
+    records the time to the first item.
+
+    Args:
+        stage: Stage name, used as the metric label
+
+    Returns:
+        Decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_generator_wrapper(*args, **kwargs):
+                current = Span(stage)
+                items = func(*args, **kwargs)
+                try:
+                    while True:
+                        # The span is made current for each step, since the steps may run in different contexts
+                        token = _current_span.set(current)
+                        try:
+                            item = await items.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _current_span.reset(token)
+                        current.mark_first_item()
+                        yield item
+                except BaseException as e:
+                    current.fail(e)
+                    raise
+                finally:
+                    await items.aclose()
+                    current.finish()
+            return async_generator_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                current = Span(stage)
+                items = func(*args, **kwargs)
+                try:
+                    while True:
+                        token = _current_span.set(current)
+                        try:
+                            item = next(items)
+                        except StopIteration:
+                            break
+                        finally:
+                            _current_span.reset(token)
+                        current.mark_first_item()
+                        yield item
+                except BaseException as e:
+                    current.fail(e)
+                    raise
+                finally:
+                    items.close()
+                    current.finish()
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                current = Span(stage)
+                token = _current_span.set(current)
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException as e:
+                    current.fail(e)
+                    raise
+                finally:
+                    _current_span.reset(token)
+                    current.finish()
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            current = Span(stage)
+            token = _current_span.set(current)
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                current.fail(e)
+                raise
+            finally:
+                _current_span.reset(token)
+                current.finish()
+        return wrapper
+
+    return decorator
+
+
+@lru_cache(maxsize=None)
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> threading.Thread:
+    """
+    Serve GET /metrics from a background thread, for processes without an HTTP API of their own.
+
+    Calling it again with the same port returns the running server's thread.
+
+    Args:
+        port: TCP port to listen on
+        host: Interface to bind
+
+    Returns:
+        The daemon thread running the server
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="medassist-metrics", daemon=True)
+    thread.start()
+    return thread
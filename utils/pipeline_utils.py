@@ -0,0 +1,356 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from utils.catalog_utils import find_relevant_products, get_catalog, join_words
+from utils.gemini_utils import (
+    DEFAULT_MODEL,
+    is_gemini_configured,
+    generate_gemini_response_async,
+    generate_gemini_response_stream_async,
+)
+from utils.metrics_utils import traced
+from utils.rate_limit_utils import ServiceBusyError
+
+# Per-stage time limits in seconds, overridable through environment variables
+DEFAULT_KEYWORD_TIMEOUT = 1.0
+DEFAULT_RETRIEVAL_TIMEOUT = 2.0
+DEFAULT_GENERATION_TIMEOUT = 60.0
+
+# Products named in the fallback reply when nothing matched the question
+FALLBACK_PRODUCT_TITLES = 5
+
+
+def format_fallback_response(relevant_docs: List[Dict[str, Any]]) -> str:
+    """
+    Build the simple response used when Gemini is not available.
+
+    Args:
+        relevant_docs: List of relevant documents
+
+    Returns:
+        Response listing the matched products
+    """
+    # Only products can be recommended; knowledge base passages are context for Gemini
+    relevant_docs = [doc for doc in relevant_docs if "content" not in doc]
+
+    # Check if we have any relevant documents
+    if not relevant_docs:
+        products = get_catalog().products
+        offers = join_words([product["title"] for product in products[:FALLBACK_PRODUCT_TITLES]])
+        if len(products) > FALLBACK_PRODUCT_TITLES:
+            offers = f"{len(products)} medications, including {offers}"
+        return (
+            "I'm sorry, I don't have specific information about that in our Biofina product database. "
+            f"Biofina Pharmaceuticals offers {offers}. If you're looking for information about these products, "
+            "please let me know. For all medical concerns, please consult with a healthcare professional."
+        )
+
+    # Extract medication names from the relevant docs
+    medications = [doc["title"] for doc in relevant_docs]
+    medication_list = ", ".join(medications)
+
+    # Create a simple response with the relevant medications
+    response = f"Based on your query, these medications might be helpful: {medication_list}\n\n"
+
+    # Add information about each relevant medication
+    for doc in relevant_docs:
+        response += f"**{doc['title']}**\n\n"
+
+        # Add image if available
+        if 'image_url' in doc and doc['image_url']:
+            response += f"<img src='{doc['image_url']}' width='200'/>\n\n"
+
+        # Add buy link if available
+        if 'buy_link' in doc and doc['buy_link']:
+            response += f"<a href='{doc['buy_link']}' target='_blank'><button style='color: white; background-color: #4CAF50; padding: 10px 20px; border: none; border-radius: 4px; cursor: pointer;'>Buy Now</button></a>\n\n"
+
+    response += "Remember to consult with a healthcare professional before starting any new medication."
+
+    return response
+
+
+# Event loop shared by synchronous callers, running in its own daemon thread. The async
+# Gemini client binds to the loop it was first used on, so every call must use the same one.
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the process-wide event loop used to run pipeline coroutines from synchronous code.
+
+    Returns:
+        Running event loop
+    """
+    global _background_loop
+    if _background_loop is None:
+        with _background_loop_lock:
+            if _background_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="medassist-pipeline", daemon=True).start()
+                _background_loop = loop
+    return _background_loop
+
+
+class MedAssistPipeline:
+    """
+    Async request pipeline: keyword matching and knowledge base retrieval, then generation.
+
+    Keyword matching and retrieval are independent and run concurrently in worker
+    threads. Every stage has its own timeout: a slow retrieval stage is dropped from
+    the context, and a slow generation falls back to the keyword-based response, as
+    does a generation rejected by the Gemini rate limiter or circuit breaker.
+    Coroutines can be awaited directly (e.g. from an ASGI app), and the *_sync
+    methods run them on a shared background loop for Streamlit.
+    """
+
+    def __init__(
+        self,
+        vector_store=None,
+        retriever: Optional[Callable[[str, Any, int], List[Dict[str, Any]]]] = None,
+        top_k: int = 2,
+        retrieval_k: int = 3,
+        model_name: str = DEFAULT_MODEL,
+        keyword_timeout: Optional[float] = None,
+        retrieval_timeout: Optional[float] = None,
+        generation_timeout: Optional[float] = None
+    ):
+        self.vector_store = vector_store
+        self.retriever = retriever
+        self.top_k = top_k
+        self.retrieval_k = retrieval_k
+        self.model_name = model_name
+        self.keyword_timeout = keyword_timeout or float(os.getenv("MEDASSIST_KEYWORD_TIMEOUT", DEFAULT_KEYWORD_TIMEOUT))
+        self.retrieval_timeout = retrieval_timeout or float(os.getenv("MEDASSIST_RETRIEVAL_TIMEOUT", DEFAULT_RETRIEVAL_TIMEOUT))
+        self.generation_timeout = generation_timeout or float(os.getenv("MEDASSIST_GENERATION_TIMEOUT", DEFAULT_GENERATION_TIMEOUT))
+
+        if self.retriever is None and self.vector_store is not None:
+            from utils.rag_utils import retrieve_context
+            self.retriever = retrieve_context
+
+    async def _run_stage(self, name: str, timeout: float, func: Callable, *args) -> List[Dict[str, Any]]:
+        """
+        Run a blocking retrieval stage in a worker thread, returning no documents on timeout or error.
+
+        Args:
+            name: Stage name, for error messages
+            timeout: Time limit in seconds
+            func: Function to run
+            *args: Arguments for func
+
+        Returns:
+            Documents found by the stage
+        """
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
+        except asyncio.TimeoutError:
+            print(f"Pipeline stage '{name}' timed out after {timeout}s")
+        except Exception as e:
+            print(f"Pipeline stage '{name}' failed: {e}")
+        return []
+
+    def _retrieve_passages(self, query: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Search the knowledge base, first moving to a vector store that covers the current product catalog.
+
+        Args:
+            query: User's question
+            filters: Metadata filters for the passages (optional)
+
+        Returns:
+            Retrieved passages
+        """
+        if self.vector_store is not None:
+            from utils.rag_utils import refresh_vector_store
+            self.vector_store = refresh_vector_store(self.vector_store)
+        # Filters are only passed when given, so custom retrievers without them keep working
+        args = (query, self.vector_store, self.retrieval_k) + ((filters,) if filters else ())
+        return self.retriever(*args)
+
+    @traced("retrieve")
+    async def retrieve(self, query: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Find the products and knowledge base passages relevant to a query.
+
+        Args:
+            query: User's question
+            filters: Metadata filters for the retrieved passages, e.g. {"product": "Biofina Sleep Aid"};
+                a "product" filter also limits the matched products
+
+        Returns:
+            Matched products followed by retrieved passages
+        """
+        stages = [self._run_stage("keyword", self.keyword_timeout, find_relevant_products, query, self.top_k)]
+        if self.retriever is not None:
+            stages.append(self._run_stage("retrieval", self.retrieval_timeout, self._retrieve_passages, query, filters))
+
+        results = await asyncio.gather(*stages)
+        products = results[0]
+        if filters and "product" in filters:
+            allowed = filters["product"]
+            allowed = set(allowed) if isinstance(allowed, (list, tuple, set, frozenset)) else {allowed}
+            products = [product for product in products if product["title"] in allowed]
+        if len(results) == 1:
+            return products
+
+        from utils.rag_utils import merge_relevant_docs
+        return merge_relevant_docs(products, results[1])
+
+    @traced("request")
+    async def run(
+        self,
+        query: str,
+        history: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer a query.
+
+        Args:
+            query: User's question
+            history: Earlier conversation, as formatted by ConversationMemory
+            filters: Metadata filters for retrieval (see retrieve())
+
+        Returns:
+            Dictionary with the response, the context documents and per-stage timings in seconds
+        """
+        started = time.perf_counter()
+        relevant_docs = await self.retrieve(query, filters)
+        retrieved = time.perf_counter()
+
+        response = None
+        if is_gemini_configured():
+            try:
+                response = await asyncio.wait_for(
+                    generate_gemini_response_async(
+                        query, relevant_docs=relevant_docs, model_name=self.model_name, history=history
+                    ),
+                    self.generation_timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"Pipeline stage 'generation' timed out after {self.generation_timeout}s")
+            except ServiceBusyError as e:
+                print(f"Pipeline stage 'generation' skipped: {e}")
+        if response is None:
+            response = format_fallback_response(relevant_docs)
+
+        return {
+            "response": response,
+            "relevant_docs": relevant_docs,
+            "timings": {
+                "retrieval": retrieved - started,
+                "generation": time.perf_counter() - retrieved,
+            },
+        }
+
+    @traced("request_stream")
+    async def stream(
+        self,
+        query: str,
+        relevant_docs: Optional[List[Dict[str, Any]]] = None,
+        history: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Answer a query, yielding the response as it is generated.
+
+        Args:
+            query: User's question
+            relevant_docs: Context documents, if already retrieved
+            history: Earlier conversation, as formatted by ConversationMemory
+
+        Yields:
+            Chunks of the response
+        """
+        if relevant_docs is None:
+            relevant_docs = await self.retrieve(query)
+
+        if not is_gemini_configured():
+            yield format_fallback_response(relevant_docs)
+            return
+
+        # The generation timeout bounds the whole stream, not each chunk
+        deadline = time.monotonic() + self.generation_timeout
+        chunks = generate_gemini_response_stream_async(
+            query, relevant_docs=relevant_docs, model_name=self.model_name, history=history
+        )
+        streamed_any = False
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(remaining, 0))
+                except StopAsyncIteration:
+                    break
+                streamed_any = True
+                yield chunk
+        except asyncio.TimeoutError:
+            print(f"Pipeline stage 'generation' timed out after {self.generation_timeout}s")
+            yield ("\n\n" if streamed_any else "") + format_fallback_response(relevant_docs)
+        except ServiceBusyError as e:
+            print(f"Pipeline stage 'generation' skipped: {e}")
+            yield format_fallback_response(relevant_docs)
+        finally:
+            await chunks.aclose()
+
+    def run_sync(
+        self,
+        query: str,
+        history: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer a query from synchronous code.
+
+        Args:
+            query: User's question
+            history: Earlier conversation, as formatted by ConversationMemory
+            filters: Metadata filters for retrieval (see retrieve())
+
+        Returns:
+            Same as run()
+        """
+        return asyncio.run_coroutine_threadsafe(self.run(query, history, filters), get_background_loop()).result()
+
+    def retrieve_sync(self, query: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Find relevant documents from synchronous code.
+
+        Args:
+            query: User's question
+            filters: Metadata filters for retrieval (see retrieve())
+
+        Returns:
+            Same as retrieve()
+        """
+        return asyncio.run_coroutine_threadsafe(self.retrieve(query, filters), get_background_loop()).result()
+
+    def stream_sync(
+        self,
+        query: str,
+        relevant_docs: Optional[List[Dict[str, Any]]] = None,
+        history: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Stream the answer to a query from synchronous code.
+
+        Args:
+            query: User's question
+            relevant_docs: Context documents, if already retrieved
+            history: Earlier conversation, as formatted by ConversationMemory
+
+        Yields:
+            Chunks of the response
+        """
+        loop = get_background_loop()
+        chunks = self.stream(query, relevant_docs, history)
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(chunks.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    break
+        finally:
+            asyncio.run_coroutine_threadsafe(chunks.aclose(), loop).result()
@@ -1,13 +1,5 @@
-from langchain.prompts import PromptTemplate
-
-def get_qa_prompt():
-    """
-    Create a prompt template for the QA system.
-    
-    Returns:
-        PromptTemplate object with the custom prompt
-    """
-    template = """
+# Templates are plain format strings, so callers that only fill them in never import langchain
+QA_PROMPT = """
 You are MedAssist, an AI medical assistant created by Biofina Pharmaceuticals. Your purpose is to provide helpful information about symptoms and suggest appropriate Biofina medications that might help with those symptoms.
 
 Context information is below:
@@ -30,9 +22,29 @@ Follow these guidelines in your response:
 
 Your response:
 """
+
+CONDENSE_QUESTION_PROMPT = """
+Given the following conversation and a follow-up question, rephrase the follow-up question to be a standalone question that captures all relevant context from the conversation history.
+
+Chat History:
+{chat_history}
+
+Follow Up Input: {question}
+
+Standalone Question:
+"""
+
+def get_qa_prompt():
+    """
+    Create a prompt template for the QA system.
+    
+    Returns:
+        PromptTemplate object with the custom prompt
+    """
+    from langchain.prompts import PromptTemplate
     
     return PromptTemplate(
-        template=template,
+        template=QA_PROMPT,
         input_variables=["context", "question"]
     )
 
@@ -43,18 +55,9 @@ def get_condense_question_prompt():
     Returns:
         PromptTemplate object with the custom prompt
     """
-    template = """
-Given the following conversation and a follow-up question, rephrase the follow-up question to be a standalone question that captures all relevant context from the conversation history.
-
-Chat History:
-{chat_history}
-
-Follow Up Input: {question}
-
-Standalone Question:
-"""
+    from langchain.prompts import PromptTemplate
     
     return PromptTemplate(
-        template=template,
+        template=CONDENSE_QUESTION_PROMPT,
         input_variables=["chat_history", "question"]
     )
\ No newline at end of file
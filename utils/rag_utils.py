@@ -1,8 +1,197 @@
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from utils.hf_utils import get_hf_embeddings
+import re
+import json
+import time
+import shutil
+import hashlib
+import weakref
+import threading
+import numpy as np
+from functools import lru_cache
+from utils.catalog_utils import get_catalog
+from utils.data_utils import DATA_DIR, get_source_files
+from utils.ingest_utils import RECURSIVE, format_chunking_rule, get_chunking_rule, iter_chunks, split_text
+from utils.bm25_utils import BM25Index
+from utils.cache_utils import get_query_embedding_cache, make_query_embedding_key
+from utils.index_utils import (
+    FLAT,
+    HNSW,
+    convert_index,
+    exact_search,
+    get_index_kind,
+    get_index_type,
+    get_search_params,
+    read_index,
+    renumber_removed,
+    use_mmap,
+)
+from utils.metrics_utils import record_cache, traced
 
+# langchain, FAISS and the embedding backends are imported by the functions that
+# build, load or search an index, so importing this module stays cheap
+
+# Location of the saved vector store. Each build is written to its own version
+# directory and CURRENT names the active one, so readers never see a half-written index.
+VECTOR_STORE_DIR = os.path.join(DATA_DIR, "vector_store")
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+# Files written by FAISS.save_local in each version directory
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+
+# Number of previous index versions kept around for readers that are still loading them
+KEEP_VERSIONS = 2
+
+# New chunks are embedded and added to the index this many at a time while streaming
+ADD_BATCH_SIZE = 256
+
+def get_embedding_model_name(embeddings):
+    """
+    Get a name identifying an embedding model, used to detect when the index must be rebuilt.
+    
+    Args:
+        embeddings: Embeddings instance
+        
+    Returns:
+        Model name string
+    """
+    return getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+def get_chunk_ids(source, chunks):
+    """
+    Assign content-based IDs to the chunks of one source file.
+    
+    A chunk keeps its ID as long as its text doesn't change, so only new or
+    edited chunks have to be embedded when a file is updated.
+    
+    Args:
+        source: Path of the file the chunks came from
+        chunks: List of chunk documents, in file order
+        
+    Returns:
+        List of chunk IDs
+    """
+    seen = {}
+    return [make_chunk_id(source, chunk.page_content, seen, get_chunk_metadata(chunk)) for chunk in chunks]
+
+def get_chunk_metadata(document):
+    """Get the metadata a chunk was given by the splitter, i.e. everything but its source."""
+    return {key: value for key, value in document.metadata.items() if key != "source"}
+
+def make_chunk_id(source, text, seen, metadata=None):
+    """
+    Assign the content-based ID of the next chunk of a source file.
+    
+    Args:
+        source: Path of the file the chunk came from
+        text: Chunk text
+        seen: Occurrence counts of the file's chunks so far, keyed by text digest; updated in place
+        metadata: Chunk metadata from the splitter, if any; a chunk whose metadata changes gets a new ID
+        
+    Returns:
+        Chunk ID
+    """
+    # Identical chunks in the same file are told apart by their occurrence number
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    occurrence = seen.get(digest, 0)
+    seen[digest] = occurrence + 1
+    key = f"{source}\0{occurrence}\0{text}"
+    if metadata:
+        key += "\0" + json.dumps(metadata, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def hash_file(path):
+    """
+    Compute the content hash of a file.
+    
+    Args:
+        path: Path to the file
+        
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def save_vector_store(vector_store, manifest, vector_store_path=VECTOR_STORE_DIR):
+    """
+    Save a vector store as a new version and atomically make it the current one.
+    
+    Args:
+        vector_store: FAISS vector store to save
+        manifest: Manifest describing the indexed files and chunks
+        vector_store_path: Directory holding the index versions
+    """
+    os.makedirs(vector_store_path, exist_ok=True)
+    
+    version = f"v-{time.time_ns()}"
+    version_path = os.path.join(vector_store_path, version)
+    vector_store.save_local(version_path)
+    with open(os.path.join(version_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    
+    # Swap the pointer to the new version in a single rename
+    pointer_tmp = os.path.join(vector_store_path, CURRENT_FILE + ".tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(vector_store_path, CURRENT_FILE))
+    
+    # Remove versions older than the ones still kept for readers
+    versions = sorted(
+        name for name in os.listdir(vector_store_path)
+        if name.startswith("v-") and os.path.isdir(os.path.join(vector_store_path, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(vector_store_path, name), ignore_errors=True)
+
+def get_current_version_path(vector_store_path=VECTOR_STORE_DIR):
+    """
+    Get the directory of the current index version.
+    
+    Args:
+        vector_store_path: Directory holding the index versions
+        
+    Returns:
+        Path of the current version, or None if no index has been saved
+    """
+    pointer = os.path.join(vector_store_path, CURRENT_FILE)
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as f:
+            version_path = os.path.join(vector_store_path, f.read().strip())
+        if os.path.isdir(version_path):
+            return version_path
+    
+    # Stores saved before versioning live directly in the directory
+    if os.path.exists(os.path.join(vector_store_path, INDEX_FILE)):
+        return vector_store_path
+    
+    return None
+
+def load_faiss_store(version_path, embeddings, mmap=False):
+    """
+    Load a saved vector store, memory-mapping its index if requested.
+    
+    Args:
+        version_path: Directory written by save_vector_store
+        embeddings: Embeddings used to embed queries
+        mmap: Map the index read-only instead of reading it into memory (see index_utils.read_index)
+        
+    Returns:
+        FAISS vector store
+    """
+    import pickle
+    from langchain_community.vectorstores import FAISS
+    
+    index = read_index(os.path.join(version_path, INDEX_FILE), mmap)
+    # The docstore pickle is only ever written by save_vector_store
+    with open(os.path.join(version_path, DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+@traced("index_build")
 def create_vector_store(documents):
     """
     Create a vector store from documents for retrieval.
@@ -13,26 +202,42 @@ def create_vector_store(documents):
     Returns:
         FAISS vector store with indexed documents
     """
-    # Split documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
-        length_function=len
-    )
+    from langchain.docstore.document import Document
+    from langchain_community.vectorstores import FAISS
+    from utils.hf_utils import get_hf_embeddings
     
-    chunks = text_splitter.split_documents(documents)
-    
-    # Create embeddings using HuggingFace model
+    # Split documents into chunks, grouped by source file
     embeddings = get_hf_embeddings()
+    index_type = get_index_type()
+    
+    manifest = {"embedding_model": get_embedding_model_name(embeddings), "index_type": index_type, "files": {}}
+    all_chunks, all_ids = [], []
+    for document in documents:
+        # Sources are recorded relative to the data directory, as in VectorIndexManager.sync
+        source = document.metadata.get("source", "")
+        if os.path.isabs(source):
+            source = os.path.relpath(source, DATA_DIR)
+            document.metadata["source"] = source
+        rule = get_chunking_rule(source)
+        chunks = [
+            Document(page_content=text, metadata={**document.metadata, **metadata})
+            for text, metadata in split_text(document.page_content, rule)
+        ]
+        entry = manifest["files"].setdefault(
+            source, {"hash": None, "chunking": format_chunking_rule(rule), "chunks": []}
+        )
+        ids = get_chunk_ids(source, chunks)
+        # The file hash is unknown here; the next sync re-hashes it without re-embedding unchanged chunks
+        entry["chunks"].extend(ids)
+        all_chunks.extend(chunks)
+        all_ids.extend(ids)
     
     # Create vector store
-    vector_store = FAISS.from_documents(chunks, embeddings)
+    vector_store = FAISS.from_documents(all_chunks, embeddings, ids=all_ids)
+    vector_store.index = convert_index(vector_store.index, index_type)
     
-    # Save vector store locally if needed
-    vector_store_path = os.path.join("data", "vector_store")
-    os.makedirs(vector_store_path, exist_ok=True)
-    vector_store.save_local(vector_store_path)
+    # Save vector store locally
+    save_vector_store(vector_store, manifest)
     
     return vector_store
 
@@ -43,27 +248,560 @@ def load_vector_store():
     Returns:
         FAISS vector store loaded from disk
     """
-    vector_store_path = os.path.join("data", "vector_store")
+    from utils.hf_utils import get_hf_embeddings
     
-    if os.path.exists(vector_store_path):
+    version_path = get_current_version_path()
+    
+    if version_path is not None:
         embeddings = get_hf_embeddings()
-        vector_store = FAISS.load_local(vector_store_path, embeddings)
+        vector_store = load_faiss_store(version_path, embeddings, mmap=use_mmap())
         return vector_store
     else:
-        raise FileNotFoundError(f"Vector store not found at {vector_store_path}")
+        raise FileNotFoundError(f"Vector store not found at {VECTOR_STORE_DIR}")
+
+class VectorIndexManager:
+    """
+    Keeps the saved vector store in sync with the documents in the data directory.
+    
+    A manifest records the content hash and chunk IDs of every indexed file. On sync,
+    only files whose hash changed are re-split, only chunks that are new are embedded,
+    and chunks that no longer exist are deleted before the updated index is swapped in.
+    """
+    
+    def __init__(self, data_dir=DATA_DIR, vector_store_path=VECTOR_STORE_DIR, embeddings=None):
+        self.data_dir = data_dir
+        self.vector_store_path = vector_store_path
+        if embeddings is None:
+            from utils.hf_utils import get_hf_embeddings
+            embeddings = get_hf_embeddings()
+        self.embeddings = embeddings
+        self.vector_store = None
+        self.manifest = {
+            "embedding_model": get_embedding_model_name(self.embeddings),
+            "index_type": get_index_type(),
+            "files": {},
+        }
+        # Directory of the loaded version, and whether its index is memory-mapped (and so read-only)
+        self.version_path = None
+        self.mapped = False
+    
+    def load(self):
+        """
+        Load the saved vector store and its manifest, if they exist and match the embedding model.
+        
+        Returns:
+            FAISS vector store, or None if there is no usable saved index
+        """
+        version_path = get_current_version_path(self.vector_store_path)
+        manifest_path = os.path.join(version_path, MANIFEST_FILE) if version_path else None
+        if manifest_path is None or not os.path.exists(manifest_path):
+            return None
+        
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        
+        # Vectors from a different embedding model can't be mixed with new ones, and an
+        # index of another type is rebuilt from exact vectors rather than re-quantized
+        if manifest.get("embedding_model") != self.manifest["embedding_model"]:
+            return None
+        if manifest.get("index_type", FLAT) != self.manifest["index_type"]:
+            return None
+        
+        self.mapped = use_mmap()
+        self.vector_store = load_faiss_store(version_path, self.embeddings, mmap=self.mapped)
+        self.version_path = version_path
+        self.manifest = manifest
+        return self.vector_store
+    
+    @traced("index_sync")
+    def sync(self):
+        """
+        Bring the index up to date with the source files, embedding only what changed.
+        
+        Changed files are streamed through the chunking pipeline, and new chunks are
+        embedded and added in batches as they arrive, so the documents are never
+        held in memory all at once.
+        
+        Returns:
+            FAISS vector store covering the current source files, or None if there are no documents
+        """
+        from langchain.docstore.document import Document
+        
+        if self.vector_store is None:
+            self.load()
+        
+        old_files = self.manifest["files"]
+        new_files = {}
+        changed = []
+        
+        for path in get_source_files(self.data_dir):
+            source = os.path.relpath(path, self.data_dir)
+            file_hash = hash_file(path)
+            # Files are re-split when their content or their chunking rule changes
+            chunking = format_chunking_rule(get_chunking_rule(source))
+            old_entry = old_files.get(source)
+            if (
+                old_entry is not None and old_entry["hash"] == file_hash
+                and old_entry.get("chunking", RECURSIVE) == chunking
+            ):
+                new_files[source] = old_entry
+            else:
+                new_files[source] = {"hash": file_hash, "chunking": chunking, "chunks": []}
+                changed.append((path, source))
+        
+        if not changed and new_files.keys() == old_files.keys() and self.vector_store is not None:
+            return self.vector_store
+        
+        # The store is updated in place, so the retriever built over it goes out of date
+        updated_store = self.vector_store
+        
+        if self.mapped:
+            # A memory-mapped index is read-only; the update goes to an in-memory copy saved as a new version
+            self.vector_store.index = read_index(os.path.join(self.version_path, INDEX_FILE), mmap=False)
+            self.mapped = False
+        
+        # Re-split the changed files and diff their chunks against the indexed ones
+        old_ids = {
+            source: set(old_files[source]["chunks"]) if source in old_files else set()
+            for _, source in changed
+        }
+        seen = {source: {} for _, source in changed}
+        batch, batch_ids = [], []
+        for source, text, metadata in iter_chunks(changed):
+            chunk_id = make_chunk_id(source, text, seen[source], metadata)
+            new_files[source]["chunks"].append(chunk_id)
+            if chunk_id not in old_ids[source]:
+                batch.append(Document(page_content=text, metadata={"source": source, **metadata}))
+                batch_ids.append(chunk_id)
+                if len(batch) >= ADD_BATCH_SIZE:
+                    self._add_chunks(batch, batch_ids)
+                    batch, batch_ids = [], []
+        if batch:
+            self._add_chunks(batch, batch_ids)
+        
+        # Chunks that changed, and those of files removed from the data directory
+        stale_ids = []
+        for _, source in changed:
+            stale_ids.extend(old_ids[source] - set(new_files[source]["chunks"]))
+        for source, entry in old_files.items():
+            if source not in new_files:
+                stale_ids.extend(entry["chunks"])
+        if stale_ids and self.vector_store is not None:
+            if get_index_kind(self.vector_store.index) == HNSW:
+                # HNSW graphs can't remove vectors; delete from a flat copy and rebuild the graph below
+                self.vector_store.index = convert_index(self.vector_store.index, FLAT)
+            rows = {chunk_id: row for row, chunk_id in self.vector_store.index_to_docstore_id.items()}
+            removed_rows = np.sort(np.fromiter((rows[chunk_id] for chunk_id in stale_ids), dtype=np.int64))
+            self.vector_store.delete(stale_ids)
+            # The store renumbers its rows from 0; make the index return the same numbers
+            renumber_removed(self.vector_store.index, removed_rows)
+            if self.vector_store.index.ntotal == 0:
+                self.vector_store = None
+        
+        index_type = self.manifest["index_type"]
+        self.manifest = {"embedding_model": self.manifest["embedding_model"], "index_type": index_type, "files": new_files}
+        if self.vector_store is not None:
+            # New indexes start flat; they are quantized once they have enough vectors to train on
+            self.vector_store.index = convert_index(self.vector_store.index, index_type)
+            save_vector_store(self.vector_store, self.manifest, self.vector_store_path)
+        if updated_store is not None:
+            drop_hybrid_retriever(updated_store)
+        
+        return self.vector_store
+    
+    def _add_chunks(self, chunks, ids):
+        """Embed chunks and add them to the index, creating the index on the first batch."""
+        if self.vector_store is None:
+            from langchain_community.vectorstores import FAISS
+            self.vector_store = FAISS.from_documents(chunks, self.embeddings, ids=ids)
+        else:
+            self.vector_store.add_documents(chunks, ids=ids)
+
+# Catalog version each store from get_vector_store() covers, and the newest such store.
+# The product sheet in the knowledge base is generated from the catalog, so a store
+# built before a catalog edit is replaced by refresh_vector_store().
+_store_catalog_versions = weakref.WeakKeyDictionary()
+_latest_vector_store = None
+_refresh_lock = threading.Lock()
 
-def get_relevant_documents(query, vector_store, k=3):
+def get_vector_store():
     """
-    Retrieve relevant documents for a query.
+    Get an up-to-date vector store, loading the saved index and embedding only changed documents.
+    
+    Returns:
+        FAISS vector store, or None if there are no documents to index
+    """
+    global _latest_vector_store
+    catalog_version = get_catalog().version
+    vector_store = VectorIndexManager().sync()
+    if vector_store is not None:
+        _store_catalog_versions[vector_store] = catalog_version
+        _latest_vector_store = vector_store
+    return vector_store
+
+def refresh_vector_store(vector_store):
+    """
+    Get the vector store to search instead of one that predates the current product catalog.
+    
+    A store covering an older catalog version is replaced by a new one, synced from
+    the saved index with the regenerated product sheet; searches already running on
+    the old store are unaffected. One caller syncs while the others keep using the
+    store they have.
+    
+    Args:
+        vector_store: Vector store from get_vector_store() (other stores are returned unchanged)
+        
+    Returns:
+        FAISS vector store
+    """
+    synced_version = _store_catalog_versions.get(vector_store) if vector_store is not None else None
+    if synced_version is None:
+        return vector_store
+    catalog_version = get_catalog().version
+    if synced_version == catalog_version:
+        return vector_store
+    latest = _latest_vector_store
+    if latest is not None and _store_catalog_versions.get(latest) == catalog_version:
+        return latest
+    if not _refresh_lock.acquire(blocking=False):
+        return vector_store
+    try:
+        return get_vector_store() or vector_store
+    except Exception as e:
+        print(f"Error refreshing vector store: {e}")
+        return vector_store
+    finally:
+        _refresh_lock.release()
+
+# Reciprocal-rank fusion defaults: the rank constant, and how many candidates each retriever contributes
+RRF_K = 60
+HYBRID_CANDIDATES = 20
+
+# Metadata filters resolved to rows are memoized per retriever, as filters repeat across queries
+FILTER_CACHE_SIZE = 256
+
+def embed_query(query, embeddings):
+    """
+    Embed a query, reusing the vector of an earlier query with the same normalized text.
+    
+    Args:
+        query: User query string
+        embeddings: Embeddings instance of the vector store
+        
+    Returns:
+        Read-only float32 array of shape (1, dim)
+    """
+    cache = get_query_embedding_cache()
+    key = make_query_embedding_key(query, get_embedding_model_name(embeddings))
+    query_vector = cache.get(key)
+    record_cache("query_embedding", hits=int(query_vector is not None), misses=int(query_vector is None))
+    if query_vector is None:
+        query_vector = np.asarray([embeddings.embed_query(query)], dtype=np.float32)
+        # Shared by every search that hits the cache
+        query_vector.flags.writeable = False
+        cache.set(key, query_vector)
+    return query_vector
+
+def normalize_filters(filters):
+    """
+    Bring metadata filters into a canonical, hashable form.
+    
+    Args:
+        filters: Dictionary of metadata key to a value or a list of accepted values,
+            e.g. {"section_type": "product", "product": ["Biofina Sleep Aid"]}
+            
+    Returns:
+        Tuple of (key, tuple of accepted values) pairs sorted by key, or None if there are no filters
+    """
+    if not filters:
+        return None
+    normalized = []
+    for key, values in filters.items():
+        if isinstance(values, (list, tuple, set, frozenset)):
+            values = tuple(sorted(str(value) for value in values))
+        else:
+            values = (str(values),)
+        normalized.append((str(key), values))
+    return tuple(sorted(normalized))
+
+class HybridRetriever:
+    """
+    Retriever combining dense FAISS search with sparse BM25 keyword search.
+    
+    Both retrievers rank the same chunks, and their rankings are merged with
+    weighted reciprocal-rank fusion: each chunk scores sum(weight / (rrf_k + rank)).
+    Exact product names and dosages that embeddings blur are still found by BM25,
+    which gives better recall at a small k.
+    """
+    
+    def __init__(self, vector_store, dense_weight=1.0, sparse_weight=1.0, rrf_k=RRF_K, candidates=HYBRID_CANDIDATES):
+        self.vector_store = vector_store
+        self.index = vector_store.index
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        
+        # Chunks in FAISS row order, so both retrievers refer to chunks by row
+        self.documents = [
+            vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+            for row in range(vector_store.index.ntotal)
+        ]
+        self.bm25 = BM25Index([document.page_content for document in self.documents])
+        
+        # Rows of every (metadata key, value) pair, for resolving filters without scanning the chunks
+        self.metadata_rows = {}
+        for row, document in enumerate(self.documents):
+            for key, value in document.metadata.items():
+                if isinstance(value, str):
+                    self.metadata_rows.setdefault((key, value), []).append(row)
+        self._resolve_filters = lru_cache(maxsize=FILTER_CACHE_SIZE)(self._compute_filter)
+    
+    def _compute_filter(self, filters):
+        """
+        Resolve normalized metadata filters to the rows they allow.
+        
+        Args:
+            filters: Filters as returned by normalize_filters
+            
+        Returns:
+            Tuple of (sorted int64 array of allowed rows, FAISS search parameters selecting them,
+            or None if the rows are searched exactly)
+        """
+        allowed = None
+        for key, values in filters:
+            rows = set()
+            for value in values:
+                rows.update(self.metadata_rows.get((key, value), ()))
+            allowed = rows if allowed is None else allowed & rows
+        rows = np.fromiter(sorted(allowed), dtype=np.int64, count=len(allowed))
+        # The selector restricts the search inside FAISS, so the top k are drawn from the allowed rows only
+        return rows, get_search_params(self.index, rows)
+    
+    def filter_rows(self, filters):
+        """
+        Get the rows matching metadata filters.
+        
+        Args:
+            filters: Dictionary of metadata key to a value or a list of accepted values;
+                a chunk must match every key, and any of the values for a key
+                
+        Returns:
+            Sorted array of matching FAISS rows, or None if there are no filters
+        """
+        filters = normalize_filters(filters)
+        return None if filters is None else self._resolve_filters(filters)[0]
+    
+    def embed_query(self, query):
+        """
+        Embed a query once, for passing to several searches as query_vector.
+        
+        Args:
+            query: User query string
+            
+        Returns:
+            float32 array of shape (1, dim)
+        """
+        return embed_query(query, self.vector_store.embedding_function)
+    
+    @traced("dense_search")
+    def dense_search(self, query, k, filters=None, query_vector=None):
+        """
+        Rank chunks by embedding similarity.
+        
+        Args:
+            query: User query string
+            k: Number of rows to return
+            filters: Metadata filters applied inside the index search (optional)
+            query_vector: Embedding of the query from embed_query() (embedded here if not given)
+            
+        Returns:
+            List of FAISS rows, best first
+        """
+        filters = normalize_filters(filters)
+        rows, params = None, None
+        limit = len(self.documents)
+        if filters is not None:
+            rows, params = self._resolve_filters(filters)
+            limit = len(rows)
+        if min(k, limit) <= 0:
+            return []
+        if query_vector is None:
+            query_vector = self.embed_query(query)
+        if rows is not None and params is None:
+            return [int(row) for row in exact_search(self.index, query_vector, k, rows)]
+        _, found = self.index.search(query_vector, min(k, limit), params=params)
+        return [int(row) for row in found[0] if row >= 0]
+    
+    @traced("sparse_search")
+    def sparse_search(self, query, k, filters=None):
+        """
+        Rank chunks by BM25 score.
+        
+        Args:
+            query: User query string
+            k: Number of rows to return
+            filters: Metadata filters restricting the chunks that are scored (optional)
+            
+        Returns:
+            List of FAISS rows, best first
+        """
+        return [row for row, _ in self.bm25.search(query, k, allowed=self.filter_rows(filters))]
+    
+    def search(self, query, k=3, dense_weight=None, sparse_weight=None, filters=None, query_vector=None):
+        """
+        Retrieve the best chunks for a query by fusing dense and sparse rankings.
+        
+        Args:
+            query: User query string
+            k: Number of documents to retrieve
+            dense_weight: Weight of the dense ranking (defaults to the retriever's)
+            sparse_weight: Weight of the BM25 ranking (defaults to the retriever's); 0 disables a retriever
+            filters: Metadata filters, e.g. {"product": "Biofina Sleep Aid"} or
+                {"section_type": ["product", "symptom"], "source": "biofina_medications.txt"};
+                only matching chunks are ranked
+            query_vector: Embedding of the query from embed_query(), so several searches
+                for one query (e.g. unfiltered and filtered) embed it only once
+                
+        Returns:
+            List of relevant documents
+        """
+        dense_weight = self.dense_weight if dense_weight is None else dense_weight
+        sparse_weight = self.sparse_weight if sparse_weight is None else sparse_weight
+        if not self.documents:
+            return []
+        
+        candidates = max(k, self.candidates)
+        rankings = []
+        if dense_weight > 0:
+            rankings.append((dense_weight, self.dense_search(query, candidates, filters, query_vector)))
+        if sparse_weight > 0:
+            rankings.append((sparse_weight, self.sparse_search(query, candidates, filters)))
+        
+        fused = {}
+        for weight, rows in rankings:
+            for rank, row in enumerate(rows, start=1):
+                fused[row] = fused.get(row, 0.0) + weight / (self.rrf_k + rank)
+        
+        ranked = sorted(fused, key=lambda row: (-fused[row], row))
+        return [self.documents[row] for row in ranked[:k]]
+
+# Retrievers are built once per vector store and reused across queries
+_hybrid_retrievers = weakref.WeakKeyDictionary()
+_hybrid_retrievers_lock = threading.Lock()
+
+def drop_hybrid_retriever(vector_store):
+    """
+    Forget the hybrid retriever of a vector store that has been changed in place.
+    
+    Args:
+        vector_store: FAISS vector store
+    """
+    with _hybrid_retrievers_lock:
+        _hybrid_retrievers.pop(vector_store, None)
+
+def get_hybrid_retriever(vector_store):
+    """
+    Get the hybrid retriever for a vector store, building its BM25 index on first use.
+    
+    Args:
+        vector_store: FAISS vector store
+        
+    Returns:
+        HybridRetriever instance
+    """
+    with _hybrid_retrievers_lock:
+        retriever = _hybrid_retrievers.get(vector_store)
+        # VectorIndexManager.sync() drops the retrievers of stores it changes; other changes
+        # are caught when the store's index is replaced or its size changes
+        if (
+            retriever is None or retriever.index is not vector_store.index
+            or len(retriever.documents) != vector_store.index.ntotal
+        ):
+            retriever = HybridRetriever(vector_store)
+            _hybrid_retrievers[vector_store] = retriever
+    return retriever
+
+@traced("retrieval")
+def get_relevant_documents(query, vector_store, k=3, dense_weight=1.0, sparse_weight=1.0, filters=None,
+                           query_vector=None):
+    """
+    Retrieve relevant documents for a query with hybrid dense and BM25 search.
     
     Args:
         query: User query string
         vector_store: Vector store to search in
         k: Number of documents to retrieve
+        dense_weight: Fusion weight of the embedding similarity ranking
+        sparse_weight: Fusion weight of the BM25 keyword ranking
+        filters: Metadata filters such as {"product": ..., "section_type": ..., "source": ...} (optional)
+        query_vector: Embedding of the query from embed_query(), to reuse it across calls (optional)
         
     Returns:
         List of relevant documents
     """
-    retriever = vector_store.as_retriever(search_kwargs={"k": k})
-    relevant_docs = retriever.get_relevant_documents(query)
-    return relevant_docs
\ No newline at end of file
+    retriever = get_hybrid_retriever(vector_store)
+    return retriever.search(
+        query, k=k, dense_weight=dense_weight, sparse_weight=sparse_weight, filters=filters, query_vector=query_vector
+    )
+
+def get_document_title(document):
+    """
+    Get a short title for a retrieved chunk: its first heading, or its source file.
+    
+    Args:
+        document: Retrieved document chunk
+        
+    Returns:
+        Title string
+    """
+    match = re.search(r"^#+\s*(.+)$", document.page_content, re.MULTILINE)
+    source = document.metadata.get("source", "knowledge base")
+    return f"{match.group(1).strip()} ({source})" if match else source
+
+def retrieve_context(query, vector_store, k=3, filters=None):
+    """
+    Retrieve knowledge base passages for a query, in the format used for model context.
+    
+    Args:
+        query: User query string
+        vector_store: Vector store to search in (None disables retrieval)
+        k: Number of passages to retrieve
+        filters: Metadata filters restricting the passages (optional)
+        
+    Returns:
+        List of passage dictionaries with title, content and source
+    """
+    if vector_store is None:
+        return []
+    
+    return [
+        {
+            "title": get_document_title(document),
+            "content": document.page_content,
+            "source": document.metadata.get("source", "")
+        }
+        for document in get_relevant_documents(query, vector_store, k=k, filters=filters)
+    ]
+
+def merge_relevant_docs(keyword_docs, retrieved_docs):
+    """
+    Merge keyword-matched products with retrieved passages into one context list.
+    
+    Products come first since they carry the images and purchase links; passages
+    with the same content are only included once.
+    
+    Args:
+        keyword_docs: Product dictionaries from keyword matching
+        retrieved_docs: Passage dictionaries from retrieve_context
+        
+    Returns:
+        Combined list of context documents
+    """
+    merged = list(keyword_docs)
+    seen_content = set()
+    for doc in retrieved_docs:
+        if doc["content"] not in seen_content:
+            seen_content.add(doc["content"])
+            merged.append(doc)
+    return merged
@@ -0,0 +1,439 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Default Gemini quota, matching the gemini-1.5-flash free tier; raise these for paid projects
+DEFAULT_REQUESTS_PER_MINUTE = 15
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+# Longest a request may queue for quota before it is rejected
+DEFAULT_MAX_WAIT = 30.0
+
+# Retry settings for transient Gemini errors
+DEFAULT_MAX_RETRIES = 3
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# Consecutive failures that open the circuit breaker, and how long it stays open
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# Rough characters-per-token ratio used to estimate prompt size without an API call
+CHARS_PER_TOKEN = 4
+
+
+class ServiceBusyError(Exception):
+    """Raised instead of calling Gemini when the call should not be made right now."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ServiceBusyError):
+    """Raised while the circuit breaker is open after repeated failures."""
+
+
+class RateLimitExceededError(ServiceBusyError):
+    """Raised when a request would have to queue longer than allowed for quota."""
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether a Gemini error is worth retrying.
+
+    Args:
+        error: Exception raised by the Gemini client
+
+    Returns:
+        True for throttling, timeouts and transient server errors
+    """
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+    return isinstance(error, (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+        asyncio.TimeoutError,
+        ConnectionError,
+    ))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Check whether a Gemini error means the request quota was exceeded.
+
+    Args:
+        error: Exception raised by the Gemini client
+
+    Returns:
+        True for HTTP 429 / RESOURCE_EXHAUSTED errors
+    """
+    return getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted"
+
+
+def get_backoff(attempt: int) -> float:
+    """
+    Get the jittered exponential delay before a retry.
+
+    Args:
+        attempt: Number of the attempt that just failed, starting at 1
+
+    Returns:
+        Delay in seconds, between half and all of the exponential backoff
+    """
+    backoff = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempt - 1))
+    return random.uniform(backoff / 2, backoff)
+
+
+def estimate_tokens(prompt_parts) -> int:
+    """
+    Estimate the number of input tokens in a prompt.
+
+    Args:
+        prompt_parts: Prompt string or list of prompt strings
+
+    Returns:
+        Approximate token count
+    """
+    if isinstance(prompt_parts, str):
+        prompt_parts = [prompt_parts]
+    return sum(len(part) for part in prompt_parts if isinstance(part, str)) // CHARS_PER_TOKEN + 1
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to one minute of budget, refilled continuously.
+
+    Reservations may take the balance below zero; the deficit is the time the
+    caller has to wait, so concurrent callers queue up in reservation order.
+    Not thread-safe on its own; RateLimiter guards it with a lock.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount tokens would be available, without reserving them."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def reserve(self, amount: float, now: float) -> None:
+        """Take amount tokens, going into deficit if there aren't enough."""
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by every caller in the process.
+
+    Callers reserve quota before each Gemini call and sleep until it is theirs, so
+    bursts turn into a bounded queue instead of a wall of 429 errors. A request that
+    would wait longer than max_wait is rejected with RateLimitExceededError.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        max_wait: float = DEFAULT_MAX_WAIT
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_wait = max_wait
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "waits": 0, "rejected": 0, "retries": 0, "rate_limited": 0}
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserve quota for one request.
+
+        Args:
+            tokens: Estimated tokens the request will use
+
+        Returns:
+            Seconds to wait before sending the request
+
+        Raises:
+            RateLimitExceededError: If the wait would exceed max_wait
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+
+            if wait > self.max_wait:
+                self.stats["rejected"] += 1
+                raise RateLimitExceededError(
+                    f"Gemini request quota exhausted; next slot in {wait:.0f}s", retry_after=wait
+                )
+
+            if self.requests is not None:
+                self.requests.reserve(1, now)
+            if self.tokens is not None:
+                self.tokens.reserve(tokens, now)
+            self.stats["requests"] += 1
+            if wait > 0:
+                self.stats["waits"] += 1
+            return wait
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Reserve quota for one request and block until it may be sent."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        """Reserve quota for one request and wait, without blocking the event loop, until it may be sent."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold back every caller, e.g. after the API reports that the quota was exceeded.
+
+        Args:
+            seconds: How long to pause from now
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.stats["rate_limited"] += 1
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for an unreliable dependency.
+
+    After failure_threshold consecutive failures the circuit opens and calls are
+    rejected immediately for reset_timeout seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state: "closed", "open" or "half-open"."""
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def is_open(self) -> bool:
+        """Check whether calls are currently being rejected."""
+        return self.state == "open"
+
+    def before_call(self) -> None:
+        """
+        Check that a call may be made.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or a trial call is already running
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(
+                    "Gemini is temporarily unavailable after repeated errors", retry_after=max(remaining, 1.0)
+                )
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        """Record a successful call, closing the circuit."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit if there were too many in a row."""
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_ignored(self) -> None:
+        """Record a call that neither succeeded nor failed because of the dependency."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the Gemini rate limiter shared by every session and request in this process.
+
+    Configured with MEDASSIST_GEMINI_RPM, MEDASSIST_GEMINI_TPM (0 disables a limit)
+    and MEDASSIST_GEMINI_MAX_WAIT.
+
+    Returns:
+        RateLimiter: The shared limiter
+    """
+    return RateLimiter(
+        requests_per_minute=float(os.getenv("MEDASSIST_GEMINI_RPM", DEFAULT_REQUESTS_PER_MINUTE)),
+        tokens_per_minute=float(os.getenv("MEDASSIST_GEMINI_TPM", DEFAULT_TOKENS_PER_MINUTE)),
+        max_wait=float(os.getenv("MEDASSIST_GEMINI_MAX_WAIT", DEFAULT_MAX_WAIT)),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_circuit_breaker() -> CircuitBreaker:
+    """
+    Get the Gemini circuit breaker shared by every session and request in this process.
+
+    Configured with MEDASSIST_BREAKER_THRESHOLD and MEDASSIST_BREAKER_RESET.
+
+    Returns:
+        CircuitBreaker: The shared breaker
+    """
+    return CircuitBreaker(
+        failure_threshold=int(os.getenv("MEDASSIST_BREAKER_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+        reset_timeout=float(os.getenv("MEDASSIST_BREAKER_RESET", DEFAULT_RESET_TIMEOUT)),
+    )
+
+
+def get_max_retries() -> int:
+    """Get the number of retries for transient Gemini errors (MEDASSIST_GEMINI_MAX_RETRIES)."""
+    return int(os.getenv("MEDASSIST_GEMINI_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+
+
+def _handle_failure(error: Exception, attempt: int, max_retries: int, limiter: RateLimiter, breaker: CircuitBreaker) -> float:
+    """
+    Record a failed call and decide whether to retry it.
+
+    Returns:
+        Seconds to wait before the retry
+
+    Raises:
+        The original error if it should not be retried
+    """
+    if not is_retryable_error(error):
+        # The request itself was rejected (bad input, blocked content); the service is fine
+        breaker.record_ignored()
+        raise error
+    breaker.record_failure()
+    if attempt > max_retries:
+        raise error
+    backoff = get_backoff(attempt)
+    if is_rate_limit_error(error):
+        # Hold back every caller, not just this one
+        limiter.pause(backoff)
+    limiter.stats["retries"] += 1
+    return backoff
+
+
+def call_with_retry(func: Callable[[], Any], tokens: int = 0, max_retries: Optional[int] = None) -> Any:
+    """
+    Call Gemini through the shared rate limiter and circuit breaker, retrying transient errors.
+
+    Args:
+        func: Function making the API call
+        tokens: Estimated input tokens of the request
+        max_retries: Retries for transient errors (defaults to get_max_retries())
+
+    Returns:
+        Result of func
+
+    Raises:
+        ServiceBusyError: If the circuit is open or the quota queue is too long
+        Exception: The last error from func if it could not be retried
+    """
+    limiter, breaker = get_rate_limiter(), get_circuit_breaker()
+    if max_retries is None:
+        max_retries = get_max_retries()
+
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            limiter.acquire(tokens)
+        except ServiceBusyError:
+            breaker.record_ignored()
+            raise
+        try:
+            result = func()
+        except Exception as e:
+            time.sleep(_handle_failure(e, attempt, max_retries, limiter, breaker))
+            continue
+        breaker.record_success()
+        return result
+
+
+async def call_with_retry_async(func: Callable[[], Awaitable[Any]], tokens: int = 0, max_retries: Optional[int] = None) -> Any:
+    """
+    Async version of call_with_retry.
+
+    Args:
+        func: Function returning a new awaitable API call on each invocation
+        tokens: Estimated input tokens of the request
+        max_retries: Retries for transient errors (defaults to get_max_retries())
+
+    Returns:
+        Result of the awaited call
+    """
+    limiter, breaker = get_rate_limiter(), get_circuit_breaker()
+    if max_retries is None:
+        max_retries = get_max_retries()
+
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            await limiter.acquire_async(tokens)
+        except (ServiceBusyError, asyncio.CancelledError):
+            # A caller's timeout may cancel the call while it queues for quota
+            breaker.record_ignored()
+            raise
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            breaker.record_ignored()
+            raise
+        except Exception as e:
+            await asyncio.sleep(_handle_failure(e, attempt, max_retries, limiter, breaker))
+            continue
+        breaker.record_success()
+        return result
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """
+    Get counters of the shared limiter and the state of the circuit breaker.
+
+    Returns:
+        Dictionary of limiter counters plus "circuit" state
+    """
+    return dict(get_rate_limiter().stats, circuit=get_circuit_breaker().state)
@@ -0,0 +1,161 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+
+def get_trigrams(text: str) -> Set[str]:
+    """
+    Get the set of character trigrams of a string.
+
+    Args:
+        text: String to split into trigrams
+
+    Returns:
+        Set of all three-character substrings of text
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    Substring index over a fixed list of strings.
+
+    Answers both directions of substring matching without scanning every string:
+    which indexed strings contain a given text, and which indexed strings occur
+    inside a given text. Candidates are narrowed down with trigram postings and
+    then verified with a plain substring check, so results are always exact.
+    """
+
+    def __init__(self, strings: Iterable[str]):
+        self.strings = list(strings)
+
+        # Every trigram of every string, used for "which strings contain this text"
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        # Strings too short to have a trigram always need a direct check
+        self._short: List[int] = []
+        for i, string in enumerate(self.strings):
+            trigrams = get_trigrams(string)
+            if not trigrams:
+                self._short.append(i)
+            for trigram in trigrams:
+                self._postings[trigram].add(i)
+
+        # Each string is also filed under its rarest trigram, used for
+        # "which strings occur in this text": a string can only occur in the
+        # text if its anchor trigram does, so one posting per string suffices
+        self._anchors: Dict[str, List[int]] = defaultdict(list)
+        for i, string in enumerate(self.strings):
+            trigrams = get_trigrams(string)
+            if trigrams:
+                anchor = min(trigrams, key=lambda t: (len(self._postings[t]), t))
+                self._anchors[anchor].append(i)
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def containing(self, text: str) -> Set[int]:
+        """
+        Find the indexed strings that contain text as a substring.
+
+        Args:
+            text: Substring to look for
+
+        Returns:
+            Set of positions of the matching strings
+        """
+        trigrams = get_trigrams(text)
+        if not trigrams:
+            return {i for i, string in enumerate(self.strings) if text in string}
+
+        # Intersect the smallest postings first so the candidate set shrinks fast
+        ordered = sorted(trigrams, key=lambda t: len(self._postings.get(t, ())))
+        candidates = set(self._postings.get(ordered[0], ()))
+        for trigram in ordered[1:]:
+            if not candidates:
+                break
+            candidates &= self._postings.get(trigram, set())
+
+        return {i for i in candidates if text in self.strings[i]}
+
+    def contained_in(self, text: str) -> Set[int]:
+        """
+        Find the indexed strings that occur as substrings of text.
+
+        Args:
+            text: Text to search in
+
+        Returns:
+            Set of positions of the matching strings
+        """
+        candidates = set(self._short)
+        for trigram in get_trigrams(text):
+            candidates.update(self._anchors.get(trigram, ()))
+
+        return {i for i in candidates if self.strings[i] in text}
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton for finding many patterns in a text in a single pass.
+
+    Matching time depends on the length of the text and the number of matches,
+    not on how many patterns there are.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+
+        # Trie of all patterns: transitions, failure links and matched pattern ids per state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # Breadth-first pass to set failure links and inherit their outputs
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail_target if fail_target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> Set[int]:
+        """
+        Find all patterns occurring in text.
+
+        Args:
+            text: Text to search in
+
+        Returns:
+            Set of ids (positions) of the patterns found
+        """
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found.update(self._output[state])
+
+        # The empty pattern matches any text
+        found.update(self._output[0])
+        return found